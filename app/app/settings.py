@@ -38,6 +38,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'rest_framework',
+    # Unused since core.ExpiringToken, kept for the migration copying it
     'rest_framework.authtoken',
     'core',
     'user',
@@ -45,6 +46,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -52,6 +54,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'app.urls'
@@ -88,6 +91,23 @@ DATABASES = {
     }
 }
 
+# User owned rows are spread over shards, extra ones listed in DB_SHARDS
+# are databases of that name on DB_HOST. New users are placed on one of
+# SHARD_DATABASES by a stable hash and stay there until rebalanced.
+
+for name in filter(None, os.environ.get('DB_SHARDS', '').split(',')):
+    DATABASES[name] = dict(DATABASES['default'], NAME=name)
+
+SHARD_DATABASES = list(DATABASES)
+SHARD_LOOKUP_TIMEOUT = 60
+# Shards hand out interleaved ids, this bounds how many there can be.
+# Run configure_shards after migrating or adding a shard.
+SHARD_ID_STRIDE = 16
+
+DATABASE_ROUTERS = ['core.sharding.ShardRouter']
+
+TEST_RUNNER = 'core.test_runner.ShardedTestRunner'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
@@ -132,3 +152,149 @@ MEDIA_ROOT = '/vol/web/media'
 STATIC_ROOT = 'vol/web/static'
 
 AUTH_USER_MODEL = 'core.User'
+
+# Prefix autocomplete for tags and ingredients
+
+AUTOCOMPLETE_INDEX_MAX_SIZE = 5000
+AUTOCOMPLETE_INDEX_MAX_USERS = 1000
+AUTOCOMPLETE_MAX_RESULTS = 50
+
+# Per user recipe feature matrices used for similar recipes
+
+RECIPE_INDEX_MAX_USERS = 200
+
+# Row count above which list counts are estimated instead of exact
+
+EXACT_COUNT_THRESHOLD = 10000
+
+# Seconds cached recipe representations are kept
+
+RECIPE_FRAGMENT_TIMEOUT = 3600
+
+# Most change log entries returned by one change feed request
+
+CHANGE_FEED_PAGE_SIZE = 500
+
+# Seconds changes stay in the feed, clients further behind must resync
+
+CHANGE_FEED_RETENTION = 30 * 24 * 3600
+CHANGE_FEED_PRUNE_BATCH_SIZE = 1000
+
+# Most recipes returned by one batch detail request
+
+RECIPE_BATCH_MAX_IDS = 100
+
+# Rows deleted per transaction by the background deletion worker
+
+DELETION_BATCH_SIZE = 500
+
+# Background jobs, seconds
+
+JOB_RETRY_BACKOFF = 10
+JOB_RETRY_BACKOFF_MAX = 3600
+JOB_STALE_TIMEOUT = 600
+JOB_HEARTBEAT_INTERVAL = 60
+
+# Throttle buckets, shard lookups and data versions must live in a cache
+# shared by all worker processes, such as memcached, in production
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'throttle': {
+        'BACKEND': os.environ.get(
+            'THROTTLE_CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.environ.get('THROTTLE_CACHE_LOCATION', 'throttle'),
+    },
+    # Versions never expire, an evicted one only costs a rebuild
+    'versions': {
+        'BACKEND': os.environ.get(
+            'VERSIONS_CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.environ.get('VERSIONS_CACHE_LOCATION', 'versions'),
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+    # Serialized recipes, sized to hold the recipes in active use
+    'fragments': {
+        'BACKEND': os.environ.get(
+            'FRAGMENTS_CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.environ.get('FRAGMENTS_CACHE_LOCATION', 'fragments'),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(
+                os.environ.get('FRAGMENTS_CACHE_MAX_ENTRIES', 50000)
+            ),
+        },
+    },
+}
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': (
+        'core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'core.renderers.MessagePackRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+        'core.parsers.MessagePackParser',
+    ),
+    'TEST_REQUEST_RENDERER_CLASSES': (
+        'rest_framework.renderers.MultiPartRenderer',
+        'rest_framework.renderers.JSONRenderer',
+        'core.renderers.MessagePackRenderer',
+    ),
+    'DEFAULT_THROTTLE_RATES': {
+        'login': '20/min',
+        'upload': '30/min',
+        'list': '600/min',
+        'write': '120/min',
+    },
+    # Proxies in front of the app, clients are told apart by the address
+    # the last of them saw in X-Forwarded-For. With none the header is
+    # client controlled, so the socket address is used.
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
+}
+
+# Response compression, benchmark levels with benchmark_compression
+
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_LEVELS = {'br': 4, 'zstd': 3, 'gzip': 6}
+COMPRESSION_SKIP_TYPES = (
+    'image/', 'video/', 'audio/', 'application/zip', 'application/gzip',
+)
+
+# Request profiling, always on for staff sending X-Profile
+
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_EXPLAIN_LIMIT = 50
+PROFILE_EXPLAIN_BATCH = 10
+PROFILE_SUMMARY_LINES = 40
+PROFILE_RETENTION = 7 * 24 * 3600
+PROFILE_PURGE_BATCH_SIZE = 1000
+# Statement parameters on these tables are never stored, prefixes match
+PROFILE_REDACTED_TABLES = (
+    'core_user', 'core_expiringtoken', 'core_provisiontask', 'authtoken_',
+    'auth_', 'django_session',
+)
+
+# Bulk user provisioning: rows per INSERT, fewest passwords worth hashing
+# in a process pool, and most users accepted by one API request
+
+USER_PROVISION_BATCH_SIZE = 500
+USER_PROVISION_POOL_MIN = 64
+USER_PROVISION_MAX = 5000
+
+# API tokens expire TOKEN_TTL seconds after their last renewal, which
+# happens at most every TOKEN_RENEW_INTERVAL seconds of use
+
+TOKEN_TTL = int(os.environ.get('TOKEN_TTL', 7 * 24 * 3600))
+TOKEN_RENEW_INTERVAL = 3600
+TOKEN_PURGE_BATCH_SIZE = 1000
@@ -1,13 +1,26 @@
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.utils import unquote
+from django.contrib.admin.widgets import AutocompleteSelectMultiple
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.http import Http404, HttpResponse
+from django.urls import path, reverse
+from django.utils.html import format_html
 from django.utils.translation import gettext as _
 
 from core import models
+from core.deletion import request_user_deletion
+from core.middleware import explain_profile
+from core.paginator import EstimatedCountPaginator
+from core.sharding import active, db_for_user, get_active
 
 
 class UserAdmin(BaseUserAdmin):
     ordering = ['id']
     list_display = ['email', 'name']
+    search_fields = ['^email']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     fieldsets = (
         (None, {'fields': ('email', 'password')}),
         (_('Personal Info'), {'fields': ('name',)}),
@@ -24,8 +37,244 @@ class UserAdmin(BaseUserAdmin):
         }),
     )
 
+    def get_deleted_objects(self, objs, request):
+        """List the users only, instead of collecting their whole data"""
+        objs = list(objs)
+        perms_needed = set()
+        if not self.has_delete_permission(request):
+            perms_needed.add(self.opts.verbose_name)
+        return (
+            [str(obj) for obj in objs],
+            {self.opts.verbose_name_plural: len(objs)},
+            perms_needed,
+            []
+        )
+
+    def delete_model(self, request, obj):
+        """Deactivate user and delete their data in the background"""
+        request_user_deletion(obj)
+
+    def delete_queryset(self, request, queryset):
+        for user in queryset:
+            request_user_deletion(user)
+
+
+class ShardListFilter(admin.SimpleListFilter):
+    """Pick the shard a changelist shows, there is no list of all shards"""
+    title = _('shard')
+    parameter_name = 'shard'
+
+    def lookups(self, request, model_admin):
+        return [(alias, alias) for alias in settings.SHARD_DATABASES]
+
+    def queryset(self, request, queryset):
+        # Applied by ShardedAdmin.get_queryset, before any other filter
+        return queryset
+
+    def choices(self, changelist):
+        selected = self.value() or settings.SHARD_DATABASES[0]
+        for alias, title in self.lookup_choices:
+            yield {
+                'selected': alias == selected,
+                'query_string': changelist.get_query_string(
+                    {self.parameter_name: alias}, []
+                ),
+                'display': title,
+            }
+
+
+class ShardAutocompleteSelectMultiple(AutocompleteSelectMultiple):
+    """Autocomplete searching the shard the form is rendered in"""
+
+    def get_url(self):
+        url = super().get_url()
+        alias = get_active()
+        return f'{url}?shard={alias}' if alias else url
+
+
+class ShardedAdmin(admin.ModelAdmin):
+    """Admin of user owned rows, browsing one shard at a time
+
+    Pages of a single object run with its shard activated, so forms
+    and widgets querying related rows find them.
+    """
+    # Users live on the default database, they cannot be joined in
+    list_select_related = ()
+
+    def get_list_filter(self, request):
+        return [ShardListFilter, *super().get_list_filter(request)]
+
+    def get_shard(self, request):
+        alias = get_active() or request.GET.get('shard')
+        if alias in settings.SHARD_DATABASES:
+            return alias
+        return settings.SHARD_DATABASES[0]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).using(
+            self.get_shard(request)
+        ).prefetch_related('user')
+
+    def shard_of(self, request, object_id):
+        """Return the shard holding object_id, or the request's one"""
+        if object_id is None:
+            user_id = request.POST.get('user')
+            if user_id and user_id.isdigit():
+                return db_for_user(int(user_id))
+            return self.get_shard(request)
+        for alias in settings.SHARD_DATABASES:
+            if self.model._base_manager.using(alias).filter(
+                pk=unquote(object_id)
+            ).exists():
+                return alias
+        return self.get_shard(request)
+
+    def render_in_shard(self, alias, view, *args, **kwargs):
+        with active(alias):
+            response = view(*args, **kwargs)
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+        return response
+
+    def changelist_view(self, request, extra_context=None):
+        return self.render_in_shard(
+            self.get_shard(request), super().changelist_view,
+            request, extra_context
+        )
+
+    def changeform_view(self, request, object_id=None, form_url='',
+                        extra_context=None):
+        return self.render_in_shard(
+            self.shard_of(request, object_id), super().changeform_view,
+            request, object_id, form_url, extra_context
+        )
+
+    def delete_view(self, request, object_id, extra_context=None):
+        return self.render_in_shard(
+            self.shard_of(request, object_id), super().delete_view,
+            request, object_id, extra_context
+        )
+
+    def history_view(self, request, object_id, extra_context=None):
+        return self.render_in_shard(
+            self.shard_of(request, object_id), super().history_view,
+            request, object_id, extra_context
+        )
+
+    def autocomplete_view(self, request):
+        return self.render_in_shard(
+            self.get_shard(request), super().autocomplete_view, request
+        )
+
+    def formfield_for_manytomany(self, db_field, request, **kwargs):
+        field = super().formfield_for_manytomany(db_field, request, **kwargs)
+        if db_field.name in self.get_autocomplete_fields(request):
+            widget = ShardAutocompleteSelectMultiple(
+                db_field.remote_field, self.admin_site,
+                using=kwargs.get('using')
+            )
+            widget.is_required = field.required
+            widget.choices = field.choices
+            field.widget = widget
+        return field
+
+
+class RecipeAttrAdmin(ShardedAdmin):
+    ordering = ['-id']
+    list_display = ['name', 'user', 'recipe_count']
+    raw_id_fields = ['user']
+    readonly_fields = ['recipe_count']
+    search_fields = ['^name']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class RecipeAdmin(ShardedAdmin):
+    ordering = ['-id']
+    list_display = ['title', 'user', 'price', 'time_miniutes']
+    raw_id_fields = ['user']
+    autocomplete_fields = ['tags', 'ingredients']
+    search_fields = ['^title']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class DeletionTaskAdmin(admin.ModelAdmin):
+    ordering = ['-id']
+    list_display = [
+        'id', 'user_id', 'target', 'status', 'deleted', 'total',
+        'created_at', 'finished_at'
+    ]
+    list_filter = ['status', 'target']
+    readonly_fields = [
+        'user', 'target', 'object_ids', 'status', 'deleted', 'total',
+        'created_at', 'finished_at'
+    ]
+
+
+class RequestProfileAdmin(admin.ModelAdmin):
+    ordering = ['-id']
+    list_display = [
+        'id', 'method', 'path', 'status_code', 'duration_ms', 'sql_count',
+        'sql_ms', 'user', 'created_at', 'download'
+    ]
+    list_filter = ['method', 'status_code']
+    list_select_related = ['user']
+    search_fields = ['path']
+    actions = ['explain_queries']
+    exclude = ['stats']
+    readonly_fields = [
+        'user', 'method', 'path', 'status_code', 'duration_ms',
+        'sql_count', 'sql_ms', 'summary', 'queries', 'created_at',
+        'download'
+    ]
+
+    def has_add_permission(self, request):
+        return False
+
+    def get_queryset(self, request):
+        # The stats blob is only loaded for downloads
+        return super().get_queryset(request).defer('stats')
+
+    def get_urls(self):
+        return [
+            path(
+                '<path:object_id>/download/',
+                self.admin_site.admin_view(self.download_view),
+                name='core_requestprofile_download'
+            ),
+        ] + super().get_urls()
+
+    def explain_queries(self, request, queryset):
+        """Add query plans to the selected profiles"""
+        profiles = queryset[:settings.PROFILE_EXPLAIN_BATCH]
+        for profile in profiles:
+            explain_profile(profile)
+        self.message_user(
+            request, _('Explained queries of %d profiles') % len(profiles)
+        )
+    explain_queries.short_description = _('Explain queries')
+
+    def download(self, obj):
+        url = reverse('admin:core_requestprofile_download', args=[obj.pk])
+        return format_html('<a href="{}">{}</a>', url, _('Download'))
+
+    def download_view(self, request, object_id):
+        """Serve the pstats file, for snakeviz or pstats.Stats"""
+        obj = self.get_object(request, object_id)
+        if obj is None or not self.has_view_permission(request, obj):
+            raise Http404
+        response = HttpResponse(
+            bytes(obj.stats), content_type='application/octet-stream'
+        )
+        response['Content-Disposition'] = \
+            f'attachment; filename="request-{obj.pk}.prof"'
+        return response
+
 
 admin.site.register(models.User, UserAdmin)
-admin.site.register(models.Tag)
-admin.site.register(models.Ingredient)
-admin.site.register(models.Recipe)
+admin.site.register(models.Tag, RecipeAttrAdmin)
+admin.site.register(models.Ingredient, RecipeAttrAdmin)
+admin.site.register(models.Recipe, RecipeAdmin)
+admin.site.register(models.DeletionTask, DeletionTaskAdmin)
+admin.site.register(models.RequestProfile, RequestProfileAdmin)
@@ -0,0 +1,29 @@
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from core import tokens
+from core.models import ExpiringToken
+
+
+class ExpiringTokenAuthentication(TokenAuthentication):
+    """Token authentication refusing expired tokens, renewing used ones"""
+    model = ExpiringToken
+
+    def authenticate_credentials(self, key):
+        try:
+            token = ExpiringToken.objects.select_related('user').get(key=key)
+        except ExpiringToken.DoesNotExist:
+            raise AuthenticationFailed(_('Invalid token.'))
+
+        if not token.user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+
+        now = timezone.now()
+        if token.expires_at <= now:
+            tokens.record_rejected()
+            raise AuthenticationFailed(_('Token has expired.'))
+        tokens.renew(token, now)
+        return (token.user, token)
@@ -0,0 +1,33 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import CommandError
+
+from core.models import Recipe
+
+
+def sample_recipes(count):
+    """Return a recipe list shaped like the API output"""
+    return [
+        {
+            'id': pk,
+            'title': f'Recipe number {pk}',
+            'ingredients': list(range(pk % 7, pk % 7 + 6)),
+            'tags': list(range(pk % 3, pk % 3 + 2)),
+            'time_miniutes': 5 + pk % 90,
+            'price': f'{pk % 40}.{pk % 100:02d}',
+            'link': f'https://example.com/recipes/{pk}',
+        }
+        for pk in range(1, count + 1)
+    ]
+
+
+def user_recipes(email):
+    """Return the serialized recipe list of user with email"""
+    from recipe.serializers import RecipeDetailSerializer
+    try:
+        user = get_user_model().objects.get(email=email)
+    except get_user_model().DoesNotExist:
+        raise CommandError(f'No user {email}')
+    recipes = Recipe.objects.filter(user=user).prefetch_related(
+        'tags', 'ingredients'
+    )
+    return RecipeDetailSerializer(recipes, many=True).data
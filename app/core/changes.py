@@ -0,0 +1,45 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from core.models import ChangeLog, ChangeSequence
+
+
+class ResyncRequired(APIException):
+    status_code = status.HTTP_410_GONE
+    default_detail = ('Changes since this cursor are no longer kept, '
+                      'download everything again and follow the feed from '
+                      'the current cursor.')
+    default_code = 'resync'
+
+
+def prune_changes(using, batch_size=None, now=None):
+    """Delete one batch of old changes on a shard, return the number deleted
+
+    The highest pruned number of each user is kept, cursors below it
+    get a resync response instead of a feed with holes.
+    """
+    batch_size = batch_size or settings.CHANGE_FEED_PRUNE_BATCH_SIZE
+    now = now or timezone.now()
+    cutoff = now - timedelta(seconds=settings.CHANGE_FEED_RETENTION)
+    with transaction.atomic(using=using):
+        rows = list(ChangeLog.objects.using(using).filter(
+            created_at__lt=cutoff
+        ).order_by('created_at').values_list(
+            'pk', 'user_id', 'seq'
+        )[:batch_size])
+        pruned = {}
+        for pk, user_id, seq in rows:
+            pruned[user_id] = max(pruned.get(user_id, 0), seq)
+        for user_id, seq in pruned.items():
+            ChangeSequence.objects.using(using).filter(
+                user_id=user_id, pruned_seq__lt=seq
+            ).update(pruned_seq=seq)
+        return ChangeLog.objects.using(using).filter(
+            pk__in=[pk for pk, user_id, seq in rows]
+        ).delete()[0]
@@ -0,0 +1,126 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+
+from core.jobs import enqueue
+from core.sharding import db_for_user
+from core.models import (
+    ChangeLog,
+    ChangeSequence,
+    DeletionTask,
+    Ingredient,
+    Recipe,
+    RecipeSummary,
+    Tag
+)
+
+
+CHANGE_MODELS = (ChangeLog, ChangeSequence)
+
+
+def _steps(task, using):
+    """Return querysets deleted in order to carry out task"""
+    if task.target == DeletionTask.RECIPES:
+        ids = [int(pk) for pk in task.object_ids.split(',') if pk]
+        return [Recipe.objects.using(using).filter(
+            user_id=task.user_id, pk__in=ids
+        )]
+
+    # Through rows first, so recipes go without collecting relations
+    return [
+        Recipe.tags.through.objects.using(using).filter(
+            recipe__user_id=task.user_id
+        ),
+        Recipe.ingredients.through.objects.using(using).filter(
+            recipe__user_id=task.user_id
+        ),
+        Recipe.objects.using(using).filter(user_id=task.user_id),
+        Tag.objects.using(using).filter(user_id=task.user_id),
+        Ingredient.objects.using(using).filter(user_id=task.user_id),
+        RecipeSummary.objects.using(using).filter(user_id=task.user_id),
+        # Deletions above add to the change log, it goes last uncounted
+        ChangeLog.objects.using(using).filter(user_id=task.user_id),
+        ChangeSequence.objects.using(using).filter(user_id=task.user_id),
+    ]
+
+
+def _create_task(user, target, object_ids=''):
+    task = DeletionTask(user=user, target=target, object_ids=object_ids)
+    task.total = sum(
+        queryset.count()
+        for queryset in _steps(task, db_for_user(task.user_id))
+        if queryset.model not in CHANGE_MODELS
+    )
+    task.save()
+    enqueue('core.run_deletion', {'task_id': task.pk})
+    return task
+
+
+def request_user_deletion(user):
+    """Deactivate user now and leave deleting their data to the worker"""
+    with transaction.atomic():
+        user.is_active = False
+        user.save(update_fields=['is_active'])
+        return _create_task(user, DeletionTask.USER)
+
+
+def request_recipe_deletion(user, recipe_ids):
+    """Schedule deletion of user's recipes by the worker"""
+    return _create_task(
+        user,
+        DeletionTask.RECIPES,
+        ','.join(str(pk) for pk in recipe_ids)
+    )
+
+
+def _delete_batch(queryset, using, batch_size):
+    """Delete up to batch_size rows of queryset, return how many"""
+    pks = list(queryset.values_list('pk', flat=True)[:batch_size])
+    if pks:
+        queryset.model.objects.using(using).filter(pk__in=pks).delete()
+    return len(pks)
+
+
+def delete_user_rows(user_id, using, batch_size=None):
+    """Delete all of user's rows on the shard using, batch by batch
+
+    For users deleted directly, whose cascade only reaches rows on the
+    database the user row is deleted from.
+    """
+    batch_size = batch_size or settings.DELETION_BATCH_SIZE
+    task = DeletionTask(user_id=user_id, target=DeletionTask.USER)
+    for queryset in _steps(task, using):
+        while True:
+            with transaction.atomic(using=using):
+                if _delete_batch(queryset, using, batch_size) < batch_size:
+                    break
+
+
+def run_batch(task, batch_size=None):
+    """Delete the next batch of task's rows, return True once finished
+
+    Every batch is its own short transaction, so a large account never
+    holds locks or loads its whole object graph at once.
+    """
+    batch_size = batch_size or settings.DELETION_BATCH_SIZE
+    using = db_for_user(task.user_id)
+
+    for queryset in _steps(task, using):
+        with transaction.atomic(using=using):
+            deleted = _delete_batch(queryset, using, batch_size)
+            if not deleted:
+                continue
+            if queryset.model not in CHANGE_MODELS:
+                task.deleted += deleted
+            task.status = DeletionTask.RUNNING
+            task.save(update_fields=['deleted', 'status'])
+        return False
+
+    with transaction.atomic():
+        if task.target == DeletionTask.USER:
+            get_user_model().objects.filter(pk=task.user_id).delete()
+        task.status = DeletionTask.DONE
+        task.finished_at = timezone.now()
+        task.save(update_fields=['status', 'finished_at'])
+    return True
@@ -0,0 +1,140 @@
+import json
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from core.models import Job
+
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+
+
+def job(name):
+    """Register decorated function as handler of jobs called name"""
+    def register(func):
+        _handlers[name] = func
+        return func
+    return register
+
+
+def autodiscover():
+    """Import tasks modules of installed apps to register handlers"""
+    autodiscover_modules('tasks')
+
+
+def enqueue(name, payload=None, priority=0, delay=None, max_attempts=5):
+    """Add a job to the queue, as part of the current transaction"""
+    run_at = timezone.now()
+    if delay:
+        run_at += timedelta(seconds=delay)
+    return Job.objects.create(
+        name=name,
+        payload=json.dumps(payload or {}),
+        priority=priority,
+        run_at=run_at,
+        max_attempts=max_attempts
+    )
+
+
+def claim(limit):
+    """Lock and return up to limit due jobs, highest priority first
+
+    Rows locked by other workers are skipped, so any number of workers
+    can poll the same table without blocking each other.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(
+            Job.objects.select_for_update(skip_locked=True).filter(
+                status=Job.PENDING, run_at__lte=now
+            ).order_by('-priority', 'run_at', 'id')[:limit]
+        )
+        Job.objects.filter(pk__in=[job.pk for job in jobs]).update(
+            status=Job.RUNNING, locked_at=now, attempts=F('attempts') + 1
+        )
+    return jobs
+
+
+def backoff(attempts):
+    """Seconds to wait before retrying a job that failed attempts times"""
+    return min(
+        settings.JOB_RETRY_BACKOFF * 2 ** (attempts - 1),
+        settings.JOB_RETRY_BACKOFF_MAX
+    )
+
+
+def execute(job_id):
+    """Run a claimed job and record its outcome, return its status"""
+    job = Job.objects.get(pk=job_id)
+    try:
+        handler = _handlers[job.name]
+        handler(**json.loads(job.payload))
+    except Exception:
+        logger.exception('Job %s failed', job)
+        job.last_error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            job.status = Job.FAILED
+            job.finished_at = timezone.now()
+        else:
+            job.status = Job.PENDING
+            job.run_at = timezone.now() + timedelta(
+                seconds=backoff(job.attempts)
+            )
+    else:
+        job.status = Job.DONE
+        job.finished_at = timezone.now()
+
+    job.locked_at = None
+    job.save(update_fields=[
+        'status', 'run_at', 'locked_at', 'last_error', 'finished_at'
+    ])
+    return job.status
+
+
+def heartbeat(job_ids):
+    """Mark running jobs as alive, so requeue_stale leaves them be"""
+    if not job_ids:
+        return 0
+    return Job.objects.filter(pk__in=job_ids, status=Job.RUNNING).update(
+        locked_at=timezone.now()
+    )
+
+
+def requeue_stale(timeout):
+    """Put back jobs whose worker stopped heartbeating, return how many
+
+    Jobs out of attempts fail instead, so a job that kills its worker
+    is not picked up forever.
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(
+        status=Job.RUNNING,
+        locked_at__lt=now - timedelta(seconds=timeout)
+    )
+    stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED,
+        locked_at=None,
+        finished_at=now,
+        last_error='Worker lost while running the job'
+    )
+    return stale.update(status=Job.PENDING, locked_at=None)
+
+
+def queue_stats():
+    """Return number of jobs per status and of jobs due now"""
+    stats = {status: 0 for status, label in Job.STATUS_CHOICES}
+    stats.update(
+        Job.objects.order_by().values_list('status').annotate(Count('pk'))
+    )
+    stats['due'] = Job.objects.filter(
+        status=Job.PENDING, run_at__lte=timezone.now()
+    ).count()
+    return stats
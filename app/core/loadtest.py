@@ -0,0 +1,289 @@
+import io
+import itertools
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+from django.core.servers.basehttp import (
+    ThreadedWSGIServer,
+    WSGIRequestHandler,
+    get_internal_wsgi_application
+)
+
+from core.deletion import run_batch
+from core.models import DeletionTask
+
+
+DEFAULT_MIX = {'token': 1, 'list': 4, 'filter': 4, 'upload': 1}
+PASSWORD = 'loadtest-password'
+
+
+def parse_mix(value):
+    """Return {operation: weight} of a spec such as 'list=3,upload=1'"""
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        if name.strip() not in DEFAULT_MIX:
+            raise ValueError(f'Unknown operation {name.strip()}')
+        mix[name.strip()] = int(weight or 1)
+    return mix
+
+
+def percentile(values, pct):
+    """Return the nearest rank percentile of sorted values"""
+    if not values:
+        return None
+    rank = math.ceil(pct / 100 * len(values))
+    return values[min(max(rank, 1), len(values)) - 1]
+
+
+def sample_image():
+    """Return the bytes of a small PNG to upload"""
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), (200, 80, 40)).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def multipart(field, filename, content, content_type):
+    """Return (body, content type) of a form holding one file"""
+    boundary = uuid.uuid4().hex
+    body = b''.join([
+        f'--{boundary}\r\n'.encode(),
+        f'Content-Disposition: form-data; name="{field}"; '
+        f'filename="{filename}"\r\n'.encode(),
+        f'Content-Type: {content_type}\r\n\r\n'.encode(),
+        content,
+        f'\r\n--{boundary}--\r\n'.encode(),
+    ])
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+class QuietHandler(WSGIRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(host='127.0.0.1', port=0):
+    """Serve the project in a background thread, return the server"""
+    server = ThreadedWSGIServer((host, port), QuietHandler)
+    server.set_app(get_internal_wsgi_application())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+class Session:
+    """An API user with a token and a recipe to exercise routes on"""
+
+    def __init__(self, base_url, email, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.email = email
+        self.timeout = timeout
+        self.token = None
+
+    def request(self, method, path, data=None, content_type=None):
+        """Return (status, body) of a request, raising on network errors"""
+        headers = {'Accept': 'application/json'}
+        if self.token:
+            headers['Authorization'] = f'Token {self.token}'
+        if data is not None and content_type is None:
+            data, content_type = json.dumps(data).encode(), \
+                'application/json'
+        if content_type:
+            headers['Content-Type'] = content_type
+        request = Request(
+            self.base_url + path, data=data, headers=headers, method=method
+        )
+        try:
+            with urlopen(request, timeout=self.timeout) as response:
+                return response.status, response.read()
+        except HTTPError as exc:
+            return exc.code, exc.read()
+
+    def setup(self):
+        """Sign up through the API and create the rows operations use"""
+        for path, data in [
+            ('/api/user/create/', {
+                'email': self.email,
+                'password': PASSWORD,
+                'name': 'Load test'
+            }),
+            ('/api/user/token/', {'email': self.email, 'password': PASSWORD}),
+        ]:
+            status, body = self.request('POST', path, data)
+            if status >= 400:
+                raise RuntimeError(f'POST {path} returned {status}: {body}')
+        self.token = json.loads(body)['token']
+
+        self.tag = self.create('/api/recipe/tags/', {'name': 'Dinner'})
+        self.ingredient = self.create(
+            '/api/recipe/ingredients/', {'name': 'Salt'}
+        )
+        self.recipe = self.create('/api/recipe/recipes/', {
+            'title': 'Load test soup',
+            'time_miniutes': 20,
+            'price': '7.50',
+            'tags': [self.tag],
+            'ingredients': [self.ingredient],
+        })
+
+    def teardown(self):
+        """Delete the user through the API, return the deletion task id
+
+        The server deactivates the user and leaves their rows and images
+        to its worker. None when the request did not go through.
+        """
+        if self.token is None:
+            return None
+        try:
+            status, body = self.request('DELETE', '/api/user/me/')
+        except (URLError, OSError):
+            return None
+        if status != 202:
+            return None
+        return json.loads(body)['deletion']
+
+    def create(self, path, data):
+        status, body = self.request('POST', path, data)
+        if status >= 400:
+            raise RuntimeError(f'POST {path} returned {status}: {body}')
+        return json.loads(body)['id']
+
+    def token_op(self):
+        return self.request('POST', '/api/user/token/', {
+            'email': self.email, 'password': PASSWORD
+        })
+
+    def list_op(self):
+        return self.request('GET', '/api/recipe/recipes/')
+
+    def filter_op(self):
+        query = urlencode({
+            'tags': self.tag,
+            'ingredients': self.ingredient,
+            'price_max': '100',
+        })
+        return self.request('GET', f'/api/recipe/recipes/?{query}')
+
+    def upload_op(self):
+        body, content_type = multipart(
+            'image', 'load.png', self.image, 'image/png'
+        )
+        return self.request(
+            'POST', f'/api/recipe/recipes/{self.recipe}/upload-image/',
+            body, content_type
+        )
+
+
+def finish_deletions(task_ids):
+    """Carry out deletion tasks in this process, batch by batch"""
+    for task in DeletionTask.objects.filter(pk__in=task_ids):
+        while not run_batch(task):
+            pass
+
+
+def run_workload(base_url, concurrency, mix, duration=None, requests=None,
+                 seed=None, local=False):
+    """Run mix on concurrency sessions, return (samples, elapsed seconds)
+
+    Samples map operations to (latency in ms, status) pairs, status 0
+    meaning the request failed without a response. The run ends after
+    duration seconds or once requests have been sent, whichever is first.
+    Sessions delete their users afterwards, also when the run fails.
+    Servers run by this process have no worker, so with local set the
+    deletions are carried out here.
+    """
+    run = uuid.uuid4().hex[:8]
+    sessions = [
+        Session(base_url, f'loadtest-{run}-{n}@example.com')
+        for n in range(concurrency)
+    ]
+    image = sample_image()
+    try:
+        for session in sessions:
+            session.setup()
+            session.image = image
+        return _run(sessions, mix, duration, requests, seed)
+    finally:
+        deletions = [session.teardown() for session in sessions]
+        if local:
+            finish_deletions([pk for pk in deletions if pk is not None])
+
+
+def _run(sessions, mix, duration, requests, seed):
+    names, weights = zip(*mix.items())
+    counter = itertools.count()
+    deadline = time.perf_counter() + duration if duration else None
+    samples = defaultdict(list)
+    lock = threading.Lock()
+
+    def worker(session, rng):
+        while True:
+            if requests is not None and next(counter) >= requests:
+                return
+            if deadline is not None and time.perf_counter() >= deadline:
+                return
+            name = rng.choices(names, weights)[0]
+            start = time.perf_counter()
+            try:
+                status = getattr(session, f'{name}_op')()[0]
+            except (URLError, OSError):
+                status = 0
+            latency = (time.perf_counter() - start) * 1000
+            with lock:
+                samples[name].append((latency, status))
+
+    threads = [
+        threading.Thread(
+            target=worker,
+            args=(session, random.Random(None if seed is None else seed + n))
+        )
+        for n, session in enumerate(sessions)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - start
+
+
+def summarize(samples, elapsed):
+    """Return the latency, throughput and error report of samples"""
+    def stats(entries):
+        latencies = sorted(latency for latency, status in entries)
+        errors = sum(1 for latency, status in entries
+                     if status == 0 or status >= 400)
+        return {
+            'requests': len(entries),
+            'rps': round(len(entries) / elapsed, 1) if elapsed else None,
+            'errors': errors,
+            'error_rate': round(errors / len(entries), 4) if entries else 0,
+            'throttled': sum(1 for latency, status in entries
+                             if status == 429),
+            'p50_ms': _round(percentile(latencies, 50)),
+            'p95_ms': _round(percentile(latencies, 95)),
+            'p99_ms': _round(percentile(latencies, 99)),
+            'max_ms': _round(latencies[-1] if latencies else None),
+        }
+
+    report = stats([entry for entries in samples.values()
+                    for entry in entries])
+    report['elapsed_s'] = round(elapsed, 3)
+    report['operations'] = {
+        name: stats(entries) for name, entries in sorted(samples.items())
+    }
+    return report
+
+
+def _round(value):
+    return None if value is None else round(value, 2)
@@ -0,0 +1,75 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from rest_framework.renderers import JSONRenderer
+
+from core.benchmarks import sample_recipes, user_recipes
+from core.middleware import COMPRESSORS, compress_sequence
+
+
+LEVELS = {
+    'gzip': (1, 6, 9),
+    'br': (1, 4, 6, 9, 11),
+    'zstd': (1, 3, 9, 19),
+}
+
+
+class Command(BaseCommand):
+    """Django command to compare CPU cost and size of compression levels"""
+
+    def add_arguments(self, parser):
+        source = parser.add_mutually_exclusive_group()
+        source.add_argument(
+            '--file', help='Compress the contents of this file'
+        )
+        source.add_argument(
+            '--user', help='Compress the recipe list of this user'
+        )
+        parser.add_argument(
+            '--recipes', type=int, default=1000,
+            help='Number of recipes in the sample payload'
+        )
+        parser.add_argument(
+            '--encoding', action='append', choices=sorted(COMPRESSORS),
+            help='Encoding to benchmark, all available ones by default'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=0,
+            help='Compress in chunks of this size, like a streaming response'
+        )
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def get_payload(self, options):
+        if options['file']:
+            with open(options['file'], 'rb') as payload:
+                return payload.read()
+        if options['user']:
+            return JSONRenderer().render(user_recipes(options['user']))
+        return JSONRenderer().render(sample_recipes(options['recipes']))
+
+    def handle(self, *args, **options):
+        payload = self.get_payload(options)
+        size = options['chunk_size'] or len(payload)
+        chunks = [payload[i:i + size] for i in range(0, len(payload), size)]
+
+        for encoding in options['encoding'] or COMPRESSORS:
+            for level in LEVELS[encoding]:
+                timings = []
+                for i in range(options['repeat']):
+                    start = time.perf_counter()
+                    compressed = b''.join(compress_sequence(
+                        COMPRESSORS[encoding](level), chunks
+                    ))
+                    timings.append(time.perf_counter() - start)
+                best = min(timings)
+                self.stdout.write(json.dumps({
+                    'encoding': encoding,
+                    'level': level,
+                    'bytes': len(payload),
+                    'compressed': len(compressed),
+                    'ratio': round(len(payload) / len(compressed), 2),
+                    'ms': round(best * 1000, 3),
+                    'mb_per_s': round(len(payload) / best / 1e6, 1),
+                }))
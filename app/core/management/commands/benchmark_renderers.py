@@ -0,0 +1,70 @@
+import json
+import time
+from io import BytesIO
+
+from django.core.management.base import BaseCommand
+
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from core import renderers
+from core.benchmarks import sample_recipes, user_recipes
+from core.parsers import MessagePackParser
+
+
+FORMATS = {
+    'json': (JSONRenderer, JSONParser),
+    'fast-json': (renderers.FastJSONRenderer, JSONParser),
+    'msgpack': (renderers.MessagePackRenderer, MessagePackParser),
+}
+
+
+def best_time(func, repeat):
+    timings = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+class Command(BaseCommand):
+    """Django command to compare API formats on recipe lists"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', help='Use the recipe list of this user'
+        )
+        parser.add_argument(
+            '--recipes', type=int, default=1000,
+            help='Number of recipes in the sample list'
+        )
+        parser.add_argument(
+            '--format', action='append', choices=sorted(FORMATS),
+            help='Format to benchmark, all of them by default'
+        )
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        if options['user']:
+            data = user_recipes(options['user'])
+        else:
+            data = sample_recipes(options['recipes'])
+
+        for name in options['format'] or FORMATS:
+            renderer_class, parser_class = FORMATS[name]
+            renderer, parser = renderer_class(), parser_class()
+            encode, content = best_time(
+                lambda: renderer.render(data), options['repeat']
+            )
+            decode, decoded = best_time(
+                lambda: parser.parse(BytesIO(content)), options['repeat']
+            )
+            self.stdout.write(json.dumps({
+                'format': name,
+                'orjson': name == 'fast-json' and renderers.orjson is not None,
+                'items': len(decoded),
+                'bytes': len(content),
+                'encode_ms': round(encode * 1000, 3),
+                'decode_ms': round(decode * 1000, 3),
+            }))
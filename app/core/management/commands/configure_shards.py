@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.sharding import configure_id_space
+
+
+class Command(BaseCommand):
+    """Django command to give every shard its own id space"""
+
+    def handle(self, *args, **options):
+        shards = settings.SHARD_DATABASES
+        if len(shards) > settings.SHARD_ID_STRIDE:
+            raise CommandError(
+                f'{len(shards)} shards do not fit a SHARD_ID_STRIDE of '
+                f'{settings.SHARD_ID_STRIDE}'
+            )
+        for alias in shards:
+            configure_id_space(alias)
+            self.stdout.write(f'Configured ids of {alias}')
+        self.stdout.write(self.style.SUCCESS('Shards configured !'))
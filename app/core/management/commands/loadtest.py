@@ -0,0 +1,86 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from core.loadtest import (
+    DEFAULT_MIX,
+    parse_mix,
+    run_workload,
+    start_server,
+    summarize
+)
+
+
+class Command(BaseCommand):
+    """Django command to measure end to end latency of the API routes"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            help='Load an already running server instead of a local one'
+        )
+        parser.add_argument('--concurrency', type=int, default=8)
+        limit = parser.add_mutually_exclusive_group()
+        limit.add_argument(
+            '--duration', type=float, default=None,
+            help='Seconds to run for, 10 unless --requests is given'
+        )
+        limit.add_argument(
+            '--requests', type=int, help='Total number of requests to send'
+        )
+        parser.add_argument(
+            '--mix',
+            default=','.join(f'{k}={v}' for k, v in DEFAULT_MIX.items()),
+            help='Weights of the operations, such as list=3,upload=1'
+        )
+        parser.add_argument(
+            '--throttle', action='store_true',
+            help='Keep API throttling enabled on the local server'
+        )
+        parser.add_argument('--seed', type=int)
+
+    def handle(self, *args, **options):
+        try:
+            mix = parse_mix(options['mix'])
+        except ValueError as exc:
+            raise CommandError(exc)
+        duration = options['duration']
+        if duration is None and options['requests'] is None:
+            duration = 10
+
+        server = None
+        url = options['url']
+        if url is None:
+            server = start_server()
+            url = 'http://%s:%s' % server.server_address[:2]
+        # Sessions would otherwise be throttled long before the server is
+        # saturated, which measures the rates rather than the build
+        rates = settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']
+        rest_framework = {
+            **settings.REST_FRAMEWORK,
+            'DEFAULT_THROTTLE_RATES': rates if options['throttle'] else {},
+        }
+        try:
+            with override_settings(REST_FRAMEWORK=rest_framework):
+                samples, elapsed = run_workload(
+                    url,
+                    max(options['concurrency'], 1),
+                    mix,
+                    duration=duration,
+                    requests=options['requests'],
+                    seed=options['seed'],
+                    local=server is not None
+                )
+        except RuntimeError as exc:
+            raise CommandError(exc)
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+
+        report = summarize(samples, elapsed)
+        report['url'] = url
+        report['concurrency'] = options['concurrency']
+        self.stdout.write(json.dumps(report))
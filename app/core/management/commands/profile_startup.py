@@ -0,0 +1,93 @@
+import json
+import statistics
+import subprocess
+import sys
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Run in a fresh interpreter, so nothing is imported yet
+SETUP_SCRIPT = '''
+import json, time
+start = time.perf_counter()
+import django
+from django.conf import settings
+settings.INSTALLED_APPS
+configured = time.perf_counter()
+django.setup()
+ready = time.perf_counter()
+print(json.dumps({
+    'settings_ms': (configured - start) * 1000,
+    'setup_ms': (ready - configured) * 1000,
+}))
+'''
+
+
+def parse_importtime(output):
+    """Return (module, self us, cumulative us) of -X importtime output"""
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        modules.append((name.strip(), int(own), int(cumulative)))
+    return modules
+
+
+class Command(BaseCommand):
+    """Django command to report import and app loading time at startup"""
+    requires_system_checks = False
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top', type=int, default=15,
+            help='Number of slowest modules and packages to report'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=1,
+            help='Start this many interpreters and report median timings'
+        )
+
+    def run_setup(self):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', SETUP_SCRIPT],
+            cwd=settings.BASE_DIR,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True
+        )
+        if result.returncode:
+            raise CommandError(f'Startup failed:\n{result.stderr}')
+        return json.loads(result.stdout), parse_importtime(result.stderr)
+
+    def handle(self, *args, **options):
+        runs = [self.run_setup() for i in range(max(options['repeat'], 1))]
+        timings, modules = runs[-1]
+
+        packages = Counter()
+        for name, own, cumulative in modules:
+            packages[name.split('.')[0]] += own
+        slowest = sorted(modules, key=lambda module: -module[2])
+
+        report = {
+            key: round(statistics.median(run[0][key] for run in runs), 1)
+            for key in timings
+        }
+        report['import_ms'] = round(
+            statistics.median(
+                sum(own for name, own, cumulative in run[1])
+                for run in runs
+            ) / 1000,
+            1
+        )
+        report['packages'] = [
+            [name, round(own / 1000, 1)]
+            for name, own in packages.most_common(options['top'])
+        ]
+        report['modules'] = [
+            [name, round(cumulative / 1000, 1)]
+            for name, own, cumulative in slowest[:options['top']]
+        ]
+        self.stdout.write(json.dumps(report))
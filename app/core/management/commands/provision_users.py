@@ -0,0 +1,60 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.provisioning import provision_users
+
+
+class Command(BaseCommand):
+    """Django command to create users in bulk from a CSV file"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'file',
+            help='CSV file with email, name and password columns, users '
+                 'without a password get an unusable one'
+        )
+        parser.add_argument(
+            '--tokens', metavar='FILE',
+            help='Issue auth tokens and write them to this CSV file'
+        )
+        parser.add_argument(
+            '--workers', type=int,
+            help='Processes hashing passwords, one per core by default'
+        )
+        parser.add_argument('--batch-size', type=int)
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['file'], newline='') as source:
+                rows = [
+                    {**row, 'password': row.get('password') or None}
+                    for row in csv.DictReader(source)
+                ]
+        except OSError as exc:
+            raise CommandError(exc)
+        if rows and 'email' not in rows[0]:
+            raise CommandError('The file has no email column')
+
+        start = time.perf_counter()
+        users, skipped, tokens = provision_users(
+            [row for row in rows if row['email']],
+            issue_tokens=bool(options['tokens']),
+            batch_size=options['batch_size'],
+            workers=options['workers']
+        )
+        elapsed = max(time.perf_counter() - start, 1e-6)
+
+        if options['tokens']:
+            with open(options['tokens'], 'w', newline='') as target:
+                writer = csv.writer(target)
+                writer.writerow(['email', 'token'])
+                for user in users:
+                    writer.writerow([user.email, tokens[user.pk]])
+        for email in skipped:
+            self.stderr.write(f'Skipped {email}, email taken')
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(users)} users created in {elapsed:.1f}s '
+            f'({len(users) / elapsed:.0f}/s), {len(skipped)} skipped !'
+        ))
@@ -0,0 +1,19 @@
+from django.conf import settings
+
+from core.changes import prune_changes
+from core.purging import PurgeCommand
+
+
+class Command(PurgeCommand):
+    """Django command to delete change log rows past their retention"""
+    rows = 'Rows'
+    batch_size_setting = 'CHANGE_FEED_PRUNE_BATCH_SIZE'
+    job_name = 'core.prune_changes'
+    queued_message = 'Change pruning queued !'
+    done_message = '{} expired changes pruned !'
+
+    def get_targets(self):
+        return [{'using': using} for using in settings.SHARD_DATABASES]
+
+    def purge(self, batch_size, using):
+        return prune_changes(using, batch_size)
@@ -0,0 +1,14 @@
+from core.profiles import purge_profiles
+from core.purging import PurgeCommand
+
+
+class Command(PurgeCommand):
+    """Django command to delete old request profiles in batches"""
+    rows = 'Profiles'
+    batch_size_setting = 'PROFILE_PURGE_BATCH_SIZE'
+    job_name = 'core.purge_profiles'
+    queued_message = 'Profile purge queued !'
+    done_message = '{} request profiles purged !'
+
+    def purge(self, batch_size):
+        return purge_profiles(batch_size)
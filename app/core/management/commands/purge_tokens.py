@@ -0,0 +1,14 @@
+from core.purging import PurgeCommand
+from core.tokens import purge_expired
+
+
+class Command(PurgeCommand):
+    """Django command to delete expired auth tokens in batches"""
+    rows = 'Tokens'
+    batch_size_setting = 'TOKEN_PURGE_BATCH_SIZE'
+    job_name = 'core.purge_tokens'
+    queued_message = 'Token purge queued !'
+    done_message = '{} expired tokens purged !'
+
+    def purge(self, batch_size):
+        return purge_expired(batch_size)
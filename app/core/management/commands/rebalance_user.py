@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from core.sharding import db_for_user, move_user
+
+
+class Command(BaseCommand):
+    """Django command to move a user's data to another shard"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('email')
+        parser.add_argument('target', help='Database alias to move to')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--grace', type=float, default=None,
+            help='Seconds to wait for other processes to see each switch, '
+                 'SHARD_LOOKUP_TIMEOUT by default'
+        )
+
+    def handle(self, *args, **options):
+        target = options['target']
+        if target not in settings.DATABASES:
+            raise CommandError(f'Unknown database {target}')
+        try:
+            user = get_user_model().objects.get(email=options['email'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'No user {options["email"]}')
+
+        source = db_for_user(user.pk)
+        try:
+            moved = move_user(
+                user.pk, target, options['batch_size'], options['grace']
+            )
+        except IntegrityError as exc:
+            raise CommandError(
+                f'Rows of {user.email} clash with rows on {target}, '
+                f'run configure_shards first: {exc}'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'{moved} rows of {user.email} moved from {source} to {target} !'
+        ))
@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.models import Tag, Ingredient
+from core.signals import update_recipe_counts
+
+
+class Command(BaseCommand):
+    """Django command to recalculate tag and ingredient recipe counts"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of rows updated per statement'
+        )
+        parser.add_argument(
+            '--database', action='append',
+            help='Shard to rebuild, every shard by default'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        for model in (Tag, Ingredient):
+            total = 0
+            for using in options['database'] or settings.SHARD_DATABASES:
+                pks = model.objects.using(using).order_by('pk').values_list(
+                    'pk', flat=True
+                )
+                last_pk = 0
+                while True:
+                    batch = list(pks.filter(pk__gt=last_pk)[:batch_size])
+                    if not batch:
+                        break
+                    update_recipe_counts(model, batch, using)
+                    total += len(batch)
+                    last_pk = batch[-1]
+
+            self.stdout.write(
+                f'Rebuilt recipe counts for {total} '
+                f'{model._meta.verbose_name_plural}'
+            )
+
+        self.stdout.write(self.style.SUCCESS('Recipe counts rebuilt !'))
@@ -0,0 +1,62 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import Recipe, RecipeSummary
+from core.sharding import db_for_user
+from core.stats import summarize
+
+
+class Command(BaseCommand):
+    """Django command to check and rebuild per user recipe summaries"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Only report users whose summaries drifted'
+        )
+        parser.add_argument(
+            '--database', help='Only check users on this shard'
+        )
+
+    def handle(self, *args, **options):
+        fields = ('time_bucket', 'recipe_count', 'price_total', 'time_total')
+        drifted = 0
+
+        user_ids = get_user_model().objects.order_by(
+            'pk'
+        ).values_list('pk', flat=True)
+        for user_id in user_ids.iterator():
+            using = db_for_user(user_id)
+            if options['database'] and using != options['database']:
+                continue
+            expected = sorted(
+                tuple(row[field] for field in fields)
+                for row in summarize(
+                    Recipe.objects.using(using).filter(user_id=user_id)
+                )
+            )
+            summaries = RecipeSummary.objects.using(using).filter(
+                user_id=user_id
+            )
+            actual = sorted(
+                summaries.exclude(recipe_count=0).values_list(*fields)
+            )
+            if expected == actual:
+                continue
+
+            drifted += 1
+            self.stdout.write(f'Recipe summary of user {user_id} drifted')
+            if options['check']:
+                continue
+            with transaction.atomic(using=using):
+                summaries.delete()
+                RecipeSummary.objects.using(using).bulk_create(
+                    RecipeSummary(user_id=user_id, **dict(zip(fields, row)))
+                    for row in expected
+                )
+
+        action = 'found' if options['check'] else 'rebuilt'
+        self.stdout.write(self.style.SUCCESS(
+            f'{drifted} drifted recipe summaries {action} !'
+        ))
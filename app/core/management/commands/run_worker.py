@@ -0,0 +1,120 @@
+import json
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait
+)
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core import jobs
+from core.models import Job
+
+
+def _execute(job_id):
+    """Run job in a pool worker, which owns its own connections"""
+    try:
+        return jobs.execute(job_id)
+    finally:
+        connections.close_all()
+
+
+class InlineExecutor:
+    """Executor running jobs in the worker process itself"""
+
+    def submit(self, func, *args):
+        # Jobs share the worker's connection, which must stay open
+        future = Future()
+        future.set_result(jobs.execute(*args))
+        return future
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class Command(BaseCommand):
+    """Django command to run background jobs from the jobs table"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument(
+            '--pool', choices=('thread', 'process', 'inline'),
+            default='thread',
+            help='Run jobs in threads, processes or the worker itself'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit once no job is due'
+        )
+        parser.add_argument('--poll-interval', type=float, default=1)
+        parser.add_argument('--stats-interval', type=float, default=60)
+
+    def get_executor(self, pool, concurrency):
+        if pool == 'process':
+            # Children must not inherit the parent's connections
+            connections.close_all()
+            return ProcessPoolExecutor(concurrency)
+        if pool == 'thread':
+            return ThreadPoolExecutor(concurrency)
+        return InlineExecutor()
+
+    def write_stats(self, counts, started):
+        elapsed = max(time.monotonic() - started, 1e-9)
+        stats = dict(counts)
+        stats['jobs_per_second'] = round(
+            sum(counts.values()) / elapsed, 3
+        )
+        stats['queue'] = jobs.queue_stats()
+        self.stdout.write(json.dumps(stats))
+
+    def handle(self, *args, **options):
+        jobs.autodiscover()
+        concurrency = options['concurrency']
+        counts = {Job.DONE: 0, Job.FAILED: 0, 'retried': 0}
+        started = last_stats = last_beat = time.monotonic()
+        running = {}
+
+        with self.get_executor(options['pool'], concurrency) as executor:
+            while True:
+                # Inline jobs block the loop, they cannot be kept alive
+                if time.monotonic() - last_beat >= \
+                        settings.JOB_HEARTBEAT_INTERVAL:
+                    jobs.heartbeat(list(running.values()))
+                    last_beat = time.monotonic()
+                jobs.requeue_stale(settings.JOB_STALE_TIMEOUT)
+                free = concurrency - len(running)
+                for job in jobs.claim(free) if free > 0 else []:
+                    running[executor.submit(_execute, job.pk)] = job.pk
+
+                if not running:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                done = wait(
+                    running,
+                    timeout=options['poll_interval'],
+                    return_when=FIRST_COMPLETED
+                ).done
+                for future in done:
+                    del running[future]
+                    status = future.result()
+                    if status == Job.PENDING:
+                        status = 'retried'
+                    counts[status] += 1
+
+                since_stats = time.monotonic() - last_stats
+                if since_stats >= options['stats_interval']:
+                    self.write_stats(counts, started)
+                    last_stats = time.monotonic()
+
+        self.write_stats(counts, started)
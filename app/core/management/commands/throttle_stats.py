@@ -0,0 +1,12 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from core.throttling import throttle_stats
+
+
+class Command(BaseCommand):
+    """Django command to print throttled requests per scope"""
+
+    def handle(self, *args, **options):
+        self.stdout.write(json.dumps(throttle_stats(), sort_keys=True))
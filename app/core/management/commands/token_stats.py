@@ -0,0 +1,12 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from core.tokens import token_stats
+
+
+class Command(BaseCommand):
+    """Django command to print auth token table size and churn"""
+
+    def handle(self, *args, **options):
+        self.stdout.write(json.dumps(token_stats(), sort_keys=True))
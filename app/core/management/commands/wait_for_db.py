@@ -7,6 +7,7 @@ from django.core.management.base import BaseCommand
 
 class Command(BaseCommand):
     """Django command to pause execution until database is available """
+    requires_system_checks = False
 
     def handle(self, *args, **options):
         self.stdout.write('Waiting for database ...')
@@ -0,0 +1,314 @@
+import cProfile
+import io
+import json
+import marshal
+import pstats
+import random
+import time
+import zlib
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+from rest_framework.exceptions import AuthenticationFailed
+
+from core.authentication import ExpiringTokenAuthentication
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class GzipCompressor:
+    """Incremental gzip compressor"""
+
+    def __init__(self, level):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self.compressor.compress(data) + \
+            self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+class BrotliCompressor:
+    """Incremental brotli compressor"""
+
+    def __init__(self, level):
+        self.compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self.compressor.process(data) + self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+class ZstdCompressor:
+    """Incremental zstandard compressor"""
+
+    def __init__(self, level):
+        self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self.compressor.compress(data) + self.compressor.flush(
+            zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        )
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+# Most effective first, used to break ties between accepted encodings
+COMPRESSORS = {'gzip': GzipCompressor}
+if zstandard is not None:
+    COMPRESSORS = {'zstd': ZstdCompressor, **COMPRESSORS}
+if brotli is not None:
+    COMPRESSORS = {'br': BrotliCompressor, **COMPRESSORS}
+
+
+def parse_accept_encoding(header):
+    """Return {coding: quality} of an Accept-Encoding header"""
+    qualities = {}
+    for item in header.split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.lower()] = quality
+    return qualities
+
+
+def negotiate_encoding(header, available=None):
+    """Return the preferred encoding accepted by header, or None"""
+    qualities = parse_accept_encoding(header)
+    default = qualities.get('*', 0.0)
+    best, best_quality = None, 0.0
+    for encoding in available or COMPRESSORS:
+        quality = qualities.get(encoding, default)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def get_compressor(encoding):
+    """Return a new compressor for encoding at the configured level"""
+    return COMPRESSORS[encoding](settings.COMPRESSION_LEVELS[encoding])
+
+
+def compress_sequence(compressor, sequence):
+    for data in sequence:
+        chunk = compressor.compress(data)
+        if chunk:
+            yield chunk
+    yield compressor.finish()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """Compress responses with the best encoding the client accepts
+
+    Streaming responses are compressed chunk by chunk as they are sent.
+    Responses that are small, already encoded or of a compressed media
+    type, such as recipe images, are passed through untouched.
+    """
+
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding'):
+            return response
+        content_type = response.get('Content-Type', '').lower()
+        if content_type.startswith(settings.COMPRESSION_SKIP_TYPES):
+            return response
+        if not response.streaming and \
+                len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = negotiate_encoding(
+            request.META.get('HTTP_ACCEPT_ENCODING', '')
+        )
+        if encoding is None:
+            return response
+
+        compressor = get_compressor(encoding)
+        if response.streaming:
+            response.streaming_content = compress_sequence(
+                compressor, response.streaming_content
+            )
+            del response['Content-Length']
+        else:
+            content = compressor.compress(response.content) + \
+                compressor.finish()
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response['Content-Length'] = str(len(content))
+
+        # The compressed body no longer matches a strong ETag
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
+
+
+EXPLAIN_PREFIXES = {
+    'postgresql': 'EXPLAIN ',
+    'mysql': 'EXPLAIN ',
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+}
+
+
+def is_redacted(sql):
+    """Return whether sql touches a table whose values are never kept"""
+    return any(
+        f'"{table}' in sql or f'`{table}' in sql
+        for table in settings.PROFILE_REDACTED_TABLES
+    )
+
+
+class QueryRecorder:
+    """Database execute wrapper recording statements and their timing
+
+    Parameters are dropped for executemany and for statements on
+    credential tables, so profiles never hold emails or token keys.
+    """
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            redacted = many or is_redacted(sql)
+            self.queries.append({
+                'database': self.alias,
+                'sql': sql,
+                'params': None if redacted else params,
+                'redacted': redacted,
+                'many': many,
+                'ms': (time.perf_counter() - start) * 1000,
+            })
+
+
+def explain(query):
+    """Return the query plan of a recorded SELECT, or None"""
+    if query.get('redacted', query['many']):
+        return None
+    connection = connections[query['database']]
+    prefix = EXPLAIN_PREFIXES.get(connection.vendor)
+    if prefix is None or \
+            not query['sql'].lstrip().upper().startswith('SELECT'):
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + query['sql'], query['params'])
+            return '\n'.join(
+                ' '.join(str(value) for value in row)
+                for row in cursor.fetchall()
+            )
+    except DatabaseError as exc:
+        return f'EXPLAIN failed: {exc}'
+
+
+def explain_profile(profile):
+    """Add plans to the first SELECTs of a profile, run when asked for"""
+    queries = json.loads(profile.queries)
+    for query in queries[:settings.PROFILE_EXPLAIN_LIMIT]:
+        query['plan'] = explain(query)
+    profile.queries = json.dumps(queries, default=str)
+    profile.save(update_fields=['queries'])
+
+
+class ProfilingMiddleware:
+    """Profile requests asked for by staff, or a sample of all requests
+
+    Staff trigger it with the X-Profile header, signed in or with their
+    API token. The call graph and every SQL statement with its time are
+    stored as a RequestProfile, whose id comes back in the X-Profile-Id
+    header, query plans are added later from the admin. Other requests
+    only pay for a header lookup and a random draw.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def get_staff_user(self, request):
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated:
+            try:
+                user = (ExpiringTokenAuthentication().authenticate(request)
+                        or (None, None))[0]
+            except AuthenticationFailed:
+                return None
+        return user if user is not None and user.is_staff else None
+
+    def __call__(self, request):
+        user = None
+        if 'HTTP_X_PROFILE' in request.META:
+            user = self.get_staff_user(request)
+        sampled = random.random() < settings.PROFILE_SAMPLE_RATE
+        if user is None and not sampled:
+            return self.get_response(request)
+        return self.profile(request, user)
+
+    def profile(self, request, user):
+        from core.models import RequestProfile
+
+        recorders = [QueryRecorder(alias) for alias in connections]
+        profiler = cProfile.Profile()
+        with ExitStack() as stack:
+            for recorder in recorders:
+                stack.enter_context(
+                    connections[recorder.alias].execute_wrapper(recorder)
+                )
+            start = time.perf_counter()
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+            duration = (time.perf_counter() - start) * 1000
+
+        queries = [query for recorder in recorders
+                   for query in recorder.queries]
+
+        summary = io.StringIO()
+        stats = pstats.Stats(profiler, stream=summary)
+        stats.sort_stats('cumulative').print_stats(
+            settings.PROFILE_SUMMARY_LINES
+        )
+        profile = RequestProfile.objects.create(
+            user=user,
+            method=request.method,
+            path=request.get_full_path(),
+            status_code=response.status_code,
+            duration_ms=duration,
+            sql_count=len(queries),
+            sql_ms=sum(query['ms'] for query in queries),
+            stats=marshal.dumps(stats.stats),
+            summary=summary.getvalue(),
+            queries=json.dumps(queries, default=str)
+        )
+        response['X-Profile-Id'] = str(profile.pk)
+        return response
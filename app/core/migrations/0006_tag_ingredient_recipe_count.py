@@ -0,0 +1,52 @@
+# Generated by Django 2.1.15 on 2026-10-19 08:05
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_recipe_count(apps, schema_editor):
+    Recipe = apps.get_model('core', 'Recipe')
+    db = schema_editor.connection.alias
+    for field in ('tag', 'ingredient'):
+        model = apps.get_model('core', field)
+        through = getattr(Recipe, f'{field}s').through
+        usage = through.objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(total=Count('pk')).values('total')
+        model.objects.using(db).update(
+            recipe_count=Coalesce(
+                Subquery(usage, output_field=IntegerField()), 0
+            )
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_recipe_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='recipe_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='recipe_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['user', 'recipe_count'], name='core_ingred_user_id_de1121_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['user', 'recipe_count'], name='core_tag_user_id_699afc_idx'),
+        ),
+        migrations.RunPython(
+            populate_recipe_count, migrations.RunPython.noop
+        ),
+    ]
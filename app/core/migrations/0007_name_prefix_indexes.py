@@ -0,0 +1,29 @@
+from django.db import migrations
+
+
+def create_prefix_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in ('core_tag', 'core_ingredient'):
+        schema_editor.execute(
+            f'CREATE INDEX {table}_name_upper_like ON {table} '
+            f'(UPPER("name"::text) text_pattern_ops)'
+        )
+
+
+def drop_prefix_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in ('core_tag', 'core_ingredient'):
+        schema_editor.execute(f'DROP INDEX {table}_name_upper_like')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_tag_ingredient_recipe_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_prefix_indexes, drop_prefix_indexes),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 2.1.15 on 2026-10-19 08:08
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Case, Count, IntegerField, Sum, Value, When
+
+
+# Frozen copy of core.stats.RECIPE_TIME_BUCKETS as of this migration
+RECIPE_TIME_BUCKETS = (0, 15, 30, 60, 120)
+
+
+def populate_recipe_summaries(apps, schema_editor):
+    """Aggregate existing recipes per user and cooking time bucket"""
+    Recipe = apps.get_model('core', 'Recipe')
+    RecipeSummary = apps.get_model('core', 'RecipeSummary')
+    db = schema_editor.connection.alias
+    whens = [
+        When(time_miniutes__lt=upper, then=Value(lower))
+        for lower, upper in zip(RECIPE_TIME_BUCKETS, RECIPE_TIME_BUCKETS[1:])
+    ]
+    rows = Recipe.objects.using(db).order_by().annotate(
+        time_bucket=Case(
+            *whens,
+            default=Value(RECIPE_TIME_BUCKETS[-1]),
+            output_field=IntegerField()
+        )
+    ).values('user_id', 'time_bucket').annotate(
+        recipe_count=Count('pk'),
+        price_total=Sum('price'),
+        time_total=Sum('time_miniutes')
+    )
+    RecipeSummary.objects.using(db).bulk_create(
+        RecipeSummary(**row) for row in rows
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_name_prefix_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('time_bucket', models.IntegerField()),
+                ('recipe_count', models.IntegerField(default=0)),
+                ('price_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('time_total', models.BigIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='recipesummary',
+            unique_together={('user', 'time_bucket')},
+        ),
+        migrations.RunPython(
+            populate_recipe_summaries, migrations.RunPython.noop
+        ),
+    ]
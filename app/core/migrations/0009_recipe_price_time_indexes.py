@@ -0,0 +1,21 @@
+# Generated by Django 2.1.15 on 2026-10-19 08:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_recipesummary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['user', 'price'], name='core_recipe_user_id_72b3b3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['user', 'time_miniutes'], name='core_recipe_user_id_6e0099_idx'),
+        ),
+    ]
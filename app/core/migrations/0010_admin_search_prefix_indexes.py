@@ -0,0 +1,35 @@
+from django.db import migrations
+
+
+PREFIX_INDEXES = (
+    ('core_recipe', 'title'),
+    ('core_user', 'email'),
+)
+
+
+def create_prefix_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, column in PREFIX_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX {table}_{column}_upper_like ON {table} '
+            f'(UPPER("{column}"::text) text_pattern_ops)'
+        )
+
+
+def drop_prefix_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, column in PREFIX_INDEXES:
+        schema_editor.execute(f'DROP INDEX {table}_{column}_upper_like')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_recipe_price_time_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_prefix_indexes, drop_prefix_indexes),
+    ]
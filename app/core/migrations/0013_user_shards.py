@@ -0,0 +1,55 @@
+# Generated by Django 2.1.15 on 2026-10-19 08:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def pin_existing_users(apps, schema_editor):
+    """Keep users created before sharding on the database they are on"""
+    User = apps.get_model('core', 'User')
+    UserShard = apps.get_model('core', 'UserShard')
+    db = schema_editor.connection.alias
+    UserShard.objects.using(db).bulk_create(
+        UserShard(user_id=pk, alias=db)
+        for pk in User.objects.using(db).values_list('pk', flat=True)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserShard',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='shard', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('alias', models.CharField(max_length=100)),
+                ('moving', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='ingredient',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='recipesummary',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='tag',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(pin_existing_users, migrations.RunPython.noop),
+    ]
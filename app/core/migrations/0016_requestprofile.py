@@ -0,0 +1,32 @@
+# Generated by Django 2.1.15 on 2026-10-19 08:37
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_changelog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('method', models.CharField(max_length=16)),
+                ('path', models.TextField()),
+                ('status_code', models.PositiveIntegerField()),
+                ('duration_ms', models.FloatField()),
+                ('sql_count', models.PositiveIntegerField()),
+                ('sql_ms', models.FloatField()),
+                ('stats', models.BinaryField()),
+                ('summary', models.TextField()),
+                ('queries', models.TextField(default='[]')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
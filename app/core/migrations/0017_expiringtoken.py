@@ -0,0 +1,53 @@
+# Generated by Django 2.1.15 on 2026-10-19 08:54
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import itertools
+from datetime import timedelta
+
+
+def copy_tokens(apps, schema_editor):
+    """Carry tokens over, giving each the full lifetime from now"""
+    Token = apps.get_model('authtoken', 'Token')
+    ExpiringToken = apps.get_model('core', 'ExpiringToken')
+    db = schema_editor.connection.alias
+    expires_at = django.utils.timezone.now() + timedelta(
+        seconds=settings.TOKEN_TTL
+    )
+    rows = Token.objects.using(db).order_by('pk').values_list(
+        'key', 'user_id', 'created'
+    ).iterator(chunk_size=1000)
+    while True:
+        batch = list(itertools.islice(rows, 1000))
+        if not batch:
+            return
+        ExpiringToken.objects.using(db).bulk_create(
+            ExpiringToken(
+                key=key, user_id=user_id, created_at=created,
+                expires_at=expires_at
+            )
+            for key, user_id, created in batch
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_requestprofile'),
+        ('authtoken', '0002_auto_20160226_1747'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExpiringToken',
+            fields=[
+                ('key', models.CharField(max_length=40, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='expiring_token', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(copy_tokens, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 2.1.15 on 2026-10-19 09:16
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import F, Max
+
+
+def number_changes(apps, schema_editor):
+    """Number existing changes by id, which cursors handed out so far are"""
+    ChangeLog = apps.get_model('core', 'ChangeLog')
+    ChangeSequence = apps.get_model('core', 'ChangeSequence')
+    db = schema_editor.connection.alias
+    ChangeLog.objects.using(db).update(seq=F('id'))
+    ChangeSequence.objects.using(db).bulk_create(
+        ChangeSequence(user_id=user_id, last_seq=last_seq)
+        for user_id, last_seq in ChangeLog.objects.using(db).order_by().values(
+            'user'
+        ).annotate(last_seq=Max('seq')).values_list('user', 'last_seq')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_expiringtoken'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeSequence',
+            fields=[
+                ('user', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('last_seq', models.BigIntegerField(default=0)),
+                ('pruned_seq', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='changelog',
+            name='core_change_user_id_ee010b_idx',
+        ),
+        migrations.AddField(
+            model_name='changelog',
+            name='seq',
+            field=models.BigIntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.RunPython(number_changes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='changelog',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterUniqueTogether(
+            name='changelog',
+            unique_together={('user', 'seq')},
+        ),
+    ]
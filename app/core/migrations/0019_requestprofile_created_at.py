@@ -0,0 +1,18 @@
+# Generated by Django 2.1.15 on 2026-10-19 09:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_changesequence'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='requestprofile',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
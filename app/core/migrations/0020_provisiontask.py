@@ -0,0 +1,30 @@
+# Generated by Django 2.1.15 on 2026-10-19 09:25
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_requestprofile_created_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProvisionTask',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('issue_tokens', models.BooleanField(default=False)),
+                ('pending', models.TextField(default='[]')),
+                ('created', models.TextField(default='[]')),
+                ('skipped', models.TextField(default='[]')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done')], default='pending', max_length=16)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('requested_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 2.1.15 on 2026-10-19 09:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_provisiontask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenEvent',
+            fields=[
+                ('event', models.CharField(max_length=16, primary_key=True, serialize=False)),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 2.1.15 on 2026-10-19 09:26
+
+from django.db import migrations
+
+
+def clear_tokens(apps, schema_editor):
+    """Delete the never expiring tokens 0017 carried over"""
+    Token = apps.get_model('authtoken', 'Token')
+    Token.objects.using(schema_editor.connection.alias).all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_tokenevent'),
+        ('authtoken', '0002_auto_20160226_1747'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_tokens, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 2.1.15 on 2026-10-19 14:02
+
+import json
+
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.db import migrations
+
+
+def hash_pending(apps, schema_editor):
+    """Replace passwords of queued provisioning rows with their hashes"""
+    ProvisionTask = apps.get_model('core', 'ProvisionTask')
+    tasks = ProvisionTask.objects.using(schema_editor.connection.alias)
+    for task in tasks.exclude(pending='[]'):
+        pending = json.loads(task.pending)
+        for row in pending:
+            try:
+                identify_hasher(row.get('password'))
+            except (TypeError, ValueError):
+                row['password'] = make_password(row.get('password'))
+        task.pending = json.dumps(pending)
+        task.save(update_fields=['pending'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_clear_authtoken'),
+    ]
+
+    operations = [
+        migrations.RunPython(hash_pending, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,4 @@
+import binascii
 import uuid
 import os
 
@@ -8,6 +9,7 @@ from django.contrib.auth.models import (
     PermissionsMixin
 )
 from django.conf import settings
+from django.utils import timezone
 
 
 def recipe_image_file_path(instance, filename):
@@ -18,6 +20,69 @@ def recipe_image_file_path(instance, filename):
     return os.path.join('uploads/recipe/', filename)
 
 
+class ShardedQuerySet(models.QuerySet):
+    """QuerySet of user owned rows, sent to the shard of their user
+
+    Without an explicit database, filtering or creating by user picks
+    that user's shard. Other queries need a shard activated for the
+    request, see core.sharding.
+    """
+    USER_LOOKUPS = ('user', 'user_id', 'user__id', 'user__pk')
+
+    def _for_user_of(self, values):
+        if self._db is not None:
+            return self
+        for lookup in self.USER_LOOKUPS:
+            if values.get(lookup) is not None:
+                from core.sharding import db_for_user
+                user = values[lookup]
+                return self.using(db_for_user(getattr(user, 'pk', user)))
+        return self
+
+    def for_user(self, user):
+        """Return rows of user, from their shard"""
+        return self._for_user_of({'user': user}).filter(user=user)
+
+    def filter(self, *args, **kwargs):
+        return super(
+            ShardedQuerySet, self._for_user_of(kwargs)
+        ).filter(*args, **kwargs)
+
+    def get(self, *args, **kwargs):
+        return super(
+            ShardedQuerySet, self._for_user_of(kwargs)
+        ).get(*args, **kwargs)
+
+    def create(self, **kwargs):
+        return super(
+            ShardedQuerySet, self._for_user_of(kwargs)
+        ).create(**kwargs)
+
+    def get_or_create(self, defaults=None, **kwargs):
+        return super(
+            ShardedQuerySet, self._for_user_of(kwargs)
+        ).get_or_create(defaults, **kwargs)
+
+    def update_or_create(self, defaults=None, **kwargs):
+        return super(
+            ShardedQuerySet, self._for_user_of(kwargs)
+        ).update_or_create(defaults, **kwargs)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        if self._db is not None or not objs:
+            return super().bulk_create(objs, *args, **kwargs)
+        from core.sharding import db_for_user
+        shards = {}
+        for obj in objs:
+            shards.setdefault(db_for_user(obj.user_id), []).append(obj)
+        for alias, shard_objs in shards.items():
+            super(ShardedQuerySet, self.using(alias)).bulk_create(
+                shard_objs, *args, **kwargs
+            )
+        return objs
+
+
 class UserManager(BaseUserManager):
 
     def create_user(self, email, password=None, **extra_fields):
@@ -52,13 +117,27 @@ class User(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = 'email'
 
 
+# User owned rows live on the user's shard, while users stay on the
+# default database, so their user foreign keys have no constraint.
+ShardedManager = models.Manager.from_queryset(ShardedQuerySet)
+
+
 class Tag(models.Model):
     """Tag to be used for recipe"""
     name = models.CharField(max_length=255)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        db_constraint=False
     )
+    recipe_count = models.PositiveIntegerField(default=0)
+
+    objects = ShardedManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'recipe_count']),
+        ]
 
     def __str__(self):
         return self.name
@@ -69,8 +148,17 @@ class Ingredient(models.Model):
     name = models.CharField(max_length=255)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        db_constraint=False
     )
+    recipe_count = models.PositiveIntegerField(default=0)
+
+    objects = ShardedManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'recipe_count']),
+        ]
 
     def __str__(self):
         return self.name
@@ -81,7 +169,8 @@ class Recipe(models.Model):
     title = models.CharField(max_length=255)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        db_constraint=False
     )
     time_miniutes = models.IntegerField()
     price = models.DecimalField(max_digits=5, decimal_places=2)
@@ -89,6 +178,271 @@ class Recipe(models.Model):
     ingredients = models.ManyToManyField('Ingredient')
     tags = models.ManyToManyField('Tag')
     image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    # Also moved on by changes to tags and ingredients, see core.signals
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ShardedManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'price']),
+            models.Index(fields=['user', 'time_miniutes']),
+        ]
 
     def __str__(self):
         return self.title
+
+
+class RecipeSummary(models.Model):
+    '''Aggregates of user's recipes within a cooking time bucket'''
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        db_constraint=False
+    )
+    time_bucket = models.IntegerField()
+    recipe_count = models.IntegerField(default=0)
+    price_total = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0
+    )
+    time_total = models.BigIntegerField(default=0)
+
+    objects = ShardedManager()
+
+    class Meta:
+        unique_together = ('user', 'time_bucket')
+
+    def __str__(self):
+        return f'{self.user} {self.time_bucket}+ min'
+
+
+class ChangeLog(models.Model):
+    '''Change to one of a user's recipes, tags or ingredients
+
+    Changes are numbered per user by ChangeSequence, the last seq a
+    client has seen is its sync cursor.
+    '''
+    CREATED = 'created'
+    UPDATED = 'updated'
+    DELETED = 'deleted'
+    ACTION_CHOICES = (
+        (CREATED, 'Created'), (UPDATED, 'Updated'), (DELETED, 'Deleted')
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        db_constraint=False,
+        related_name='+'
+    )
+    seq = models.BigIntegerField()
+    model = models.CharField(max_length=32)
+    object_id = models.IntegerField()
+    action = models.CharField(max_length=16, choices=ACTION_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    objects = ShardedManager()
+
+    class Meta:
+        unique_together = ('user', 'seq')
+
+    def __str__(self):
+        return f'{self.action} {self.model} {self.object_id}'
+
+
+class ChangeSequence(models.Model):
+    '''Last change number handed out to a user and the last one pruned'''
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        db_constraint=False,
+        related_name='+'
+    )
+    last_seq = models.BigIntegerField(default=0)
+    pruned_seq = models.BigIntegerField(default=0)
+
+    objects = ShardedManager()
+
+    def __str__(self):
+        return f'{self.user_id} at {self.last_seq}'
+
+
+class UserShard(models.Model):
+    '''Database alias holding a user's recipes, tags and ingredients'''
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='shard'
+    )
+    alias = models.CharField(max_length=100)
+    moving = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f'{self.user_id} on {self.alias}'
+
+
+class DeletionTask(models.Model):
+    '''Deletion of a user or a set of recipes carried out in batches'''
+    USER = 'user'
+    RECIPES = 'recipes'
+    TARGET_CHOICES = ((USER, 'User'), (RECIPES, 'Recipes'))
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'), (RUNNING, 'Running'), (DONE, 'Done')
+    )
+
+    # No constraint, the task outlives the user it deletes
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+'
+    )
+    target = models.CharField(max_length=16, choices=TARGET_CHOICES)
+    object_ids = models.TextField(blank=True)
+    status = models.CharField(
+        max_length=16, choices=STATUS_CHOICES, default=PENDING
+    )
+    total = models.PositiveIntegerField(default=0)
+    deleted = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id']),
+        ]
+
+    def __str__(self):
+        return f'Delete {self.target} of user {self.user_id}'
+
+
+class ProvisionTask(models.Model):
+    '''Creation of users requested in bulk, carried out in batches'''
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'), (RUNNING, 'Running'), (DONE, 'Done')
+    )
+
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name='+'
+    )
+    issue_tokens = models.BooleanField(default=False)
+    # JSON rows still to create, holding password hashes only
+    pending = models.TextField(default='[]')
+    created = models.TextField(default='[]')
+    skipped = models.TextField(default='[]')
+    status = models.CharField(
+        max_length=16, choices=STATUS_CHOICES, default=PENDING
+    )
+    total = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'Provision {self.total} users'
+
+
+class Job(models.Model):
+    '''Unit of background work claimed by run_worker'''
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    name = models.CharField(max_length=255)
+    payload = models.TextField(default='{}')
+    status = models.CharField(
+        max_length=16, choices=STATUS_CHOICES, default=PENDING
+    )
+    priority = models.IntegerField(default=0)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', '-priority', 'run_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.pk}'
+
+
+class RequestProfile(models.Model):
+    '''Call graph and SQL statements captured for one request'''
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name='+'
+    )
+    method = models.CharField(max_length=16)
+    path = models.TextField()
+    status_code = models.PositiveIntegerField()
+    duration_ms = models.FloatField()
+    sql_count = models.PositiveIntegerField()
+    sql_ms = models.FloatField()
+    # marshalled pstats data, as written by pstats.Stats.dump_stats
+    stats = models.BinaryField()
+    summary = models.TextField()
+    queries = models.TextField(default='[]')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f'{self.method} {self.path} #{self.pk}'
+
+
+class ExpiringToken(models.Model):
+    '''API token of a user, valid until expires_at'''
+    key = models.CharField(max_length=40, primary_key=True)
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='expiring_token'
+    )
+    created_at = models.DateTimeField(default=timezone.now)
+    # Indexed for the purge job, which deletes the oldest expired first
+    expires_at = models.DateTimeField(db_index=True)
+
+    def save(self, *args, **kwargs):
+        if not self.key:
+            self.key = self.generate_key()
+        return super().save(*args, **kwargs)
+
+    @staticmethod
+    def generate_key():
+        return binascii.hexlify(os.urandom(20)).decode()
+
+    def __str__(self):
+        return f'Token of user {self.user_id}'
+
+
+class TokenEvent(models.Model):
+    '''Number of times tokens were issued, renewed, rejected or purged'''
+    event = models.CharField(max_length=16, primary_key=True)
+    count = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.event}: {self.count}'
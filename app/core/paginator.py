@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+def estimated_rows(queryset):
+    """Return planner row estimate of queryset, None if unavailable"""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def count_queryset(queryset, get_maintained_count=None):
+    """Return (count, exact) of queryset without unbounded COUNT(*)
+
+    Rows are counted up to EXACT_COUNT_THRESHOLD. Larger results take a
+    count maintained elsewhere, returned by get_maintained_count, which
+    can drift so is never reported exact, or else the planner estimate
+    where the database provides one.
+    """
+    threshold = settings.EXACT_COUNT_THRESHOLD
+    count = queryset.order_by()[:threshold + 1].count()
+    if count <= threshold:
+        return count, True
+
+    maintained_count = get_maintained_count and get_maintained_count()
+    if maintained_count is not None:
+        return max(maintained_count, count), False
+
+    estimate = estimated_rows(queryset)
+    if estimate is None:
+        return queryset.count(), True
+    return max(estimate, count), False
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator avoiding exact COUNT(*) over large results"""
+
+    @cached_property
+    def count(self):
+        count, self.count_exact = count_queryset(self.object_list)
+        return count
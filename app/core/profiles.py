@@ -0,0 +1,18 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from core.models import RequestProfile
+from core.purging import delete_oldest
+
+
+def purge_profiles(batch_size=None, now=None):
+    """Delete one batch of profiles past retention, return the number"""
+    batch_size = batch_size or settings.PROFILE_PURGE_BATCH_SIZE
+    now = now or timezone.now()
+    cutoff = now - timedelta(seconds=settings.PROFILE_RETENTION)
+    return delete_oldest(
+        RequestProfile.objects.filter(created_at__lt=cutoff),
+        'created_at', batch_size
+    )
@@ -0,0 +1,180 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from core.jobs import enqueue
+from core.models import ProvisionTask
+from core.sharding import place_users
+from core.tokens import issue_many
+
+
+# Inserts retried after losing a race for an email to another signup
+INSERT_ATTEMPTS = 3
+
+
+def hash_passwords(passwords, workers=None):
+    """Return make_password of each password, hashed across processes
+
+    Key stretching makes hashing the cost of creating a user, so it is
+    spread over workers processes, one per core by default. Small
+    batches are hashed in this process, where starting a pool would
+    cost more than it saves.
+    """
+    passwords = list(passwords)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(passwords) < settings.USER_PROVISION_POOL_MIN:
+        return [make_password(password) for password in passwords]
+    chunksize = max(len(passwords) // (workers * 4), 1)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(make_password, passwords, chunksize=chunksize))
+
+
+def provision_users(rows, issue_tokens=False, batch_size=None,
+                    workers=None):
+    """Create users from dicts of email, name and password in bulk
+
+    Passwords are hashed across workers processes, then the users are
+    created as in create_users.
+    Returns (created users, skipped emails, {user id: token key}).
+    """
+    rows, skipped = _new_rows(rows)
+    users, taken, tokens = create_users(
+        _hash_rows(rows, workers), issue_tokens, batch_size
+    )
+    return users, skipped + taken, tokens
+
+
+def create_users(rows, issue_tokens=False, batch_size=None):
+    """Create users from dicts of email, name and hashed password in bulk
+
+    Emails already taken, or repeated in rows, are skipped, including
+    ones taken by a concurrent signup between the check and the insert.
+    Users are inserted with bulk_create, which sends no post_save, so
+    their shards are placed here, along with their tokens when
+    issue_tokens is set.
+    Returns (created users, skipped emails, {user id: token key}).
+    """
+    User = get_user_model()
+    batch_size = batch_size or settings.USER_PROVISION_BATCH_SIZE
+    rows, skipped = _new_rows(rows)
+    users = [
+        User(email=email, name=row.get('name', ''), password=row['password'])
+        for email, row in rows
+    ]
+    for attempt in range(INSERT_ATTEMPTS):
+        try:
+            users, tokens = _insert_users(users, issue_tokens, batch_size)
+            return users, skipped, tokens
+        except IntegrityError:
+            taken = set(User.objects.filter(email__in=[
+                user.email for user in users
+            ]).values_list('email', flat=True))
+            if not taken or attempt == INSERT_ATTEMPTS - 1:
+                raise
+            skipped.extend(user.email for user in users
+                           if user.email in taken)
+            users = [user for user in users if user.email not in taken]
+
+
+def _new_rows(rows):
+    """Return ([(normalized email, row)], skipped emails) of rows
+
+    Rows repeating an email, or with an email already taken, are skipped.
+    """
+    User = get_user_model()
+    wanted, skipped = {}, []
+    for row in rows:
+        email = User.objects.normalize_email(row['email'])
+        if email in wanted:
+            skipped.append(email)
+        else:
+            wanted[email] = row
+    taken = set(User.objects.filter(
+        email__in=list(wanted)
+    ).values_list('email', flat=True))
+    skipped.extend(email for email in wanted if email in taken)
+    return [(email, row) for email, row in wanted.items()
+            if email not in taken], skipped
+
+
+def _hash_rows(rows, workers=None):
+    """Return dicts of email, name and hashed password of rows"""
+    hashes = hash_passwords([row.get('password') for email, row in rows],
+                            workers)
+    return [
+        {'email': email, 'name': row.get('name', ''), 'password': password}
+        for (email, row), password in zip(rows, hashes)
+    ]
+
+
+def _insert_users(users, issue_tokens, batch_size):
+    tokens = {}
+    with transaction.atomic():
+        get_user_model().objects.bulk_create(users, batch_size=batch_size)
+        # Only some backends set primary keys on bulk inserted rows
+        users = list(get_user_model().objects.filter(email__in=[
+            user.email for user in users
+        ]).order_by('pk'))
+        place_users(users)
+        if issue_tokens:
+            tokens = issue_many(users)
+    return users, tokens
+
+
+def request_provisioning(requested_by, rows, issue_tokens=False,
+                         workers=None):
+    """Leave creating users from rows to the worker, return the task
+
+    Passwords are hashed here, across workers processes, so only their
+    hashes are ever stored and the worker merely inserts rows.
+    """
+    total = len(rows)
+    rows, skipped = _new_rows(rows)
+    pending = _hash_rows(rows, workers)
+    with transaction.atomic():
+        task = ProvisionTask.objects.create(
+            requested_by=requested_by,
+            issue_tokens=issue_tokens,
+            pending=json.dumps(pending),
+            skipped=json.dumps(skipped),
+            total=total
+        )
+        enqueue('core.run_provisioning', {'task_id': task.pk})
+    return task
+
+
+def run_provision_batch(task, batch_size=None):
+    """Create the next batch of task's users, return True once finished
+
+    Passwords were hashed by the request, a batch only inserts rows,
+    so the task stays locked briefly.
+    """
+    batch_size = batch_size or settings.USER_PROVISION_BATCH_SIZE
+    with transaction.atomic():
+        task = ProvisionTask.objects.select_for_update().get(pk=task.pk)
+        pending = json.loads(task.pending)
+        batch, pending = pending[:batch_size], pending[batch_size:]
+        users, skipped, tokens = create_users(
+            batch, task.issue_tokens, batch_size
+        )
+        created = json.loads(task.created)
+        for user in users:
+            entry = {'id': user.pk, 'email': user.email}
+            if user.pk in tokens:
+                entry['token'] = tokens[user.pk]
+            created.append(entry)
+        task.created = json.dumps(created)
+        task.skipped = json.dumps(json.loads(task.skipped) + skipped)
+        task.pending = json.dumps(pending)
+        task.status = ProvisionTask.RUNNING
+        if not pending:
+            task.status = ProvisionTask.DONE
+            task.finished_at = timezone.now()
+        task.save()
+    return not pending
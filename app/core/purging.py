@@ -0,0 +1,89 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.jobs import enqueue
+
+
+def delete_oldest(queryset, field, batch_size, using='default'):
+    """Delete the batch_size rows of queryset lowest on field
+
+    Rows are picked from field's index and deleted by primary key, so
+    each transaction stays short. Returns the number deleted.
+    """
+    with transaction.atomic(using=using):
+        pks = list(queryset.using(using).order_by(field).values_list(
+            'pk', flat=True
+        )[:batch_size])
+        return queryset.model.objects.using(using).filter(
+            pk__in=pks
+        ).delete()[0]
+
+
+def purge_all(purge, batch_size, pause=0):
+    """Call purge(batch_size) until a batch comes back short
+
+    pause seconds pass between full batches. Returns the total deleted.
+    """
+    total = 0
+    while True:
+        deleted = purge(batch_size)
+        total += deleted
+        if deleted < batch_size:
+            return total
+        time.sleep(pause)
+
+
+class PurgeCommand(BaseCommand):
+    """Base of commands deleting rows in batches, here or in the worker
+
+    Subclasses name the rows, the setting of their batch size and the
+    job queued with --enqueue, and implement purge. A purge per target,
+    such as a shard, takes its keyword arguments from get_targets.
+    """
+    rows = 'Rows'
+    batch_size_setting = None
+    job_name = None
+    queued_message = 'Purge queued !'
+    done_message = '{} rows purged !'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int,
+            help=f'{self.rows} deleted per transaction, '
+                 f'{self.batch_size_setting} by default'
+        )
+        parser.add_argument(
+            '--pause', type=float, default=0,
+            help='Seconds to wait between batches, to go easy on the database'
+        )
+        parser.add_argument(
+            '--enqueue', action='store_true',
+            help='Leave the purge to the background worker'
+        )
+
+    def get_targets(self):
+        return [{}]
+
+    def purge(self, batch_size, **target):
+        raise NotImplementedError('.purge() must be overridden')
+
+    def handle(self, *args, **options):
+        batch_size = (options['batch_size'] or
+                      getattr(settings, self.batch_size_setting))
+        if options['enqueue']:
+            for target in self.get_targets():
+                enqueue(self.job_name, {**target, 'batch_size': batch_size})
+            self.stdout.write(self.style.SUCCESS(self.queued_message))
+            return
+
+        total = sum(
+            purge_all(
+                lambda size: self.purge(size, **target),
+                batch_size, options['pause']
+            )
+            for target in self.get_targets()
+        )
+        self.stdout.write(self.style.SUCCESS(self.done_message.format(total)))
@@ -0,0 +1,52 @@
+import msgpack
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def encode_default(obj):
+    """Encode types msgpack and orjson lack the way DRF's JSON does"""
+    return JSONEncoder().default(obj)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSON renderer encoding compact output with orjson when installed
+
+    Indented output for the browsable API and settings orjson cannot
+    honour, such as ASCII only output, fall back to DRF's encoder.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or self.ensure_ascii or not self.compact or \
+                self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+
+        content = orjson.dumps(
+            data,
+            default=encode_default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        )
+        # Keep output safe to embed in JavaScript, as DRF's JSON is
+        return content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(
+            b'\xe2\x80\xa9', b'\\u2029'
+        )
+
+
+class MessagePackRenderer(BaseRenderer):
+    """Renderer serializing data to MessagePack"""
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=encode_default, use_bin_type=True)
@@ -0,0 +1,311 @@
+import itertools
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.apps import apps
+from django.db import (
+    DEFAULT_DB_ALIAS,
+    IntegrityError,
+    connections,
+    transaction
+)
+from django.db.models import Max
+
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.permissions import SAFE_METHODS
+
+from core.models import (
+    ChangeLog,
+    ChangeSequence,
+    Ingredient,
+    Recipe,
+    RecipeSummary,
+    Tag,
+    UserShard
+)
+
+
+SHARDED_MODELS = {
+    'core.tag',
+    'core.ingredient',
+    'core.recipe',
+    'core.recipesummary',
+    'core.changelog',
+    'core.changesequence',
+}
+
+_active = threading.local()
+
+
+def is_sharded(model):
+    """Return whether rows of model live on their user's shard"""
+    # Auto created m2m tables go with the model declaring them
+    model = model._meta.auto_created or model
+    return model._meta.label_lower in SHARDED_MODELS
+
+
+def hash_shard(user_id):
+    """Return the shard a new user is placed on, stable across processes"""
+    shards = settings.SHARD_DATABASES
+    return shards[zlib.crc32(str(user_id).encode()) % len(shards)]
+
+
+def _cache_key(user_id):
+    return f'user_shard:{user_id}'
+
+
+def lookup(user_id):
+    """Return (alias, moving) of user's shard"""
+    key = _cache_key(user_id)
+    shard = cache.get(key)
+    if shard is None:
+        shard = UserShard.objects.using(DEFAULT_DB_ALIAS).filter(
+            user_id=user_id
+        ).values_list('alias', 'moving').first()
+        shard = shard or (hash_shard(user_id), False)
+        cache.set(key, shard, settings.SHARD_LOOKUP_TIMEOUT)
+    return tuple(shard)
+
+
+def db_for_user(user_id):
+    """Return the database alias holding user's rows"""
+    return lookup(user_id)[0]
+
+
+def place_user(user):
+    """Record the shard of a new user"""
+    alias = hash_shard(user.pk)
+    UserShard.objects.using(DEFAULT_DB_ALIAS).create(user=user, alias=alias)
+    cache.set(_cache_key(user.pk), (alias, False),
+              settings.SHARD_LOOKUP_TIMEOUT)
+
+
+def place_users(users):
+    """Record the shards of new users created in bulk, skipping signals"""
+    placed = {user.pk: hash_shard(user.pk) for user in users}
+    UserShard.objects.using(DEFAULT_DB_ALIAS).bulk_create([
+        UserShard(user_id=user_id, alias=alias)
+        for user_id, alias in placed.items()
+    ])
+    cache.set_many(
+        {_cache_key(user_id): (alias, False)
+         for user_id, alias in placed.items()},
+        settings.SHARD_LOOKUP_TIMEOUT
+    )
+
+
+def activate(alias):
+    """Route queries on sharded models without other hints to alias"""
+    _active.alias = alias
+
+
+def deactivate():
+    _active.alias = None
+
+
+@contextmanager
+def active(alias):
+    """Activate alias for the duration of the block"""
+    previous = get_active()
+    activate(alias)
+    try:
+        yield alias
+    finally:
+        activate(previous)
+
+
+def get_active():
+    """Return the alias activated for the current thread, if any"""
+    return getattr(_active, 'alias', None)
+
+
+class ShardUnresolved(Exception):
+    """Raised for a query on user owned rows whose shard is unknown"""
+
+
+class ShardRouter:
+    """Route user owned models to the shard of their user
+
+    Rows being saved or related to a loaded object follow that object or
+    its user, querysets filtered by user go to that user's shard and
+    other queries go to the shard activated for the request. Queries
+    matching none of these are refused rather than sent to a shard at
+    random. Everything else, users and tokens included, stays on the
+    default database, and every database gets the full schema.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not is_sharded(model):
+            return DEFAULT_DB_ALIAS
+        instance = hints.get('instance')
+        if isinstance(instance, get_user_model()):
+            return db_for_user(instance.pk)
+        if instance is not None and is_sharded(type(instance)):
+            if instance._state.db:
+                return instance._state.db
+            if instance.user_id is not None:
+                return db_for_user(instance.user_id)
+        alias = get_active()
+        if alias is None:
+            if len(settings.SHARD_DATABASES) > 1:
+                raise ShardUnresolved(
+                    f'No shard for a {model._meta.label} query, filter by '
+                    f'user, pass using() or activate a shard'
+                )
+            alias = settings.SHARD_DATABASES[0]
+        return alias
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+
+class ShardMoving(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Your data is being moved, try again shortly.'
+    default_code = 'shard_moving'
+
+    def __init__(self, wait):
+        super().__init__()
+        self.wait = wait
+
+
+class ShardRoutingMixin:
+    """Route the view's queries to the shard of the requesting user"""
+
+    def initial(self, request, *args, **kwargs):
+        self.previous_shard = get_active()
+        super().initial(request, *args, **kwargs)
+        if request.user and request.user.is_authenticated:
+            alias, moving = lookup(request.user.pk)
+            if moving and request.method not in SAFE_METHODS:
+                raise ShardMoving(settings.SHARD_LOOKUP_TIMEOUT)
+            activate(alias)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        activate(getattr(self, 'previous_shard', None))
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+def _user_querysets(user_id, using):
+    """Return querysets of user's rows, in an order safe to copy"""
+    return [
+        Tag.objects.using(using).filter(user_id=user_id),
+        Ingredient.objects.using(using).filter(user_id=user_id),
+        Recipe.objects.using(using).filter(user_id=user_id),
+        Recipe.tags.through.objects.using(using).filter(
+            recipe__user_id=user_id
+        ),
+        Recipe.ingredients.through.objects.using(using).filter(
+            recipe__user_id=user_id
+        ),
+        RecipeSummary.objects.using(using).filter(user_id=user_id),
+        ChangeSequence.objects.using(using).filter(user_id=user_id),
+        ChangeLog.objects.using(using).filter(user_id=user_id),
+    ]
+
+
+def _set_moving(user_id, alias, moving):
+    UserShard.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+        user_id=user_id, defaults={'alias': alias, 'moving': moving}
+    )
+    cache.delete(_cache_key(user_id))
+
+
+def _copy(queryset, target, batch_size):
+    copied = 0
+    rows = queryset.order_by('pk').iterator(chunk_size=batch_size)
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return copied
+        queryset.model.objects.using(target).bulk_create(batch)
+        copied += len(batch)
+
+
+def id_space_start(top, offset, stride):
+    """Return the first id above top that is offset modulo stride"""
+    return (top // stride + 1) * stride + offset
+
+
+def configure_id_space(alias):
+    """Make alias hand out ids of sharded tables no other shard does
+
+    Postgres sequences step by SHARD_ID_STRIDE from the shard's position
+    in SHARD_DATABASES, restarting above the highest id of any shard, so
+    moved rows keep their ids. SQLite and others cannot step sequences,
+    there moves fail on colliding ids instead.
+    """
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return
+    stride = settings.SHARD_ID_STRIDE
+    offset = settings.SHARD_DATABASES.index(alias) + 1
+    quote = connection.ops.quote_name
+    sharded = [
+        model for model in apps.get_models(include_auto_created=True)
+        if is_sharded(model)
+    ]
+    with transaction.atomic(using=alias), connection.cursor() as cursor:
+        for model in sharded:
+            table, column = model._meta.db_table, model._meta.pk.column
+            # Hold inserts off between reading the top id and restarting
+            cursor.execute(
+                f'LOCK TABLE {quote(table)} IN SHARE ROW EXCLUSIVE MODE'
+            )
+            top = max(
+                model._base_manager.using(shard).aggregate(
+                    top=Max('pk')
+                )['top'] or 0
+                for shard in settings.SHARD_DATABASES
+            )
+            cursor.execute(
+                'SELECT pg_get_serial_sequence(%s, %s)', [table, column]
+            )
+            sequence = cursor.fetchone()[0]
+            cursor.execute(
+                f'ALTER SEQUENCE {sequence} INCREMENT BY {stride} '
+                f'RESTART WITH {id_space_start(top, offset, stride)}'
+            )
+
+
+def move_user(user_id, target, batch_size=1000, grace=None):
+    """Copy user's rows to target, switch the user over and clean up
+
+    Writes are refused while the user is moving, reads keep going to
+    the source. Waiting grace seconds after each switch lets processes
+    that cached the previous lookup catch up. Ids are kept, the target's
+    id space is reset above them once copied.
+    Returns the number of rows moved.
+    """
+    if grace is None:
+        grace = settings.SHARD_LOOKUP_TIMEOUT
+    source = db_for_user(user_id)
+    if source == target:
+        return 0
+
+    _set_moving(user_id, source, True)
+    time.sleep(grace)
+    moved = 0
+    try:
+        with transaction.atomic(using=target):
+            for queryset in _user_querysets(user_id, source):
+                moved += _copy(queryset, target, batch_size)
+    except IntegrityError:
+        _set_moving(user_id, source, False)
+        raise
+    configure_id_space(target)
+
+    _set_moving(user_id, target, False)
+    time.sleep(grace)
+    with transaction.atomic(using=source):
+        for queryset in reversed(_user_querysets(user_id, source)):
+            queryset.delete()
+    return moved
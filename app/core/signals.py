@@ -0,0 +1,264 @@
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import (
+    m2m_changed,
+    pre_delete,
+    post_delete,
+    pre_save,
+    post_save
+)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core.models import (
+    ChangeLog,
+    ChangeSequence,
+    Tag,
+    Ingredient,
+    Recipe,
+    User
+)
+from core.deletion import delete_user_rows
+from core.sharding import db_for_user, place_user
+from core.stats import apply_recipe
+from core.versions import bump_version
+
+
+RECIPE_RELATIONS = {
+    Recipe.tags.through: (Tag, 'tags', 'tag'),
+    Recipe.ingredients.through: (Ingredient, 'ingredients', 'ingredient'),
+}
+
+
+def bump_on_commit(using, namespace, user_id):
+    """Bump user's version of namespace once committed
+
+    Bumping earlier would let other requests cache data built from rows
+    that can still roll back under the new version, and keep it after.
+    """
+    transaction.on_commit(
+        lambda: bump_version(namespace, user_id), using=using
+    )
+
+
+def update_recipe_counts(model, pks, using='default'):
+    """Recalculate recipe_count of given tags or ingredients
+
+    The rows are locked, in order, before counting. Under READ COMMITTED
+    a transaction waiting on the lock then counts with a snapshot taken
+    after the holder committed, instead of missing its links.
+    """
+    if not pks:
+        return
+    field = model._meta.model_name
+    through = getattr(Recipe, f'{field}s').through
+    usage = through.objects.using(using).filter(
+        **{field: OuterRef('pk')}
+    ).order_by().values(field).annotate(total=Count('pk')).values('total')
+    rows = model.objects.using(using).filter(pk__in=pks)
+
+    with transaction.atomic(using=using):
+        list(rows.select_for_update().order_by('pk').values_list(
+            'pk', flat=True
+        ))
+        rows.update(
+            recipe_count=Coalesce(
+                Subquery(usage, output_field=IntegerField()), 0
+            )
+        )
+
+
+def log_changes(model, user_id, pks, action, using='default'):
+    """Record changes to user's objects for the change feed
+
+    Numbers come from the user's sequence row, which stays locked until
+    the transaction commits, so a user's changes become visible in
+    number order and no cursor skips one still in flight.
+    """
+    pks = list(pks)
+    if not pks:
+        return
+    sequences = ChangeSequence.objects.using(using).filter(user_id=user_id)
+    with transaction.atomic(using=using):
+        if not sequences.update(last_seq=F('last_seq') + len(pks)):
+            sequences.get_or_create(user_id=user_id)
+            sequences.update(last_seq=F('last_seq') + len(pks))
+        last_seq = sequences.values_list('last_seq', flat=True).get()
+        ChangeLog.objects.using(using).bulk_create(
+            ChangeLog(
+                user_id=user_id,
+                seq=last_seq - len(pks) + n,
+                model=model._meta.model_name,
+                object_id=pk,
+                action=action
+            )
+            for n, pk in enumerate(pks, 1)
+        )
+
+
+def touch_recipes(user_id, pks, using='default'):
+    """Mark recipes as updated, for caches and the change feed"""
+    if pks:
+        Recipe.objects.using(using).filter(pk__in=pks).update(
+            updated_at=timezone.now()
+        )
+        log_changes(Recipe, user_id, pks, ChangeLog.UPDATED, using)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_relation_changed(sender, instance, action, reverse, pk_set,
+                            using, **kwargs):
+    """Keep recipe_count in step with recipe tags and ingredients"""
+    model, attr, field = RECIPE_RELATIONS[sender]
+    cleared_attr = f'_cleared_{attr}'
+    if action.startswith('post_'):
+        bump_on_commit(using, field, instance.user_id)
+
+    if reverse:
+        if action == 'pre_clear':
+            instance._cleared_recipes = list(
+                sender.objects.using(using).filter(
+                    **{field: instance}
+                ).values_list('recipe_id', flat=True)
+            )
+        elif action == 'post_clear':
+            update_recipe_counts(model, [instance.pk], using)
+            touch_recipes(
+                instance.user_id,
+                getattr(instance, '_cleared_recipes', []),
+                using
+            )
+        elif action.startswith('post_'):
+            update_recipe_counts(model, [instance.pk], using)
+            touch_recipes(instance.user_id, pk_set, using)
+        return
+
+    if action.startswith('post_'):
+        touch_recipes(instance.user_id, [instance.pk], using)
+    if action == 'pre_clear':
+        setattr(instance, cleared_attr, list(
+            sender.objects.using(using).filter(
+                recipe=instance
+            ).values_list(f'{field}_id', flat=True)
+        ))
+    elif action == 'post_clear':
+        update_recipe_counts(
+            model, getattr(instance, cleared_attr, []), using
+        )
+    elif action in ('post_add', 'post_remove'):
+        update_recipe_counts(model, pk_set, using)
+
+
+@receiver(pre_save, sender=Recipe)
+def recipe_pre_save(sender, instance, raw, using, **kwargs):
+    """Remember previous values of a recipe being updated"""
+    instance._stats_previous = None
+    if instance.pk and not raw:
+        instance._stats_previous = sender.objects.using(using).filter(
+            pk=instance.pk
+        ).values_list('user_id', 'time_miniutes', 'price').first()
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_post_save(sender, instance, raw, using, **kwargs):
+    """Move a saved recipe between user's summary rows"""
+    if raw:
+        return
+    previous = getattr(instance, '_stats_previous', None)
+    with transaction.atomic(using=using):
+        if previous:
+            apply_recipe(*previous, sign=-1, using=using)
+        apply_recipe(
+            instance.user_id, instance.time_miniutes, instance.price,
+            sign=1, using=using
+        )
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_pre_delete(sender, instance, using, **kwargs):
+    """Remember the tags and ingredients of a recipe being deleted"""
+    for through, (model, attr, field) in RECIPE_RELATIONS.items():
+        setattr(instance, f'_deleted_{attr}', list(
+            through.objects.using(using).filter(
+                recipe=instance
+            ).values_list(f'{field}_id', flat=True)
+        ))
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_post_delete(sender, instance, using, **kwargs):
+    """Release the tags and ingredients of a deleted recipe"""
+    for model, attr, field in RECIPE_RELATIONS.values():
+        update_recipe_counts(
+            model, getattr(instance, f'_deleted_{attr}', []), using
+        )
+        bump_on_commit(using, field, instance.user_id)
+
+    apply_recipe(
+        instance.user_id, instance.time_miniutes, instance.price,
+        sign=-1, using=using
+    )
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def recipe_attr_updated(sender, instance, using, **kwargs):
+    """Mark recipes showing a renamed or deleted tag or ingredient"""
+    if kwargs.get('created') or kwargs.get('raw'):
+        return
+    touch_recipes(instance.user_id, list(
+        Recipe.objects.using(using).filter(
+            **{f'{sender._meta.model_name}s': instance}
+        ).values_list('pk', flat=True)
+    ), using)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def recipe_attr_changed(sender, instance, using, **kwargs):
+    """Invalidate cached lookups of user's tags or ingredients"""
+    bump_on_commit(using, sender._meta.model_name, instance.user_id)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def log_saved(sender, instance, created, raw, using, **kwargs):
+    """Record a created or updated object in the change feed"""
+    if not raw:
+        action = ChangeLog.CREATED if created else ChangeLog.UPDATED
+        log_changes(sender, instance.user_id, [instance.pk], action, using)
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def log_deleted(sender, instance, using, **kwargs):
+    """Record a tombstone of a deleted object in the change feed"""
+    log_changes(
+        sender, instance.user_id, [instance.pk], ChangeLog.DELETED, using
+    )
+
+
+@receiver(post_save, sender=User)
+def user_created(sender, instance, created, raw, **kwargs):
+    """Place a new user on a shard"""
+    if created and not raw:
+        place_user(instance)
+
+
+@receiver(pre_delete, sender=User)
+def user_pre_delete(sender, instance, using, **kwargs):
+    """Delete a user's rows on another shard, out of the cascade's reach
+
+    Rows on the database of the delete are left to the cascade.
+    """
+    alias = db_for_user(instance.pk)
+    if alias != using:
+        delete_user_rows(instance.pk, alias)
@@ -0,0 +1,54 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Sum, Value, When
+
+from core.models import RecipeSummary
+
+
+# Lower bounds, in minutes, of the cooking time histogram buckets
+RECIPE_TIME_BUCKETS = (0, 15, 30, 60, 120)
+
+
+def time_bucket(minutes):
+    """Return histogram bucket a cooking time falls into"""
+    bucket = RECIPE_TIME_BUCKETS[0]
+    for lower in RECIPE_TIME_BUCKETS:
+        if minutes >= lower:
+            bucket = lower
+    return bucket
+
+
+def summarize(recipes):
+    """Aggregate recipes per user and time bucket in the database"""
+    whens = [
+        When(time_miniutes__lt=upper, then=Value(lower))
+        for lower, upper in zip(RECIPE_TIME_BUCKETS, RECIPE_TIME_BUCKETS[1:])
+    ]
+    return recipes.order_by().annotate(
+        time_bucket=Case(
+            *whens,
+            default=Value(RECIPE_TIME_BUCKETS[-1]),
+            output_field=IntegerField()
+        )
+    ).values('user_id', 'time_bucket').annotate(
+        recipe_count=Count('pk'),
+        price_total=Sum('price'),
+        time_total=Sum('time_miniutes')
+    )
+
+
+def apply_recipe(user_id, minutes, price, sign, using='default'):
+    """Add (sign=1) or remove (sign=-1) a recipe from user's summary"""
+    price = Decimal(str(price))
+    lookup = {'user_id': user_id, 'time_bucket': time_bucket(minutes)}
+    summaries = RecipeSummary.objects.using(using).filter(**lookup)
+    with transaction.atomic(using=using):
+        if sign > 0:
+            summaries.get_or_create(**lookup)
+        # Removals never create rows, the user may be going away
+        summaries.update(
+            recipe_count=F('recipe_count') + sign,
+            price_total=F('price_total') + sign * price,
+            time_total=F('time_total') + sign * minutes
+        )
@@ -0,0 +1,51 @@
+from django.conf import settings
+
+from core.changes import prune_changes
+from core.deletion import run_batch
+from core.jobs import enqueue, job
+from core.models import DeletionTask, ProvisionTask
+from core.profiles import purge_profiles
+from core.provisioning import run_provision_batch
+from core.tokens import purge_expired
+
+
+@job('core.run_deletion')
+def run_deletion(task_id):
+    """Delete one batch of a deletion task, queueing the next one"""
+    task = DeletionTask.objects.get(pk=task_id)
+    if task.status != DeletionTask.DONE and not run_batch(task):
+        enqueue('core.run_deletion', {'task_id': task_id})
+
+
+@job('core.run_provisioning')
+def run_provisioning(task_id):
+    """Create one batch of users of a provisioning task, queueing the next"""
+    task = ProvisionTask.objects.get(pk=task_id)
+    if task.status != ProvisionTask.DONE and not run_provision_batch(task):
+        enqueue('core.run_provisioning', {'task_id': task_id})
+
+
+@job('core.purge_tokens')
+def purge_tokens(batch_size=None):
+    """Delete one batch of expired tokens, queueing the next one"""
+    batch_size = batch_size or settings.TOKEN_PURGE_BATCH_SIZE
+    if purge_expired(batch_size) == batch_size:
+        enqueue('core.purge_tokens', {'batch_size': batch_size})
+
+
+@job('core.prune_changes')
+def prune_changes_job(using, batch_size=None):
+    """Delete one batch of expired change log rows on a shard"""
+    batch_size = batch_size or settings.CHANGE_FEED_PRUNE_BATCH_SIZE
+    if prune_changes(using, batch_size) == batch_size:
+        enqueue('core.prune_changes', {
+            'using': using, 'batch_size': batch_size
+        })
+
+
+@job('core.purge_profiles')
+def purge_profiles_job(batch_size=None):
+    """Delete one batch of request profiles past retention"""
+    batch_size = batch_size or settings.PROFILE_PURGE_BATCH_SIZE
+    if purge_profiles(batch_size) == batch_size:
+        enqueue('core.purge_profiles', {'batch_size': batch_size})
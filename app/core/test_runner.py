@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.test import TransactionTestCase
+from django.test.runner import DiscoverRunner
+
+
+class ShardedTestRunner(DiscoverRunner):
+    """Test runner isolating tests on every shard, not only the default
+
+    Run with DB_SHARDS set to cover user rows living on another shard.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        if len(settings.SHARD_DATABASES) > 1:
+            TransactionTestCase.multi_db = True
@@ -1,7 +1,12 @@
-from django.test import TestCase, Client
+from unittest.mock import patch
+
+from django.test import TestCase, Client, override_settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 
+from core.models import DeletionTask, Tag, Ingredient, Recipe
+from core.sharding import db_for_user
+
 
 class AdminSiteTests(TestCase):
 
@@ -39,3 +44,92 @@ class AdminSiteTests(TestCase):
         res = self.client.get(url)
 
         self.assertEqual(res.status_code, 200)
+
+    def test_user_delete_queued(self):
+        """Deleting users leaves their data to the deletion worker"""
+        Recipe.objects.create(
+            user=self.user, title='Kale salad', time_miniutes=5, price=5
+        )
+        url = reverse('admin:core_user_delete', args=[self.user.id])
+
+        res = self.client.get(url)
+        self.assertContains(res, self.user.email)
+        self.assertNotContains(res, 'Kale salad')
+
+        res = self.client.post(url, {'post': 'yes'})
+        self.assertEqual(res.status_code, 302)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertTrue(DeletionTask.objects.filter(
+            user=self.user, target=DeletionTask.USER
+        ).exists())
+        self.assertTrue(Recipe.objects.filter(user=self.user).exists())
+
+    def test_user_delete_action_queued(self):
+        """The delete selected action queues a deletion per user"""
+        res = self.client.post(reverse('admin:core_user_changelist'), {
+            'action': 'delete_selected',
+            '_selected_action': [self.user.id],
+            'post': 'yes',
+        })
+
+        self.assertEqual(res.status_code, 302)
+        self.assertEqual(
+            DeletionTask.objects.filter(user=self.user).count(), 1
+        )
+
+    def test_recipe_pages(self):
+        """Recipe, tag and ingredient admin pages work"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        ingredient = Ingredient.objects.create(user=self.user, name='Kale')
+        recipe = Recipe.objects.create(
+            user=self.user, title='Kale salad', time_miniutes=5, price=5
+        )
+        recipe.tags.add(tag)
+        recipe.ingredients.add(ingredient)
+
+        for name, obj in (
+            ('tag', tag), ('ingredient', ingredient), ('recipe', recipe)
+        ):
+            url = reverse(f'admin:core_{name}_changelist')
+            res = self.client.get(url, {
+                'q': str(obj)[:3], 'shard': db_for_user(self.user.pk)
+            })
+            self.assertContains(res, str(obj))
+
+            url = reverse(f'admin:core_{name}_change', args=[obj.id])
+            res = self.client.get(url)
+            self.assertEqual(res.status_code, 200)
+
+    def test_recipe_autocomplete_searches_recipe_shard(self):
+        """Tag and ingredient pickers search the shard of the recipe"""
+        shard = db_for_user(self.user.pk)
+        Tag.objects.create(user=self.user, name='Vegan')
+        recipe = Recipe.objects.create(
+            user=self.user, title='Kale salad', time_miniutes=5, price=5
+        )
+
+        res = self.client.get(
+            reverse('admin:core_recipe_change', args=[recipe.id])
+        )
+        url = reverse('admin:core_tag_autocomplete') + f'?shard={shard}'
+        self.assertContains(res, url)
+
+        res = self.client.get(f'{url}&term=Veg')
+        self.assertEqual(
+            [row['text'] for row in res.json()['results']], ['Vegan']
+        )
+
+    @override_settings(EXACT_COUNT_THRESHOLD=1)
+    @patch('core.paginator.estimated_rows', return_value=123456)
+    def test_changelist_uses_estimated_count(self, estimated_rows):
+        """Large changelists do not count every row"""
+        for title in ('Salad', 'Soup'):
+            Recipe.objects.create(
+                user=self.user, title=title, time_miniutes=5, price=5
+            )
+        url = reverse('admin:core_recipe_changelist')
+        res = self.client.get(url, {'shard': db_for_user(self.user.pk)})
+
+        self.assertEqual(res.context['cl'].paginator.count, 123456)
+        estimated_rows.assert_called_once()
@@ -1,8 +1,16 @@
+import json
+import os
+import tempfile
+from io import StringIO
 from unittest.mock import patch
 
 from django.core.management import call_command
 from django.db.utils import OperationalError
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+
+from core.models import Tag, Recipe, RecipeSummary, UserShard
+from core.provisioning import hash_passwords
 
 
 class CommandTests(TestCase):
@@ -23,3 +31,110 @@ class CommandTests(TestCase):
 
             call_command('wait_for_db')
             self.assertEqual(gi.call_count, 6)
+
+    def test_profile_startup(self):
+        """Test startup profile reports timings without heavy imports"""
+        out = StringIO()
+        call_command('profile_startup', top=500, stdout=out)
+
+        report = json.loads(out.getvalue())
+        self.assertGreater(report['setup_ms'], 0)
+        self.assertGreater(report['import_ms'], 0)
+        packages = [name for name, ms in report['packages']]
+        self.assertIn('django', packages)
+        self.assertNotIn('numpy', packages)
+        self.assertNotIn('scipy', packages)
+
+    def test_rebuild_recipe_counts(self):
+        """Test rebuilding drifted recipe counts"""
+        user = get_user_model().objects.create_user('test@naveen.com', 'pass')
+        tag = Tag.objects.create(user=user, name='Vegan')
+        recipe = Recipe.objects.create(
+            user=user, title='Salad', time_miniutes=5, price=5.00
+        )
+        recipe.tags.add(tag)
+        Tag.objects.filter(user=user, pk=tag.pk).update(recipe_count=7)
+
+        call_command('rebuild_recipe_counts', batch_size=1)
+
+        tag.refresh_from_db()
+        self.assertEqual(tag.recipe_count, 1)
+
+    def test_rebuild_recipe_stats(self):
+        """Test drifted recipe summaries are rebuilt"""
+        user = get_user_model().objects.create_user('test@naveen.com', 'pass')
+        Recipe.objects.create(
+            user=user, title='Salad', time_miniutes=5, price=5.00
+        )
+        Recipe.objects.create(
+            user=user, title='Soup', time_miniutes=40, price=3.00
+        )
+        RecipeSummary.objects.filter(user=user).update(recipe_count=9)
+
+        call_command('rebuild_recipe_stats', check=True)
+        self.assertEqual(
+            RecipeSummary.objects.get(user=user, time_bucket=0).recipe_count,
+            9
+        )
+
+        call_command('rebuild_recipe_stats')
+        summaries = RecipeSummary.objects.filter(user=user)
+        self.assertEqual(
+            sorted(summaries.values_list('time_bucket', 'recipe_count')),
+            [(0, 1), (30, 1)]
+        )
+
+
+class ProvisionUsersTests(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    @override_settings(USER_PROVISION_POOL_MIN=1)
+    def test_hash_passwords_in_pool(self):
+        """Test passwords hashed by worker processes can be checked"""
+        from django.contrib.auth.hashers import check_password
+
+        hashes = hash_passwords(['first', 'second', 'third'], workers=2)
+
+        self.assertEqual(len(hashes), 3)
+        self.assertTrue(check_password('second', hashes[1]))
+        self.assertFalse(check_password('first', hashes[1]))
+
+    def test_provision_users_command(self):
+        """Test users in a CSV are created with shards and tokens"""
+        source = self.write('users.csv', (
+            'email,name,password\n'
+            'one@naveen.com,One,secret1\n'
+            'two@naveen.com,Two,\n'
+            'one@naveen.com,Again,secret2\n'
+        ))
+        tokens = os.path.join(self.tmp.name, 'tokens.csv')
+        out, err = StringIO(), StringIO()
+
+        call_command(
+            'provision_users', source, tokens=tokens, stdout=out, stderr=err
+        )
+
+        self.assertIn('2 users created', out.getvalue())
+        self.assertIn('1 skipped', out.getvalue())
+        self.assertIn('one@naveen.com', err.getvalue())
+        one = get_user_model().objects.get(email='one@naveen.com')
+        self.assertTrue(one.check_password('secret1'))
+        self.assertFalse(
+            get_user_model().objects.get(
+                email='two@naveen.com'
+            ).has_usable_password()
+        )
+        self.assertEqual(UserShard.objects.count(), 2)
+        with open(tokens) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[0], 'email,token')
+        self.assertEqual(len(lines), 3)
@@ -0,0 +1,111 @@
+import json
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from core import jobs
+from core.models import Job
+
+
+calls = []
+
+
+@jobs.job('tests.record')
+def record(value):
+    calls.append(value)
+
+
+@jobs.job('tests.fail')
+def fail():
+    raise RuntimeError('boom')
+
+
+class JobTests(TestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    def test_claim_by_priority(self):
+        """Test due jobs are claimed highest priority first"""
+        low = jobs.enqueue('tests.record', {'value': 1})
+        high = jobs.enqueue('tests.record', {'value': 2}, priority=5)
+        jobs.enqueue('tests.record', {'value': 3}, priority=9, delay=60)
+
+        claimed = jobs.claim(1)
+
+        self.assertEqual(claimed, [high])
+        high.refresh_from_db()
+        self.assertEqual(high.status, Job.RUNNING)
+        self.assertEqual(high.attempts, 1)
+        self.assertEqual(jobs.claim(5), [low])
+
+    @override_settings(JOB_RETRY_BACKOFF=10)
+    def test_failed_job_retried_with_backoff(self):
+        """Test failing jobs are retried later and finally marked failed"""
+        job = jobs.enqueue('tests.fail', max_attempts=2)
+
+        jobs.claim(1)
+        self.assertEqual(jobs.execute(job.pk), Job.PENDING)
+        job.refresh_from_db()
+        self.assertIn('boom', job.last_error)
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=5))
+        self.assertEqual(jobs.claim(1), [])
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        jobs.claim(1)
+        self.assertEqual(jobs.execute(job.pk), Job.FAILED)
+
+    def test_requeue_stale_jobs(self):
+        """Test jobs of dead workers go back to the queue"""
+        job = jobs.enqueue('tests.record', {'value': 1})
+        jobs.claim(1)
+        Job.objects.filter(pk=job.pk).update(
+            locked_at=timezone.now() - timedelta(hours=1)
+        )
+
+        self.assertEqual(jobs.requeue_stale(60), 1)
+        self.assertEqual(jobs.claim(1), [job])
+
+    def test_heartbeat_keeps_job_claimed(self):
+        """Test running jobs that heartbeat are not requeued"""
+        job = jobs.enqueue('tests.record', {'value': 1})
+        jobs.claim(1)
+        Job.objects.filter(pk=job.pk).update(
+            locked_at=timezone.now() - timedelta(hours=1)
+        )
+
+        self.assertEqual(jobs.heartbeat([job.pk]), 1)
+        self.assertEqual(jobs.requeue_stale(60), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.RUNNING)
+
+    def test_stale_job_out_of_attempts_fails(self):
+        """Test a job whose worker keeps dying is given up on"""
+        job = jobs.enqueue('tests.record', {'value': 1}, max_attempts=1)
+        jobs.claim(1)
+        Job.objects.filter(pk=job.pk).update(
+            locked_at=timezone.now() - timedelta(hours=1)
+        )
+
+        self.assertEqual(jobs.requeue_stale(60), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(jobs.claim(1), [])
+
+    def test_run_worker(self):
+        """Test worker runs due jobs and reports its stats"""
+        jobs.enqueue('tests.record', {'value': 1})
+        jobs.enqueue('tests.record', {'value': 2})
+        out = StringIO()
+
+        call_command('run_worker', pool='inline', once=True, stdout=out)
+
+        self.assertEqual(sorted(calls), [1, 2])
+        stats = json.loads(out.getvalue().splitlines()[-1])
+        self.assertEqual(stats['done'], 2)
+        self.assertEqual(stats['queue']['done'], 2)
+        self.assertEqual(stats['queue']['due'], 0)
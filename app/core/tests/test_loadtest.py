@@ -0,0 +1,160 @@
+import json
+import os
+import tempfile
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest.mock import Mock, patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import LiveServerTestCase, SimpleTestCase, override_settings
+
+from core.loadtest import parse_mix, percentile, run_workload, summarize
+from core.models import Recipe
+
+
+class LoadTestReportTests(SimpleTestCase):
+
+    def test_percentile(self):
+        """Test nearest rank percentiles of sorted latencies"""
+        values = list(range(1, 101))
+
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 99), 7)
+        self.assertIsNone(percentile([], 50))
+
+    def test_summarize(self):
+        """Test errors, throttled requests and rates are reported"""
+        report = summarize({
+            'list': [(10.0, 200), (30.0, 200), (20.0, 429)],
+            'upload': [(50.0, 0)],
+        }, 2.0)
+
+        self.assertEqual(report['requests'], 4)
+        self.assertEqual(report['rps'], 2.0)
+        self.assertEqual(report['errors'], 2)
+        self.assertEqual(report['error_rate'], 0.5)
+        self.assertEqual(report['throttled'], 1)
+        self.assertEqual(report['operations']['list']['p50_ms'], 20.0)
+        self.assertEqual(report['operations']['upload']['max_ms'], 50.0)
+
+    def test_parse_mix(self):
+        """Test operation weights are parsed and unknown ones refused"""
+        self.assertEqual(parse_mix('list=3, upload'), {
+            'list': 3, 'upload': 1
+        })
+        with self.assertRaises(ValueError):
+            parse_mix('delete=1')
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answer every route with canned JSON and count calls per method"""
+
+    def respond(self, status, body):
+        with self.server.lock:
+            self.server.calls[self.command] += 1
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        self.respond(200, [])
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.respond(200, {'token': 'stub', 'id': 1})
+
+    def do_DELETE(self):
+        self.respond(202, {'deletion': 1})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LoadTestWorkloadTests(SimpleTestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        self.server.lock = threading.Lock()
+        self.server.calls = Counter()
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = 'http://%s:%s' % self.server.server_address[:2]
+
+    def test_concurrent_sessions(self):
+        """Test concurrent sessions share the request budget and clean up
+
+        The stub server keeps the threads off the test database, which
+        SQLite would lock against concurrent writes.
+        """
+        samples, elapsed = run_workload(
+            self.url, 4, {'token': 1, 'list': 1, 'filter': 1, 'upload': 1},
+            requests=40, seed=1
+        )
+
+        self.assertEqual(sum(len(entries) for entries in samples.values()),
+                         40)
+        self.assertTrue(all(status == 200 for entries in samples.values()
+                            for latency, status in entries))
+        self.assertEqual(self.server.calls['DELETE'], 4)
+
+    def test_failed_setup_cleans_up(self):
+        """Test sessions signed up before a failure are still deleted"""
+        with patch('core.loadtest.Session.create', side_effect=[
+            1, 1, 1, RuntimeError('POST returned 500')
+        ]):
+            with self.assertRaises(RuntimeError):
+                run_workload(self.url, 2, {'list': 1}, requests=1)
+
+        self.assertEqual(self.server.calls['DELETE'], 2)
+
+
+class LoadTestCommandTests(LiveServerTestCase):
+
+    def test_loadtest_report(self):
+        """Test a local run reports latencies and deletes what it made"""
+        # The live server, sharing the test database, stands in for the
+        # local one. One session, as concurrent writes to the shared in
+        # memory SQLite test database fail with locking errors.
+        server = Mock(server_address=(
+            self.server_thread.host, self.server_thread.port
+        ))
+        out = StringIO()
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root), \
+                patch('core.management.commands.loadtest.start_server',
+                      return_value=server):
+            call_command(
+                'loadtest', concurrency=1, requests=12,
+                mix='token=1,list=1,filter=1,upload=1', seed=1, stdout=out
+            )
+
+            self.assertFalse(any(
+                files for root, dirs, files in os.walk(media_root)
+            ))
+
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['requests'], 12)
+        self.assertEqual(report['errors'], 0)
+        self.assertEqual(
+            set(report['operations']), {'token', 'list', 'filter', 'upload'}
+        )
+        for key in ('p50_ms', 'p95_ms', 'p99_ms', 'rps'):
+            self.assertGreater(report[key], 0)
+        self.assertFalse(get_user_model().objects.filter(
+            email__startswith='loadtest-'
+        ).exists())
+        for alias in settings.DATABASES:
+            self.assertFalse(Recipe.objects.using(alias).exists())
+        server.shutdown.assert_called_once_with()
@@ -0,0 +1,264 @@
+import gzip
+import json
+import marshal
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework.test import APIClient
+
+from core.middleware import CompressionMiddleware, negotiate_encoding
+from core.models import RequestProfile, Tag
+from core.profiles import purge_profiles
+from core.tokens import issue
+
+
+PAYLOAD = json.dumps([{'title': 'Steak and mushroom sauce'}] * 100).encode()
+
+
+@override_settings(COMPRESSION_MIN_SIZE=200)
+class CompressionMiddlewareTests(TestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def process(self, response, accept='gzip'):
+        request = self.factory.get('/', HTTP_ACCEPT_ENCODING=accept)
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def test_negotiate_encoding(self):
+        """Test encoding is picked by quality, then server preference"""
+        available = ('br', 'gzip')
+        self.assertEqual(negotiate_encoding('gzip, br', available), 'br')
+        self.assertEqual(
+            negotiate_encoding('br;q=0.5, gzip', available), 'gzip'
+        )
+        self.assertEqual(
+            negotiate_encoding('*;q=0.2, br;q=0', available), 'gzip'
+        )
+        self.assertIsNone(negotiate_encoding('gzip;q=0', available))
+        self.assertIsNone(negotiate_encoding('identity', available))
+
+    def test_compress_response(self):
+        """Test large responses are compressed with accepted encoding"""
+        res = self.process(
+            HttpResponse(PAYLOAD, content_type='application/json')
+        )
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertEqual(res['Vary'], 'Accept-Encoding')
+        self.assertEqual(int(res['Content-Length']), len(res.content))
+        self.assertEqual(gzip.decompress(res.content), PAYLOAD)
+
+    def test_skip_small_and_unaccepted(self):
+        """Test small responses and clients without gzip are skipped"""
+        res = self.process(HttpResponse(b'{}'))
+        self.assertFalse(res.has_header('Content-Encoding'))
+
+        res = self.process(HttpResponse(PAYLOAD), accept='')
+        self.assertFalse(res.has_header('Content-Encoding'))
+        self.assertEqual(res.content, PAYLOAD)
+
+    def test_skip_images_and_encoded(self):
+        """Test compressed media and encoded responses are untouched"""
+        res = self.process(HttpResponse(PAYLOAD, content_type='image/jpeg'))
+        self.assertFalse(res.has_header('Content-Encoding'))
+
+        response = HttpResponse(PAYLOAD)
+        response['Content-Encoding'] = 'identity'
+        res = self.process(response)
+        self.assertEqual(res.content, PAYLOAD)
+
+    def test_compress_streaming_response(self):
+        """Test streaming responses are compressed chunk by chunk"""
+        chunks = [PAYLOAD[i:i + 500] for i in range(0, len(PAYLOAD), 500)]
+        res = self.process(StreamingHttpResponse(iter(chunks)))
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertFalse(res.has_header('Content-Length'))
+        self.assertEqual(
+            gzip.decompress(b''.join(res.streaming_content)), PAYLOAD
+        )
+
+    def test_benchmark_compression(self):
+        """Test benchmark reports every level of requested encoding"""
+        out = StringIO()
+        call_command(
+            'benchmark_compression', encoding=['gzip'], recipes=50,
+            repeat=1, chunk_size=1000, stdout=out
+        )
+
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([row['level'] for row in rows], [1, 6, 9])
+        self.assertTrue(all(row['ratio'] > 1 for row in rows))
+
+
+class ProfilingMiddlewareTests(TestCase):
+
+    def setUp(self):
+        self.staff = get_user_model().objects.create_user(
+            'staff@naveen.com', 'pw', is_staff=True
+        )
+        self.user = get_user_model().objects.create_user(
+            'test@naveen.com', 'pw'
+        )
+        Tag.objects.create(user=self.staff, name='Vegan')
+        self.client = APIClient()
+
+    def get_tags(self, user, **headers):
+        token = issue(user)
+        return self.client.get(
+            reverse('recipe:tag-list'),
+            HTTP_AUTHORIZATION=f'Token {token.key}',
+            **headers
+        )
+
+    def test_not_profiled_by_default(self):
+        """Test requests without the header are not profiled"""
+        res = self.get_tags(self.staff)
+
+        self.assertNotIn('X-Profile-Id', res)
+        self.assertFalse(RequestProfile.objects.exists())
+
+    def test_staff_header_profiles_request(self):
+        """Test staff get the call graph and SQL of a request"""
+        res = self.get_tags(self.staff, HTTP_X_PROFILE='1')
+
+        profile = RequestProfile.objects.get(pk=res['X-Profile-Id'])
+        self.assertEqual(profile.user, self.staff)
+        self.assertEqual(profile.path, reverse('recipe:tag-list'))
+        self.assertEqual(profile.status_code, 200)
+        self.assertIn('function calls', profile.summary)
+        stats = marshal.loads(bytes(profile.stats))
+        self.assertTrue(any(
+            name == 'list' for filename, line, name in stats
+        ))
+
+        queries = json.loads(profile.queries)
+        self.assertEqual(profile.sql_count, len(queries))
+        tag_query = [q for q in queries if 'core_tag' in q['sql']][0]
+        self.assertGreaterEqual(tag_query['ms'], 0)
+        self.assertEqual(tag_query['params'], [self.staff.pk])
+        self.assertNotIn('plan', tag_query)
+
+    def test_credential_params_not_stored(self):
+        """Test token keys and emails never end up in a profile"""
+        token = issue(self.staff)
+        res = self.client.get(
+            reverse('recipe:tag-list'),
+            HTTP_AUTHORIZATION=f'Token {token.key}',
+            HTTP_X_PROFILE='1'
+        )
+
+        profile = RequestProfile.objects.get(pk=res['X-Profile-Id'])
+        self.assertNotIn(token.key, profile.queries)
+        self.assertNotIn(self.staff.email, profile.queries)
+        token_query = [
+            q for q in json.loads(profile.queries)
+            if 'core_expiringtoken' in q['sql']
+        ][0]
+        self.assertTrue(token_query['redacted'])
+        self.assertIsNone(token_query['params'])
+
+    def test_provisioning_params_not_stored(self):
+        """Test bulk created users' passwords never end up in a profile"""
+        token = issue(self.staff)
+        res = self.client.post(
+            reverse('user:bulk'),
+            {'users': [{'email': 'new@naveen.com', 'password': 'secret1'}]},
+            format='json',
+            HTTP_AUTHORIZATION=f'Token {token.key}',
+            HTTP_X_PROFILE='1'
+        )
+
+        profile = RequestProfile.objects.get(pk=res['X-Profile-Id'])
+        self.assertNotIn('new@naveen.com', profile.queries)
+        self.assertNotIn('pbkdf2', profile.queries)
+
+    def test_admin_explain_action(self):
+        """Test staff add query plans to a profile from the admin"""
+        res = self.get_tags(self.staff, HTTP_X_PROFILE='1')
+        admin = get_user_model().objects.create_superuser(
+            'admin@naveen.com', 'pw'
+        )
+        self.client.force_login(admin)
+
+        self.client.post(reverse('admin:core_requestprofile_changelist'), {
+            'action': 'explain_queries',
+            '_selected_action': [res['X-Profile-Id']],
+        })
+
+        profile = RequestProfile.objects.get(pk=res['X-Profile-Id'])
+        queries = json.loads(profile.queries)
+        tag_query = [q for q in queries if 'core_tag' in q['sql']][0]
+        self.assertTrue(tag_query['plan'])
+        token_query = [q for q in queries
+                       if 'core_expiringtoken' in q['sql']][0]
+        self.assertIsNone(token_query['plan'])
+
+    def test_old_profiles_purged(self):
+        """Test profiles past retention are deleted"""
+        res = self.get_tags(self.staff, HTTP_X_PROFILE='1')
+        kept = self.get_tags(self.staff, HTTP_X_PROFILE='1')
+        RequestProfile.objects.filter(pk=res['X-Profile-Id']).update(
+            created_at=timezone.now() - timedelta(days=30)
+        )
+
+        self.assertEqual(purge_profiles(), 1)
+        self.assertEqual(
+            list(RequestProfile.objects.values_list('pk', flat=True)),
+            [int(kept['X-Profile-Id'])]
+        )
+
+    def test_purge_profiles_command(self):
+        """Test the command purges profiles past retention in batches"""
+        for n in range(3):
+            self.get_tags(self.staff, HTTP_X_PROFILE='1')
+        RequestProfile.objects.update(
+            created_at=timezone.now() - timedelta(days=30)
+        )
+        out = StringIO()
+
+        call_command('purge_profiles', batch_size=2, stdout=out)
+
+        self.assertIn('3 request profiles purged', out.getvalue())
+        self.assertFalse(RequestProfile.objects.exists())
+
+    def test_header_ignored_for_other_users(self):
+        """Test the header does nothing for users who are not staff"""
+        res = self.get_tags(self.user, HTTP_X_PROFILE='1')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn('X-Profile-Id', res)
+        self.assertFalse(RequestProfile.objects.exists())
+
+    @override_settings(PROFILE_SAMPLE_RATE=1.0)
+    def test_sampled_requests_profiled(self):
+        """Test sampled requests are profiled for any user"""
+        res = self.get_tags(self.user)
+
+        profile = RequestProfile.objects.get(pk=res['X-Profile-Id'])
+        self.assertIsNone(profile.user)
+
+    def test_admin_download(self):
+        """Test staff can download the stats file from the admin"""
+        res = self.get_tags(self.staff, HTTP_X_PROFILE='1')
+        admin = get_user_model().objects.create_superuser(
+            'admin@naveen.com', 'pw'
+        )
+        self.client.force_login(admin)
+        url = reverse(
+            'admin:core_requestprofile_download', args=[res['X-Profile-Id']]
+        )
+
+        res = self.client.get(url)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('.prof', res['Content-Disposition'])
+        self.assertTrue(marshal.loads(res.content))
@@ -74,6 +74,34 @@ class ModelTests(TestCase):
 
         self.assertEqual(str(recipe), recipe.title)
 
+    def test_recipe_count_follows_recipe_changes(self):
+        """Test tag and ingredient recipe counts are kept up to date"""
+        user = sample_user()
+        tag = models.Tag.objects.create(user=user, name='Vegan')
+        ingredient = models.Ingredient.objects.create(user=user, name='Kale')
+        recipes = [
+            models.Recipe.objects.create(
+                user=user, title=title, time_miniutes=5, price=5.00
+            )
+            for title in ('Salad', 'Soup')
+        ]
+        tag.recipe_set.add(*recipes)
+        for recipe in recipes:
+            recipe.ingredients.add(ingredient)
+
+        tag.refresh_from_db()
+        ingredient.refresh_from_db()
+        self.assertEqual(tag.recipe_count, 2)
+        self.assertEqual(ingredient.recipe_count, 2)
+
+        recipes[0].tags.clear()
+        recipes[1].delete()
+
+        tag.refresh_from_db()
+        ingredient.refresh_from_db()
+        self.assertEqual(tag.recipe_count, 0)
+        self.assertEqual(ingredient.recipe_count, 1)
+
     @patch('uuid.uuid4')
     def test_recipe_file_name_uuid(self, mock_uuid):
         """Test that image is saved in correct location"""
@@ -0,0 +1,104 @@
+import json
+from datetime import datetime
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest.mock import patch
+
+import msgpack
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from core.models import Tag
+from core.parsers import MessagePackParser
+from core.renderers import FastJSONRenderer, MessagePackRenderer
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+DATA = {
+    'title': 'Caf\u00e9 au lait\u2028',
+    'price': Decimal('5.50'),
+    'created': datetime(2020, 1, 1, 12, 30),
+    'tags': (1, 2),
+    7: None,
+}
+
+
+class RendererTests(TestCase):
+
+    def test_fast_json_matches_json(self):
+        """Test fast renderer output is the same as DRF's JSON"""
+        expected = JSONRenderer().render(DATA)
+
+        self.assertEqual(FastJSONRenderer().render(DATA), expected)
+        with patch('core.renderers.orjson', None):
+            self.assertEqual(FastJSONRenderer().render(DATA), expected)
+
+    def test_fast_json_indent(self):
+        """Test indented output asked by the client is honoured"""
+        content = FastJSONRenderer().render(
+            {'id': 1}, 'application/json; indent=2'
+        )
+
+        self.assertEqual(content, b'{\n  "id": 1\n}')
+
+    def test_msgpack_round_trip(self):
+        """Test msgpack renders what DRF's JSON would and parses back"""
+        data = {key: DATA[key] for key in ('title', 'price', 'created')}
+        content = MessagePackRenderer().render(data)
+
+        self.assertEqual(
+            MessagePackParser().parse(BytesIO(content)),
+            json.loads(JSONRenderer().render(data))
+        )
+
+    def test_msgpack_parse_error(self):
+        """Test invalid msgpack bodies are rejected"""
+        with self.assertRaises(ParseError):
+            MessagePackParser().parse(BytesIO(b'\xc1'))
+
+    def test_recipe_api_msgpack(self):
+        """Test recipes can be created and listed with msgpack"""
+        user = get_user_model().objects.create_user('test@naveen.com', 'pw')
+        tag = Tag.objects.create(user=user, name='Breakfast')
+        client = APIClient()
+        client.force_authenticate(user)
+        payload = {
+            'title': 'Toast',
+            'time_miniutes': 5,
+            'price': '2.00',
+            'tags': [tag.id],
+            'ingredients': [],
+        }
+
+        res = client.post(RECIPES_URL, payload, format='msgpack')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        res = client.get(RECIPES_URL, HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(res['Content-Type'], 'application/msgpack')
+        recipes = msgpack.unpackb(res.content, raw=False)
+        self.assertEqual(recipes[0]['title'], 'Toast')
+        self.assertEqual(recipes[0]['price'], '2.00')
+        self.assertEqual(recipes[0]['tags'], [tag.id])
+
+    def test_benchmark_renderers(self):
+        """Test benchmark reports every format"""
+        out = StringIO()
+        call_command(
+            'benchmark_renderers', recipes=20, repeat=1, stdout=out
+        )
+
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(
+            [row['format'] for row in rows], ['json', 'fast-json', 'msgpack']
+        )
+        self.assertTrue(all(row['items'] == 20 for row in rows))
+        self.assertLess(rows[2]['bytes'], rows[0]['bytes'])
@@ -0,0 +1,167 @@
+from io import StringIO
+from unittest import skipIf
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, RecipeSummary, Tag, UserShard
+from core.sharding import (
+    ShardUnresolved,
+    db_for_user,
+    hash_shard,
+    id_space_start
+)
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+SHARDS = [alias for alias in settings.DATABASES if alias != 'default']
+
+
+class HashShardTests(TestCase):
+
+    @override_settings(SHARD_DATABASES=['default', 'shard1', 'shard2'])
+    def test_hash_shard_is_stable(self):
+        """Test users hash to the same shard in every process"""
+        self.assertEqual(
+            [hash_shard(pk) for pk in range(1, 6)],
+            ['shard2', 'shard1', 'shard1', 'shard1', 'shard1']
+        )
+        self.assertEqual(
+            {hash_shard(pk) for pk in range(1, 100)},
+            {'default', 'shard1', 'shard2'}
+        )
+
+    def test_id_space_start(self):
+        """Test shards restart their ids in their own residue class"""
+        self.assertEqual(id_space_start(0, 1, 16), 17)
+        self.assertEqual(id_space_start(40, 3, 16), 51)
+        self.assertEqual(id_space_start(51, 3, 16), 67)
+
+    def test_new_user_placed(self):
+        """Test new users get a shard lookup row"""
+        user = get_user_model().objects.create_user('test@naveen.com', 'pw')
+
+        self.assertEqual(user.shard.alias, hash_shard(user.pk))
+        self.assertFalse(user.shard.moving)
+
+    @override_settings(SHARD_DATABASES=['default', 'shard1'])
+    def test_unresolved_query_refused(self):
+        """Test sharded queries without a user or shard raise"""
+        with self.assertRaises(ShardUnresolved):
+            Tag.objects.count()
+
+    @override_settings(SHARD_DATABASES=['default', 'shard1'])
+    def test_user_lookup_picks_shard(self):
+        """Test filtering by user routes to that user's shard"""
+        user = get_user_model().objects.create_user('test@naveen.com', 'pw')
+
+        self.assertEqual(Tag.objects.filter(user=user).db, hash_shard(user.pk))
+        self.assertEqual(
+            Tag.objects.filter(user_id=user.pk, name='Vegan').db,
+            hash_shard(user.pk)
+        )
+
+
+@skipIf(not SHARDS, 'Needs a second database, set DB_SHARDS')
+class ShardingTests(TestCase):
+    multi_db = True
+
+    def setUp(self):
+        cache.clear()
+        self.shard = SHARDS[0]
+        self.client = APIClient()
+
+    def create_user(self, alias):
+        with override_settings(SHARD_DATABASES=[alias]):
+            user = get_user_model().objects.create_user(
+                f'{alias}@naveen.com', 'pw'
+            )
+        self.client.force_authenticate(user)
+        return user
+
+    def test_user_rows_routed_to_shard(self):
+        """Test API reads and writes go to the user's shard"""
+        user = self.create_user(self.shard)
+
+        res = self.client.post(TAGS_URL, {'name': 'Vegan'})
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        res = self.client.post(RECIPES_URL, {
+            'title': 'Salad',
+            'time_miniutes': 5,
+            'price': '5.00',
+            'tags': [res.data['id']],
+            'ingredients': []
+        }, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        self.assertFalse(Recipe.objects.using('default').exists())
+        recipe = Recipe.objects.using(self.shard).get(user=user)
+        self.assertEqual(recipe.tags.get().name, 'Vegan')
+        self.assertEqual(recipe.tags.get().recipe_count, 1)
+        self.assertTrue(
+            RecipeSummary.objects.using(self.shard).filter(user=user).exists()
+        )
+
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual([r['title'] for r in res.data], ['Salad'])
+
+    def test_rebalance_user(self):
+        """Test a user's rows move to another shard with their relations"""
+        user = self.create_user('default')
+        tag = Tag.objects.create(user=user, name='Vegan')
+        recipe = Recipe.objects.create(
+            user=user, title='Salad', time_miniutes=5, price=5.00
+        )
+        recipe.tags.add(tag)
+
+        out = StringIO()
+        call_command(
+            'rebalance_user', user.email, self.shard, grace=0, stdout=out
+        )
+
+        self.assertIn('8 rows', out.getvalue())
+        self.assertEqual(db_for_user(user.pk), self.shard)
+        self.assertEqual(UserShard.objects.get(user=user).alias, self.shard)
+        self.assertFalse(Recipe.objects.using('default').exists())
+        self.assertFalse(Tag.objects.using('default').exists())
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.data[0]['id'], recipe.id)
+        self.assertEqual(res.data[0]['tags'], [tag.id])
+
+    def test_deleted_user_rows_removed_from_shard(self):
+        """Test deleting a user directly also deletes their shard's rows"""
+        user = self.create_user(self.shard)
+        tag = Tag.objects.create(user=user, name='Vegan')
+        recipe = Recipe.objects.create(
+            user=user, title='Salad', time_miniutes=5, price=5.00
+        )
+        recipe.tags.add(tag)
+
+        user.delete()
+
+        self.assertFalse(Tag.objects.using(self.shard).exists())
+        self.assertFalse(Recipe.objects.using(self.shard).exists())
+        self.assertFalse(
+            RecipeSummary.objects.using(self.shard).exists()
+        )
+
+    def test_writes_refused_while_moving(self):
+        """Test a moving user can read but not write"""
+        user = self.create_user('default')
+        UserShard.objects.filter(user=user).update(moving=True)
+        cache.clear()
+
+        res = self.client.post(TAGS_URL, {'name': 'Vegan'})
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertIn('Retry-After', res)
+
+        res = self.client.get(TAGS_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
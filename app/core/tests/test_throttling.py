@@ -0,0 +1,135 @@
+import json
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.throttling import consume, parse_rate
+
+
+TOKEN_URL = reverse('user:token')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+class ThrottlingTests(TestCase):
+
+    def setUp(self):
+        self.cache = caches['throttle']
+        self.cache.clear()
+        self.client = APIClient()
+
+    def test_parse_rate(self):
+        """Test rates are parsed to capacity and period in seconds"""
+        self.assertEqual(parse_rate('20/min'), (20, 60))
+        self.assertEqual(parse_rate('5/s'), (5, 1))
+        self.assertEqual(parse_rate('100/day'), (100, 86400))
+
+    def test_bucket_drains_and_refills(self):
+        """Test a bucket allows a burst of capacity then refills"""
+        with patch('core.throttling.time.time', return_value=1000):
+            results = [consume(self.cache, 'bucket', 1000, 3)
+                       for i in range(4)]
+        self.assertEqual(
+            [allowed for allowed, wait in results],
+            [True, True, True, False]
+        )
+        self.assertEqual(results[-1][1], 1000)
+
+        with patch('core.throttling.time.time', return_value=1001):
+            self.assertTrue(consume(self.cache, 'bucket', 1000, 3)[0])
+            self.assertFalse(consume(self.cache, 'bucket', 1000, 3)[0])
+
+        with patch('core.throttling.time.time', return_value=2000):
+            results = [consume(self.cache, 'bucket', 1000, 3)
+                       for i in range(4)]
+        self.assertEqual(
+            [allowed for allowed, wait in results],
+            [True, True, True, False]
+        )
+
+    def test_idle_gap_applied_once(self):
+        """Test requests after an idle period do not push the bucket ahead"""
+        with patch('core.throttling.time.time', return_value=1000):
+            consume(self.cache, 'bucket', 1000, 3)
+        with patch('core.throttling.time.time', return_value=4600):
+            self.assertTrue(consume(self.cache, 'bucket', 1000, 3)[0])
+            self.assertTrue(consume(self.cache, 'bucket', 1000, 3)[0])
+            self.assertEqual(self.cache.get('bucket'), 4602000)
+        with patch('core.throttling.time.time', return_value=4660):
+            self.assertEqual(consume(self.cache, 'bucket', 1000, 3), (True, 0))
+
+    def test_bucket_key_expires_once_full(self):
+        """Test bucket keys get a timeout instead of living forever"""
+        with patch.object(self.cache, 'set', wraps=self.cache.set) as set_:
+            consume(self.cache, 'bucket', 1000, 3)
+        self.assertEqual(set_.call_args[0][2], 2)
+
+    def test_busy_lock_rejects_request(self):
+        """Test a bucket whose lock is taken rejects without waiting"""
+        self.cache.add('bucket:lock', 1, 60)
+        self.assertEqual(
+            consume(self.cache, 'bucket', 1000, 3), (False, 1000)
+        )
+        self.assertIsNone(self.cache.get('bucket'))
+
+    @override_settings(REST_FRAMEWORK={
+        'DEFAULT_THROTTLE_RATES': {'login': '2/min', 'list': '600/min'}
+    })
+    def test_login_throttled_per_ip(self):
+        """Test token requests beyond the login budget are rejected"""
+        payload = {'email': 'test@naveen.com', 'password': 'wrong'}
+        for i in range(2):
+            res = self.client.post(TOKEN_URL, payload)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.post(TOKEN_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', res)
+        out = StringIO()
+        call_command('throttle_stats', stdout=out)
+        self.assertEqual(
+            json.loads(out.getvalue()), {'login': 1, 'list': 0}
+        )
+
+    @override_settings(REST_FRAMEWORK={
+        'DEFAULT_THROTTLE_RATES': {'login': '2/min'}, 'NUM_PROXIES': 0
+    })
+    def test_forwarded_for_ignored_without_proxies(self):
+        """Test clients cannot dodge the login budget with X-Forwarded-For"""
+        payload = {'email': 'test@naveen.com', 'password': 'wrong'}
+        codes = [
+            self.client.post(
+                TOKEN_URL, payload, HTTP_X_FORWARDED_FOR=f'10.0.0.{n}'
+            ).status_code
+            for n in range(3)
+        ]
+
+        self.assertEqual(codes[-1], status.HTTP_429_TOO_MANY_REQUESTS)
+
+    @override_settings(REST_FRAMEWORK={
+        'DEFAULT_THROTTLE_RATES': {'list': '1/min', 'write': '10/min'}
+    })
+    def test_list_throttled_per_user(self):
+        """Test list budget is kept per user and apart from writes"""
+        users = [
+            get_user_model().objects.create_user(f'user{i}@naveen.com', 'pw')
+            for i in range(2)
+        ]
+        for user in users:
+            self.client.force_authenticate(user)
+            res = self.client.get(RECIPES_URL)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+        res = self.client.post(RECIPES_URL, {})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
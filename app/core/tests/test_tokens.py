@@ -0,0 +1,168 @@
+import json
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import jobs
+from core.models import ExpiringToken, Job, TokenEvent
+from core.tokens import issue, purge_expired, renew, token_stats
+
+
+ME_URL = reverse('user:me')
+TOKEN_URL = reverse('user:token')
+
+
+@override_settings(TOKEN_TTL=3600, TOKEN_RENEW_INTERVAL=600)
+class ExpiringTokenTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        caches['throttle'].clear()
+        self.user = get_user_model().objects.create_user(
+            'test@naveen.com', 'test123'
+        )
+        self.client = APIClient()
+
+    def expire(self, token, ago=1):
+        token.expires_at = timezone.now() - timedelta(seconds=ago)
+        token.save()
+
+    def test_login_issues_expiring_token(self):
+        """Test logging in returns a token and when it expires"""
+        res = self.client.post(TOKEN_URL, {
+            'email': 'test@naveen.com', 'password': 'test123'
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        token = ExpiringToken.objects.get(user=self.user)
+        self.assertEqual(res.data['token'], token.key)
+        self.assertEqual(res.data['expires_at'], token.expires_at)
+        self.assertAlmostEqual(
+            (token.expires_at - timezone.now()).total_seconds(), 3600,
+            delta=5
+        )
+
+    def test_expired_token_refused(self):
+        """Test expired tokens no longer authenticate"""
+        token = issue(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.assertEqual(self.client.get(ME_URL).status_code, 200)
+
+        self.expire(token)
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        # Counted in the throttle cache, clients cannot force row writes
+        self.assertFalse(TokenEvent.objects.filter(event='rejected').exists())
+        self.assertEqual(token_stats()['rejected'], 1)
+
+    def test_login_replaces_expired_token(self):
+        """Test a new key is issued once the previous one expired"""
+        token = issue(self.user)
+        self.assertEqual(issue(self.user).key, token.key)
+
+        self.expire(token)
+
+        self.assertNotEqual(issue(self.user).key, token.key)
+        self.assertEqual(ExpiringToken.objects.count(), 1)
+
+    def test_sliding_renewal(self):
+        """Test tokens in use are renewed once per renew interval"""
+        token = issue(self.user)
+        start = token.expires_at
+        now = timezone.now()
+
+        self.assertFalse(renew(token, now + timedelta(seconds=60)))
+        self.assertTrue(renew(token, now + timedelta(seconds=900)))
+
+        token.refresh_from_db()
+        self.assertGreaterEqual(
+            token.expires_at - start, timedelta(seconds=900)
+        )
+
+    def test_renewed_through_api(self):
+        """Test authenticating with a token slides its expiry"""
+        token = issue(self.user)
+        ExpiringToken.objects.filter(pk=token.pk).update(
+            expires_at=timezone.now() + timedelta(seconds=60)
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+        self.client.get(ME_URL)
+
+        token.refresh_from_db()
+        self.assertGreater(
+            token.expires_at, timezone.now() + timedelta(seconds=3000)
+        )
+
+    def create_tokens(self, count, expired):
+        users = [
+            get_user_model().objects.create_user(f'user{n}@naveen.com')
+            for n in range(count)
+        ]
+        for user in users:
+            token = issue(user)
+            if expired:
+                self.expire(token, ago=count)
+        return users
+
+    def test_purge_expired_in_batches(self):
+        """Test expired tokens are deleted a bounded batch at a time"""
+        self.create_tokens(5, expired=True)
+        valid = issue(self.user)
+
+        self.assertEqual(purge_expired(batch_size=2), 2)
+        self.assertEqual(purge_expired(batch_size=2), 2)
+        self.assertEqual(purge_expired(batch_size=2), 1)
+        self.assertEqual(purge_expired(batch_size=2), 0)
+        self.assertEqual(list(ExpiringToken.objects.all()), [valid])
+
+    def test_purge_job_requeues(self):
+        """Test the purge job queues itself until no batch is full"""
+        self.create_tokens(3, expired=True)
+
+        jobs.enqueue('core.purge_tokens', {'batch_size': 2})
+        call_command('run_worker', once=True, pool='inline', stdout=StringIO())
+
+        self.assertFalse(ExpiringToken.objects.exists())
+        self.assertEqual(
+            Job.objects.filter(name='core.purge_tokens').count(), 2
+        )
+
+    def test_purge_tokens_command(self):
+        """Test the command purges every expired token"""
+        self.create_tokens(3, expired=True)
+        issue(self.user)
+        out = StringIO()
+
+        call_command('purge_tokens', batch_size=2, stdout=out)
+
+        self.assertIn('3 expired tokens purged', out.getvalue())
+        self.assertEqual(ExpiringToken.objects.count(), 1)
+
+    def test_token_stats(self):
+        """Test table size and churn counters are reported"""
+        self.create_tokens(2, expired=True)
+        issue(self.user)
+        purge_expired(batch_size=1)
+        # Counters are kept in the database, not a worker's local cache
+        cache.clear()
+        out = StringIO()
+
+        call_command('token_stats', stdout=out)
+
+        stats = json.loads(out.getvalue())
+        self.assertEqual(stats['total'], 2)
+        self.assertEqual(stats['expired'], 1)
+        self.assertEqual(stats['expiring_24h'], 1)
+        self.assertEqual(stats['issued'], 3)
+        self.assertEqual(stats['purged'], 1)
@@ -0,0 +1,131 @@
+import logging
+import math
+import time
+
+from django.core.cache import caches
+
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+
+logger = logging.getLogger(__name__)
+
+THROTTLE_CACHE = 'throttle'
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+LOCK_TIMEOUT = 1
+
+
+def parse_rate(rate):
+    """Return (capacity, period in seconds) of a rate such as '20/min'"""
+    num, period = rate.split('/')
+    return int(num), PERIODS[period[0]]
+
+
+def consume(cache, key, interval, capacity):
+    """Take a token from the bucket at key, return (allowed, wait ms)
+
+    The bucket is stored as its theoretical arrival time (GCRA). Moving
+    it to max(arrival, now) + interval is a read-modify-write, done
+    under a short lock so concurrent workers sharing the cache cannot
+    both apply an idle gap. A request finding the lock taken is
+    rejected rather than waiting, as only a client racing its own
+    requests keeps it busy. The key expires once the bucket is full.
+    """
+    lock = f'{key}:lock'
+    # Lock timeout bounds the damage of a worker dying holding it
+    if not cache.add(lock, 1, LOCK_TIMEOUT):
+        return False, interval
+
+    try:
+        now = int(time.time() * 1000)
+        arrival = max(cache.get(key) or now, now) + interval
+        wait = arrival - now - interval * capacity
+        if wait > 0:
+            # Rejected requests do not use up tokens
+            return False, wait
+        cache.set(key, arrival, math.ceil((arrival - now) / 1000) + 1)
+        return True, 0
+    finally:
+        cache.delete(lock)
+
+
+def incr_counter(key):
+    """Add one to the never expiring counter at key of the throttle cache"""
+    cache = caches[THROTTLE_CACHE]
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, 1, None)
+
+
+def record_throttled(scope):
+    """Count a throttled request of scope"""
+    incr_counter(f'throttle:stats:{scope}')
+
+
+def throttle_stats():
+    """Return number of throttled requests per scope"""
+    rates = api_settings.DEFAULT_THROTTLE_RATES
+    counts = caches[THROTTLE_CACHE].get_many(
+        [f'throttle:stats:{scope}' for scope in rates]
+    )
+    return {
+        scope: counts.get(f'throttle:stats:{scope}', 0) for scope in rates
+    }
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Token bucket throttle kept in the shared throttle cache
+
+    Budgets come from DEFAULT_THROTTLE_RATES. The scope is the view's
+    throttle_scope, or derived from the request: 'upload' for image
+    uploads, 'list' for reads and 'write' for everything else.
+    """
+
+    def get_scope(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        if scope:
+            return scope
+        if getattr(view, 'action', None) == 'upload_image':
+            return 'upload'
+        return 'list' if request.method in SAFE_METHODS else 'write'
+
+    def get_cache_key(self, request, view):
+        raise NotImplementedError('.get_cache_key() must be overridden')
+
+    def allow_request(self, request, view):
+        scope = self.get_scope(request, view)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope)
+        if rate is None:
+            return True
+
+        capacity, period = parse_rate(rate)
+        key = f'throttle:{scope}:{self.get_cache_key(request, view)}'
+        allowed, self.wait_ms = consume(
+            caches[THROTTLE_CACHE], key, period * 1000 // capacity, capacity
+        )
+        if not allowed:
+            logger.info('Throttled %s request on %s', scope, key)
+            record_throttled(scope)
+        return allowed
+
+    def wait(self):
+        return self.wait_ms / 1000
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    """Token bucket per authenticated user, per IP for anonymous users"""
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+        return f'ip:{self.get_ident(request)}'
+
+
+class IPTokenBucketThrottle(TokenBucketThrottle):
+    """Token bucket per client IP address"""
+
+    def get_cache_key(self, request, view):
+        return f'ip:{self.get_ident(request)}'
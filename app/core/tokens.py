@@ -0,0 +1,123 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core.models import ExpiringToken, TokenEvent
+from core.paginator import count_queryset
+from core.purging import delete_oldest
+from core.throttling import THROTTLE_CACHE, incr_counter
+
+
+STAT_EVENTS = ('issued', 'renewed', 'rejected', 'purged')
+REJECTED_KEY = 'tokens:stats:rejected'
+
+
+def record(event, count=1):
+    """Add count to the token event counter of event, shared by workers"""
+    counter = TokenEvent.objects.filter(event=event)
+    if not counter.update(count=F('count') + count):
+        try:
+            with transaction.atomic():
+                TokenEvent.objects.create(event=event, count=count)
+        except IntegrityError:
+            counter.update(count=F('count') + count)
+
+
+def record_rejected():
+    """Count a request made with an expired token
+
+    Unauthenticated clients choose how often this happens, so it goes to
+    the shared throttle cache instead of a contended database row.
+    """
+    incr_counter(REJECTED_KEY)
+
+
+def lifetime():
+    return timedelta(seconds=settings.TOKEN_TTL)
+
+
+def renew(token, now=None):
+    """Slide the expiry of a token in use, at most once per interval
+
+    Renewing on every request would turn each read into a write, so
+    tokens renewed less than TOKEN_RENEW_INTERVAL ago are left alone.
+    """
+    now = now or timezone.now()
+    expires_at = now + lifetime()
+    interval = timedelta(seconds=settings.TOKEN_RENEW_INTERVAL)
+    if expires_at - token.expires_at < interval:
+        return False
+    ExpiringToken.objects.filter(pk=token.pk).update(expires_at=expires_at)
+    token.expires_at = expires_at
+    record('renewed')
+    return True
+
+
+def issue(user):
+    """Return user's token, replacing it with a new one once expired"""
+    now = timezone.now()
+    token = ExpiringToken.objects.filter(user=user).first()
+    if token is not None and token.expires_at > now:
+        renew(token, now)
+        return token
+    try:
+        with transaction.atomic():
+            ExpiringToken.objects.filter(user=user).delete()
+            token = ExpiringToken.objects.create(
+                user=user, expires_at=now + lifetime()
+            )
+    except IntegrityError:
+        # A concurrent login issued one first
+        return ExpiringToken.objects.get(user=user)
+    record('issued')
+    return token
+
+
+def issue_many(users):
+    """Create tokens of new users in bulk, return {user id: key}"""
+    expires_at = timezone.now() + lifetime()
+    tokens = [ExpiringToken(user=user, expires_at=expires_at)
+              for user in users]
+    for token in tokens:
+        token.key = token.generate_key()
+    ExpiringToken.objects.bulk_create(
+        tokens, batch_size=settings.USER_PROVISION_BATCH_SIZE
+    )
+    record('issued', len(tokens))
+    return {token.user_id: token.key for token in tokens}
+
+
+def purge_expired(batch_size=None, now=None):
+    """Delete one batch of expired tokens, return the number deleted"""
+    batch_size = batch_size or settings.TOKEN_PURGE_BATCH_SIZE
+    now = now or timezone.now()
+    deleted = delete_oldest(
+        ExpiringToken.objects.filter(expires_at__lte=now),
+        'expires_at', batch_size
+    )
+    if deleted:
+        record('purged', deleted)
+    return deleted
+
+
+def token_stats():
+    """Return token table size, expired rows and event counters"""
+    now = timezone.now()
+    total, exact = count_queryset(ExpiringToken.objects.all())
+    stats = {
+        'total': total,
+        'exact': exact,
+        'expired': ExpiringToken.objects.filter(expires_at__lte=now).count(),
+        'expiring_24h': ExpiringToken.objects.filter(
+            expires_at__gt=now, expires_at__lte=now + timedelta(days=1)
+        ).count(),
+    }
+    counts = dict(TokenEvent.objects.values_list('event', 'count'))
+    for event in STAT_EVENTS:
+        stats[event] = counts.get(event, 0)
+    stats['rejected'] += caches[THROTTLE_CACHE].get(REJECTED_KEY, 0)
+    return stats
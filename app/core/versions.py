@@ -0,0 +1,83 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+
+
+VERSIONS_CACHE = 'versions'
+
+
+def _version_key(namespace, user_id):
+    return f'version:{namespace}:{user_id}'
+
+
+def get_version(namespace, user_id):
+    """Return current version of user's data in given namespace"""
+    cache = caches[VERSIONS_CACHE]
+    key = _version_key(namespace, user_id)
+    version = cache.get(key)
+    if version is None:
+        # Start from a timestamp so that an evicted version never
+        # goes back to a value some process has already cached
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(namespace, user_id):
+    """Invalidate everything cached for user's data in given namespace"""
+    key = _version_key(namespace, user_id)
+    try:
+        return caches[VERSIONS_CACHE].incr(key)
+    except ValueError:
+        return get_version(namespace, user_id)
+
+
+class LocalIndexCache:
+    """Process local LRU of per user indexes checked against versions
+
+    Indexes are any objects with a ``version`` attribute, they are
+    rebuilt on access once the user's version has moved on.
+    """
+
+    def __init__(self, max_users_setting):
+        self.max_users_setting = max_users_setting
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def peek(self, namespace, user_id):
+        """Return cached index without checking its version"""
+        with self._lock:
+            index = self._indexes.get((namespace, user_id))
+            if index is not None:
+                self._indexes.move_to_end((namespace, user_id))
+            return index
+
+    def put(self, namespace, user_id, index):
+        max_users = getattr(settings, self.max_users_setting)
+        with self._lock:
+            self._indexes[(namespace, user_id)] = index
+            self._indexes.move_to_end((namespace, user_id))
+            while len(self._indexes) > max_users:
+                self._indexes.popitem(last=False)
+
+    def discard(self, namespace, user_id):
+        with self._lock:
+            self._indexes.pop((namespace, user_id), None)
+
+    def get(self, namespace, user_id, build, using=None):
+        """Return current index, calling build(version) when stale
+
+        An index built inside a transaction on using is not kept, it may
+        hold rows that roll back without a version bump.
+        """
+        version = get_version(namespace, user_id)
+        index = self.peek(namespace, user_id)
+        if index is None or index.version != version:
+            index = build(version)
+            if using is None or not connections[using].in_atomic_block:
+                self.put(namespace, user_id, index)
+        return index
@@ -0,0 +1,72 @@
+import heapq
+from bisect import bisect_left
+
+from django.conf import settings
+
+from core.sharding import db_for_user
+from core.versions import LocalIndexCache
+
+
+_indexes = LocalIndexCache('AUTOCOMPLETE_INDEX_MAX_USERS')
+
+
+class PrefixIndex:
+    """Case insensitive sorted name index of a user's tags or ingredients"""
+
+    def __init__(self, version, rows, fallback=False):
+        self.version = version
+        self.fallback = fallback
+        self.rows = sorted(rows, key=lambda row: row['name'].lower())
+        self.keys = [row['name'].lower() for row in self.rows]
+
+    def search(self, prefix, limit):
+        """Return most used rows whose name starts with prefix"""
+        prefix = prefix.lower()
+        start = bisect_left(self.keys, prefix)
+        end = len(self.keys)
+        if prefix:
+            end = bisect_left(
+                self.keys, prefix[:-1] + chr(ord(prefix[-1]) + 1), start
+            )
+
+        return heapq.nsmallest(
+            limit,
+            self.rows[start:end],
+            key=lambda row: (-row['recipe_count'], row['name'])
+        )
+
+
+def _query(model, user, prefix, limit):
+    return list(
+        model.objects.filter(
+            user=user, name__istartswith=prefix
+        ).order_by('-recipe_count', 'name').values(
+            'id', 'name', 'recipe_count'
+        )[:limit]
+    )
+
+
+def _build_index(model, user, version):
+    max_size = settings.AUTOCOMPLETE_INDEX_MAX_SIZE
+    rows = list(
+        model.objects.filter(user=user).values(
+            'id', 'name', 'recipe_count'
+        )[:max_size + 1]
+    )
+    if len(rows) > max_size:
+        # Too large to keep in memory, leave lookups to the database
+        return PrefixIndex(version, [], fallback=True)
+    return PrefixIndex(version, rows)
+
+
+def lookup(model, user, prefix, limit):
+    """Return top matching tags or ingredients for autocomplete"""
+    index = _indexes.get(
+        model._meta.model_name,
+        user.pk,
+        lambda version: _build_index(model, user, version),
+        using=db_for_user(user.pk)
+    )
+    if index.fallback:
+        return _query(model, user, prefix, limit)
+    return index.search(prefix, limit)
@@ -0,0 +1,160 @@
+import numpy as np
+from scipy import sparse
+
+from core.models import Recipe
+
+
+RELATIONS = ('ingredient', 'tag')
+
+
+def _pairs(relation, user):
+    through = getattr(Recipe, f'{relation}s').through
+    pairs = through.objects.filter(recipe__user=user).values_list(
+        'recipe_id', f'{relation}_id'
+    )
+    return np.array(list(pairs), dtype=np.int64).reshape(-1, 2)
+
+
+class RecipeFeatureIndex:
+    """Sparse recipe by ingredient and tag incidence matrix of one user
+
+    Columns hold the user's ingredients followed by the user's tags, so a
+    row is the feature set of a recipe and overlaps between one recipe
+    and every other one come out of a single sparse product.
+    """
+
+    def __init__(self, version, recipe_ids, pairs):
+        self.version = version
+        self.recipe_ids = np.unique(np.concatenate(
+            [recipe_ids] + [pairs[relation][:, 0] for relation in RELATIONS]
+        ))
+        self.feature_ids = {
+            relation: np.unique(pairs[relation][:, 1])
+            for relation in RELATIONS
+        }
+        self.offsets = {'ingredient': 0}
+        self.offsets['tag'] = len(self.feature_ids['ingredient'])
+        self.shape = (
+            len(self.recipe_ids),
+            self.offsets['tag'] + len(self.feature_ids['tag'])
+        )
+
+        rows, cols = self._positions(pairs)
+        self.matrix = sparse.csr_matrix(
+            (np.ones(len(rows)), (rows, cols)), shape=self.shape
+        )
+        self._update_sizes()
+
+    @classmethod
+    def build(cls, user, version):
+        recipe_ids = np.array(
+            Recipe.objects.filter(user=user).values_list('id', flat=True),
+            dtype=np.int64
+        )
+        pairs = {relation: _pairs(relation, user) for relation in RELATIONS}
+        return cls(version, recipe_ids, pairs)
+
+    def _update_sizes(self):
+        self.sizes = np.asarray(self.matrix.sum(axis=1)).ravel()
+
+    def _lookup(self, ids, values):
+        positions = np.searchsorted(ids, values)
+        found = positions < len(ids)
+        found[found] = ids[positions[found]] == values[found]
+        return positions, found.all()
+
+    def _positions(self, pairs):
+        rows, cols = [], []
+        for relation, relation_pairs in pairs.items():
+            rows.append(
+                np.searchsorted(self.recipe_ids, relation_pairs[:, 0])
+            )
+            cols.append(self.offsets[relation] + np.searchsorted(
+                self.feature_ids[relation], relation_pairs[:, 1]
+            ))
+        return np.concatenate(rows), np.concatenate(cols)
+
+    def apply(self, relation, pairs, sign):
+        """Add (sign=1) or remove (sign=-1) recipe features in place
+
+        Returns False when the change touches a recipe or feature the
+        index does not know about, the index must be rebuilt then.
+        """
+        pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+        rows, known_rows = self._lookup(self.recipe_ids, pairs[:, 0])
+        cols, known_cols = self._lookup(
+            self.feature_ids[relation], pairs[:, 1]
+        )
+        if not (known_rows and known_cols):
+            return False
+
+        delta = sparse.csr_matrix(
+            (np.full(len(rows), sign, dtype=np.float64),
+             (rows, self.offsets[relation] + cols)),
+            shape=self.shape
+        )
+        matrix = self.matrix + delta
+        np.clip(matrix.data, 0, 1, out=matrix.data)
+        matrix.eliminate_zeros()
+        self.matrix = matrix
+        self._update_sizes()
+        return True
+
+    def similar(self, recipe_id, limit, metric='jaccard'):
+        """Return (recipe id, score) of recipes most similar to recipe"""
+        positions, found = self._lookup(
+            self.recipe_ids, np.array([recipe_id], dtype=np.int64)
+        )
+        if not found:
+            return []
+        row = positions[0]
+
+        overlap = self.matrix.dot(self.matrix[row].T).toarray().ravel()
+        if metric == 'cosine':
+            denominator = np.sqrt(self.sizes * self.sizes[row])
+        else:
+            denominator = self.sizes + self.sizes[row] - overlap
+        scores = np.divide(
+            overlap,
+            denominator,
+            out=np.zeros_like(overlap),
+            where=denominator > 0
+        )
+        scores[row] = 0
+
+        candidates = np.flatnonzero(scores > 0)
+        order = np.argsort(-scores[candidates], kind='stable')[:limit]
+        return [
+            (int(self.recipe_ids[i]), float(scores[i]))
+            for i in candidates[order]
+        ]
+
+    def pantry_matches(self, ingredient_ids, max_missing, limit):
+        """Return recipes fully or mostly covered by given ingredients
+
+        Yields (recipe id, missing ingredient ids) ordered by the number
+        of missing ingredients, computed for every recipe at once.
+        """
+        ingredients = self.matrix[:, :self.offsets['tag']]
+        have = np.isin(
+            self.feature_ids['ingredient'],
+            np.asarray(list(ingredient_ids), dtype=np.int64)
+        ).astype(np.float64)
+
+        needed = np.asarray(ingredients.sum(axis=1)).ravel()
+        missing = needed - ingredients.dot(have)
+        candidates = np.flatnonzero((needed > 0) & (missing <= max_missing))
+        order = np.lexsort((
+            self.recipe_ids[candidates], missing[candidates]
+        ))[:limit]
+
+        for row in candidates[order]:
+            start, end = ingredients.indptr[row], ingredients.indptr[row + 1]
+            columns = ingredients.indices[start:end]
+            yield (
+                int(self.recipe_ids[row]),
+                sorted(
+                    int(i) for i in
+                    self.feature_ids['ingredient'][columns[have[columns] == 0]]
+                )
+            )
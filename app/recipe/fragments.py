@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.cache import caches
+
+from core.models import Recipe
+
+
+FRAGMENTS_CACHE = 'fragments'
+
+
+def fragment_key(serializer_class, recipe):
+    """Return cache key of recipe's representation, changed on update"""
+    return 'recipe:{}:{}:{}'.format(
+        serializer_class.__name__,
+        recipe.pk,
+        int(recipe.updated_at.timestamp() * 1000000)
+    )
+
+
+def render(recipes, serializer_class, context=None):
+    """Return representations of recipes, serializing only cache misses
+
+    Recipes only need their id and updated_at loaded. Misses are fetched
+    again with their tags and ingredients, in one batch.
+    """
+    cache = caches[FRAGMENTS_CACHE]
+    keys = [fragment_key(serializer_class, recipe) for recipe in recipes]
+    cached = cache.get_many(keys)
+    by_pk = {
+        recipe.pk: cached[key]
+        for recipe, key in zip(recipes, keys) if key in cached
+    }
+
+    missing = [recipe.pk for recipe in recipes if recipe.pk not in by_pk]
+    if missing:
+        fetched = list(Recipe.objects.filter(
+            pk__in=missing
+        ).prefetch_related('tags', 'ingredients'))
+        serialized = serializer_class(
+            fetched, many=True, context=context
+        ).data
+        fresh = {}
+        for recipe, data in zip(fetched, serialized):
+            by_pk[recipe.pk] = data
+            fresh[fragment_key(serializer_class, recipe)] = data
+        cache.set_many(fresh, settings.RECIPE_FRAGMENT_TIMEOUT)
+
+    # Recipes deleted meanwhile are left out
+    return [by_pk[recipe.pk] for recipe in recipes if recipe.pk in by_pk]
@@ -0,0 +1,131 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.db.models import Q
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from core.paginator import count_queryset
+
+
+class EstimatedCountPagination(LimitOffsetPagination):
+    """Limit/offset pagination with estimated counts for large results
+
+    Like the keyset pagination it only kicks in when a limit is given.
+    """
+    max_limit = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.view = view
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_count(self, queryset):
+        count, self.count_exact = count_queryset(
+            queryset, getattr(self.view, 'get_maintained_count', None)
+        )
+        return count
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('count_exact', self.count_exact),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+
+class KeysetPagination(BasePagination):
+    """Keyset pagination following the ordering given by the view
+
+    Pagination is only applied when the client asks for a limit, so that
+    plain list requests keep returning every object.
+    """
+    limit_query_param = 'limit'
+    cursor_query_param = 'after'
+    max_limit = 100
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params[self.limit_query_param])
+        except KeyError:
+            return None
+        except ValueError:
+            raise ValidationError({self.limit_query_param: 'Invalid limit'})
+        return max(1, min(limit, self.max_limit))
+
+    def encode_cursor(self, obj):
+        values = [str(getattr(obj, field.lstrip('-')))
+                  for field in self.ordering]
+        return base64.urlsafe_b64encode(
+            json.dumps(values).encode()
+        ).decode()
+
+    def decode_cursor(self, queryset, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if len(values) != len(self.ordering):
+                raise ValueError
+            return [
+                queryset.model._meta.get_field(field.lstrip('-')).to_python(
+                    value
+                )
+                for field, value in zip(self.ordering, values)
+            ]
+        except Exception:
+            raise ValidationError({self.cursor_query_param: 'Invalid cursor'})
+
+    def get_keyset_filter(self, values):
+        """Return filter selecting rows after values in ordering"""
+        keyset = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            keyset |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return keyset
+
+    def paginate_queryset(self, queryset, request, view=None):
+        limit = self.get_limit(request)
+        if limit is None:
+            return None
+
+        self.request = request
+        self.ordering = view.get_ordering()
+        self.count, self.count_exact = count_queryset(
+            queryset, getattr(view, 'get_maintained_count', None)
+        )
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(self.get_keyset_filter(
+                self.decode_cursor(queryset, cursor)
+            ))
+
+        page = list(queryset.order_by(*self.ordering)[:limit + 1])
+        self.has_next = len(page) > limit
+        page = page[:limit]
+        self.next_cursor = self.encode_cursor(page[-1]) \
+            if self.has_next else None
+        return page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.next_cursor
+        )
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('count_exact', self.count_exact),
+            ('next', self.get_next_link()),
+            ('results', data)
+        ]))
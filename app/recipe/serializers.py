@@ -1,6 +1,52 @@
 from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS, ManyRelatedField
 
-from core.models import Tag, Ingredient, Recipe
+from core.models import Tag, Ingredient, Recipe, DeletionTask
+
+
+class UserManyRelatedField(ManyRelatedField):
+    '''Many related field resolving all primary keys in one query'''
+    default_error_messages = {
+        'does_not_exist': 'Invalid pk(s) {pk_value} - objects do not exist.',
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+
+        try:
+            pks = list(dict.fromkeys(int(pk) for pk in data))
+        except (TypeError, ValueError):
+            self.child_relation.fail(
+                'incorrect_type', data_type=type(data).__name__
+            )
+
+        objects = self.child_relation.get_queryset().in_bulk(pks)
+        missing = [pk for pk in pks if pk not in objects]
+        if missing:
+            self.fail('does_not_exist', pk_value=missing)
+        return [objects[pk] for pk in pks]
+
+
+class UserPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    '''Primary key field limited to objects of the requesting user'''
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return UserManyRelatedField(**list_kwargs)
+
+    def get_queryset(self):
+        request = self.context.get('request')
+        queryset = super().get_queryset()
+        if request is None:
+            return queryset.none()
+        return queryset.filter(user=request.user)
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -21,13 +67,29 @@ class IngredientSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
+class TagUsageSerializer(TagSerializer):
+    """Serializer for Tag object along with its recipe count"""
+
+    class Meta(TagSerializer.Meta):
+        fields = ('id', 'name', 'recipe_count')
+        read_only_fields = ('id', 'recipe_count')
+
+
+class IngredientUsageSerializer(IngredientSerializer):
+    """Serializer for Ingredient object along with its recipe count"""
+
+    class Meta(IngredientSerializer.Meta):
+        fields = ('id', 'name', 'recipe_count')
+        read_only_fields = ('id', 'recipe_count')
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     '''Serializer for Recipe object'''
-    ingredients = serializers.PrimaryKeyRelatedField(
+    ingredients = UserPrimaryKeyRelatedField(
         many=True,
         queryset=Ingredient.objects.all()
     )
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = UserPrimaryKeyRelatedField(
         many=True,
         queryset=Tag.objects.all()
     )
@@ -54,3 +116,80 @@ class RecipeImageSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = ('id', 'image')
         read_only_fields = ('id',)
+
+
+class TimeBucketSerializer(serializers.Serializer):
+    '''Serializer for a cooking time histogram bucket'''
+    min = serializers.IntegerField()
+    max = serializers.IntegerField(allow_null=True)
+    count = serializers.IntegerField()
+
+
+class RecipeStatsSerializer(serializers.Serializer):
+    '''Serializer for aggregates of user's recipes'''
+    recipe_count = serializers.IntegerField()
+    average_price = serializers.DecimalField(
+        max_digits=12, decimal_places=2, allow_null=True
+    )
+    average_time_miniutes = serializers.FloatField(allow_null=True)
+    time_miniutes_histogram = TimeBucketSerializer(many=True)
+    top_tags = TagUsageSerializer(many=True)
+
+
+class RecipeRelationsSerializer(serializers.Serializer):
+    '''Serializer for adding or removing tags and ingredients in bulk'''
+    op = serializers.ChoiceField(choices=('add', 'remove'))
+    tags = UserPrimaryKeyRelatedField(
+        many=True,
+        queryset=Tag.objects.all(),
+        required=False
+    )
+    ingredients = UserPrimaryKeyRelatedField(
+        many=True,
+        queryset=Ingredient.objects.all(),
+        required=False
+    )
+    recipes = UserPrimaryKeyRelatedField(
+        many=True,
+        queryset=Recipe.objects.all(),
+        required=False
+    )
+
+    def validate(self, attrs):
+        if attrs['op'] == 'add' and not attrs.get('recipes'):
+            raise serializers.ValidationError(
+                {'recipes': 'Recipes are required to add relations.'}
+            )
+        return attrs
+
+    def save(self):
+        '''Apply the operation as one through table statement per object'''
+        recipes = self.validated_data.get('recipes')
+        for field in ('tags', 'ingredients'):
+            for obj in self.validated_data.get(field, []):
+                if self.validated_data['op'] == 'add':
+                    obj.recipe_set.add(*recipes)
+                elif recipes is None:
+                    obj.recipe_set.clear()
+                else:
+                    obj.recipe_set.remove(*recipes)
+
+
+class RecipeBulkDeleteSerializer(serializers.Serializer):
+    '''Serializer for recipes to delete in the background'''
+    recipes = UserPrimaryKeyRelatedField(
+        many=True,
+        queryset=Recipe.objects.all()
+    )
+
+
+class DeletionTaskSerializer(serializers.ModelSerializer):
+    '''Serializer for progress of a background deletion'''
+
+    class Meta:
+        model = DeletionTask
+        fields = (
+            'id', 'target', 'status', 'total', 'deleted',
+            'created_at', 'finished_at'
+        )
+        read_only_fields = fields
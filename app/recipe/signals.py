@@ -0,0 +1,72 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete
+from django.dispatch import receiver
+
+from core.models import Ingredient, Recipe, Tag
+
+from recipe import similarity
+
+
+def record_on_commit(using, user_id, *args):
+    """Record a feature change once committed
+
+    Bumping earlier would let other requests rebuild the index from
+    rows that can still roll back, and keep it past the rollback.
+    """
+    transaction.on_commit(
+        lambda: similarity.record_change(user_id, *args), using=using
+    )
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_features_changed(sender, instance, action, reverse, pk_set,
+                            using, **kwargs):
+    """Keep cached recipe feature matrices in step with m2m changes"""
+    if not action.startswith('post_'):
+        return
+
+    relation = 'tag' if sender is Recipe.tags.through else 'ingredient'
+    if action == 'post_clear' or not pk_set:
+        record_on_commit(using, instance.user_id)
+    elif reverse:
+        record_on_commit(
+            using,
+            instance.user_id,
+            relation,
+            [(recipe_id, instance.pk) for recipe_id in pk_set],
+            1 if action == 'post_add' else -1
+        )
+    else:
+        record_on_commit(
+            using,
+            instance.user_id,
+            relation,
+            [(instance.pk, feature_id) for feature_id in pk_set],
+            1 if action == 'post_add' else -1
+        )
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def recipe_feature_deleted(sender, instance, using, **kwargs):
+    """Drop cached recipe feature matrix of the owner
+
+    Deleting a tag or ingredient removes its recipe links without
+    m2m_changed, so the whole index goes rather than a column.
+    """
+    record_on_commit(using, instance.user_id)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_image_deleted(sender, instance, using, **kwargs):
+    """Remove the image file of a deleted recipe once committed"""
+    if instance.image:
+        delete_file_on_commit(using, instance.image.storage,
+                              instance.image.name)
+
+
+def delete_file_on_commit(using, storage, name):
+    """Delete a stored file once the rows pointing at it are gone"""
+    transaction.on_commit(lambda: storage.delete(name), using=using)
@@ -0,0 +1,34 @@
+from core.versions import LocalIndexCache, bump_version, get_version
+
+
+NAMESPACE = 'recipe_features'
+
+_indexes = LocalIndexCache('RECIPE_INDEX_MAX_USERS')
+
+
+def get_index(user):
+    """Return the current feature index of user's recipes"""
+    # numpy and scipy are only loaded once an index is needed
+    from recipe.features import RecipeFeatureIndex
+    return _indexes.get(
+        NAMESPACE,
+        user.pk,
+        lambda version: RecipeFeatureIndex.build(user, version)
+    )
+
+
+def record_change(user_id, relation=None, pairs=None, sign=0):
+    """Apply a recipe feature change to the local index or invalidate it
+
+    Other processes only see the version bump and rebuild on next use.
+    """
+    index = _indexes.peek(NAMESPACE, user_id)
+    current = index is not None and \
+        index.version == get_version(NAMESPACE, user_id)
+    version = bump_version(NAMESPACE, user_id)
+
+    if current and relation and version == index.version + 1 and \
+            index.apply(relation, pairs, sign):
+        index.version = version
+    else:
+        _indexes.discard(NAMESPACE, user_id)
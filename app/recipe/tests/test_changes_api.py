@@ -0,0 +1,178 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.urls import reverse
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.changes import prune_changes
+from core.models import ChangeLog, Ingredient, Job, Recipe, Tag
+from core.sharding import db_for_user
+
+
+CHANGES_URL = reverse('recipe:changes')
+
+
+class PublicChangesApiTest(TestCase):
+    """Test the change feed requires login"""
+
+    def test_login_required(self):
+        res = APIClient().get(CHANGES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateChangesApiTest(TestCase):
+    """Test the change feed of authenticated users"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@naveen.com',
+            'test123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_cursor(self):
+        res = self.client.get(CHANGES_URL)
+        self.assertEqual(res.data['changes'], [])
+        return res.data['cursor']
+
+    def test_changes_since_cursor(self):
+        """Test changes after the cursor come once with latest state"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        old = Recipe.objects.create(
+            user=self.user, title='Soup', time_miniutes=20, price=3
+        )
+        cursor = self.get_cursor()
+
+        recipe = Recipe.objects.create(
+            user=self.user, title='Salad', time_miniutes=5, price=5
+        )
+        recipe.tags.add(tag)
+        tag.name = 'Vegetarian'
+        tag.save()
+        old_id = old.id
+        old.delete()
+        salt = Ingredient.objects.create(user=self.user, name='Salt')
+        salt_id = salt.id
+        salt.delete()
+
+        res = self.client.get(CHANGES_URL, {'since': cursor})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertFalse(res.data['more'])
+        self.assertEqual(res.data['cursor'], self.get_cursor())
+        changes = {
+            (change['model'], change['id']): change
+            for change in res.data['changes']
+        }
+        self.assertEqual(len(changes), 4)
+        self.assertEqual(changes['recipe', recipe.id]['action'], 'updated')
+        self.assertEqual(changes['recipe', recipe.id]['data']['tags'],
+                         [tag.id])
+        self.assertEqual(changes['tag', tag.id]['data']['name'], 'Vegetarian')
+        self.assertEqual(changes['recipe', old_id]['action'], 'deleted')
+        self.assertIsNone(changes['recipe', old_id]['data'])
+        self.assertEqual(changes['ingredient', salt_id]['action'], 'deleted')
+
+        res = self.client.get(CHANGES_URL, {'since': res.data['cursor']})
+        self.assertEqual(res.data['changes'], [])
+
+    def test_changes_of_user_only(self):
+        """Test other users' changes are not in the feed"""
+        cursor = self.get_cursor()
+        other = get_user_model().objects.create_user('other@naveen.com', 'pw')
+        Tag.objects.create(user=other, name='Vegan')
+
+        res = self.client.get(CHANGES_URL, {'since': cursor})
+
+        self.assertEqual(res.data['changes'], [])
+
+    @override_settings(CHANGE_FEED_PAGE_SIZE=2)
+    def test_changes_paged(self):
+        """Test the feed is read in pages proportional to changes"""
+        cursor = self.get_cursor()
+        tags = [
+            Tag.objects.create(user=self.user, name=f'Tag {i}')
+            for i in range(3)
+        ]
+
+        with self.assertNumQueries(3, using=db_for_user(self.user.pk)):
+            res = self.client.get(CHANGES_URL, {'since': cursor})
+        self.assertTrue(res.data['more'])
+        self.assertEqual(
+            [change['id'] for change in res.data['changes']],
+            [tags[0].id, tags[1].id]
+        )
+
+        res = self.client.get(CHANGES_URL, {'since': res.data['cursor']})
+        self.assertFalse(res.data['more'])
+        self.assertEqual(res.data['changes'][0]['id'], tags[2].id)
+
+    def test_invalid_cursor(self):
+        """Test a malformed cursor is rejected"""
+        res = self.client.get(CHANGES_URL, {'since': 'abc'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_changes_numbered_per_user(self):
+        """Test each user's changes are numbered from one without gaps"""
+        other = get_user_model().objects.create_user('other@naveen.com', 'pw')
+        Tag.objects.create(user=other, name='Vegan')
+        Tag.objects.create(user=self.user, name='Vegan')
+        Tag.objects.create(user=self.user, name='Keto')
+
+        seqs = ChangeLog.objects.filter(user=self.user).order_by(
+            'seq'
+        ).values_list('seq', flat=True)
+        self.assertEqual(list(seqs), [1, 2])
+        self.assertEqual(self.get_cursor(), 2)
+
+    def test_pruned_cursor_resyncs(self):
+        """Test cursors older than the kept changes must start over"""
+        cursor = self.get_cursor()
+        Tag.objects.create(user=self.user, name='Vegan')
+        Tag.objects.create(user=self.user, name='Keto')
+        ChangeLog.objects.filter(user=self.user, seq=1).update(
+            created_at=timezone.now() - timedelta(days=60)
+        )
+
+        self.assertEqual(prune_changes(db_for_user(self.user.pk)), 1)
+
+        res = self.client.get(CHANGES_URL, {'since': cursor})
+        self.assertEqual(res.status_code, status.HTTP_410_GONE)
+        self.assertEqual(res.data['detail'].code, 'resync')
+        res = self.client.get(CHANGES_URL, {'since': 1})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['changes']), 1)
+
+    def test_cursor_ahead_resyncs(self):
+        """Test a cursor past the user's changes must start over"""
+        res = self.client.get(CHANGES_URL, {'since': 5})
+
+        self.assertEqual(res.status_code, status.HTTP_410_GONE)
+
+    def test_prune_changes_command(self):
+        """Test the command prunes every shard, or queues a job per shard"""
+        Tag.objects.create(user=self.user, name='Vegan')
+        ChangeLog.objects.filter(user=self.user).update(
+            created_at=timezone.now() - timedelta(days=60)
+        )
+        out = StringIO()
+
+        call_command('prune_changes', enqueue=True, stdout=out)
+        self.assertEqual(
+            Job.objects.filter(name='core.prune_changes').count(),
+            len(settings.SHARD_DATABASES)
+        )
+        call_command('prune_changes', stdout=out)
+
+        self.assertIn('1 expired changes pruned', out.getvalue())
+        self.assertFalse(ChangeLog.objects.filter(user=self.user).exists())
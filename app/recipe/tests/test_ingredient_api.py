@@ -44,7 +44,9 @@ class PrivateIngredientApiTests(TestCase):
 
         res = self.client.get(INGREDIENTS_URL)
 
-        ingredients = Ingredient.objects.all().order_by('-name')
+        ingredients = Ingredient.objects.filter(
+            user=self.user
+        ).order_by('-name')
         serializer = IngredientSerializer(ingredients, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
@@ -132,3 +134,34 @@ class PrivateIngredientApiTests(TestCase):
         res = self.client.get(INGREDIENTS_URL, {'assigned_only': 1})
 
         self.assertEqual(len(res.data), 1)
+
+    def test_retrieve_ingredients_assigned_after_removal(self):
+        '''Test ingredients removed from all recipes are not assigned'''
+        ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+        recipe = Recipe.objects.create(
+            title='Test',
+            time_miniutes=2,
+            price=12.0,
+            user=self.user
+        )
+        recipe.ingredients.add(ingredient)
+        recipe.ingredients.remove(ingredient)
+
+        res = self.client.get(INGREDIENTS_URL, {'assigned_only': 1})
+
+        self.assertEqual(len(res.data), 0)
+
+    def test_autocomplete_ingredients_limited_to_user(self):
+        '''Test prefix lookup returns only user's ingredients'''
+        user2 = get_user_model().objects.create_user(
+            'other@naveen.com',
+            'testpass'
+        )
+        Ingredient.objects.create(user=user2, name='Salmon')
+        ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+
+        res = self.client.get(INGREDIENTS_URL, {'prefix': 'sal'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data), 1)
+        self.assertEqual(res.data[0]['id'], ingredient.id)
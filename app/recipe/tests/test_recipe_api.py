@@ -1,21 +1,32 @@
 import tempfile
 import os
+from unittest.mock import patch
 
 from PIL import Image
 
 from django.contrib.auth import get_user_model
 from django.urls import reverse
-from django.test import TestCase
+from django.db import connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from core.models import Recipe, Tag, Ingredient
+from core.deletion import run_batch
+from core.models import Recipe, Tag, Ingredient, DeletionTask
+from core.sharding import db_for_user
 
 from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
 
 
 RECIPES_URLS = reverse('recipe:recipe-list')
+STATS_URL = reverse('recipe:recipe-stats')
+PANTRY_URL = reverse('recipe:recipe-pantry')
+SHOPPING_LIST_URL = reverse('recipe:recipe-shopping-list')
+BATCH_URL = reverse('recipe:recipe-batch')
+RELATIONS_URL = reverse('recipe:recipe-relations')
+BULK_DELETE_URL = reverse('recipe:recipe-bulk-delete')
 
 
 def image_upload_url(recipe_id):
@@ -23,6 +34,11 @@ def image_upload_url(recipe_id):
     return reverse('recipe:recipe-upload-image', args=[recipe_id])
 
 
+def similar_url(recipe_id):
+    '''Return similar recipes url'''
+    return reverse('recipe:recipe-similar', args=[recipe_id])
+
+
 def detail_url(recipe_id):
     '''Return recipe detail url'''
     return reverse('recipe:recipe-detail', args=[recipe_id])
@@ -72,6 +88,7 @@ class PrivateRecipeApiTests(TestCase):
             email='naevee@ajsd.com',
             password='test1234'
         )
+        self.shard = db_for_user(self.user.pk)
         self.client.force_authenticate(self.user)
 
     def test_retrive_recipes(self):
@@ -81,7 +98,7 @@ class PrivateRecipeApiTests(TestCase):
 
         res = self.client.get(RECIPES_URLS)
 
-        recipes = Recipe.objects.all().order_by('-id')
+        recipes = Recipe.objects.filter(user=self.user).order_by('-id')
         serializer = RecipeSerializer(recipes, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
@@ -127,7 +144,7 @@ class PrivateRecipeApiTests(TestCase):
         }
         res = self.client.post(RECIPES_URLS, payload)
         self.assertEqual(res.status_code, status.HTTP_201_CREATED)
-        recipe = Recipe.objects.get(id=res.data['id'])
+        recipe = Recipe.objects.get(user=self.user, id=res.data['id'])
 
         for key in payload.keys():
             self.assertEqual(payload[key], getattr(recipe, key))
@@ -146,7 +163,7 @@ class PrivateRecipeApiTests(TestCase):
         res = self.client.post(RECIPES_URLS, payload)
 
         self.assertEqual(res.status_code, status.HTTP_201_CREATED)
-        recipe = Recipe.objects.get(id=res.data['id'])
+        recipe = Recipe.objects.get(user=self.user, id=res.data['id'])
         tags = recipe.tags.all()
         self.assertEqual(tags.count(), 2)
         self.assertIn(tag1, tags)
@@ -166,12 +183,55 @@ class PrivateRecipeApiTests(TestCase):
         res = self.client.post(RECIPES_URLS, payload)
 
         self.assertEqual(res.status_code, status.HTTP_201_CREATED)
-        recipe = Recipe.objects.get(id=res.data['id'])
+        recipe = Recipe.objects.get(user=self.user, id=res.data['id'])
         ingredients = recipe.ingredients.all()
         self.assertEqual(ingredients.count(), 2)
         self.assertIn(ingredient1, ingredients)
         self.assertIn(ingredient2, ingredients)
 
+    def test_create_recipe_with_other_users_tags(self):
+        '''Test tags of another user are reported as missing'''
+        user2 = get_user_model().objects.create(
+            email='other@ajsd.com',
+            password='test1234'
+        )
+        tag1 = sample_tag(user=self.user, name='vigan')
+        tag2 = sample_tag(user=user2, name='vigan111')
+
+        payload = {
+            'title': 'Avocado lime cheese cake',
+            'tags': [tag1.id, tag2.id, 9999],
+            'time_miniutes': 30,
+            'price': 25.00
+        }
+        res = self.client.post(RECIPES_URLS, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn(str([tag2.id, 9999]), res.data['tags'][0])
+        self.assertFalse(Recipe.objects.filter(user=self.user).exists())
+
+    def test_create_recipe_queries_constant(self):
+        '''Test validating many ingredients takes constant queries'''
+        def create(count):
+            ingredients = [
+                sample_ingredient(user=self.user, name=f'{count}-{i}')
+                for i in range(count)
+            ]
+            payload = {
+                'title': 'Stew',
+                'ingredients': [ingredient.id for ingredient in ingredients],
+                'time_miniutes': 30,
+                'price': 25.00
+            }
+            with CaptureQueriesContext(connections[self.shard]) as queries:
+                res = self.client.post(RECIPES_URLS, payload)
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+            return len(queries)
+
+        # The first recipe also creates the user's summary row
+        create(1)
+        self.assertEqual(create(2), create(40))
+
     def test_partial_update_recipe(self):
         '''Test the updating recipe partially patch'''
         recipe = sample_recipe(user=self.user)
@@ -211,6 +271,399 @@ class PrivateRecipeApiTests(TestCase):
         tags = recipe.tags.all()
         self.assertEqual(len(tags), 0)
 
+    def test_recipe_stats(self):
+        '''Test recipe aggregates follow recipe writes'''
+        tag = sample_tag(user=self.user, name='Dessert')
+        recipe1 = sample_recipe(user=self.user, time_miniutes=10, price=4.00)
+        recipe2 = sample_recipe(user=self.user, time_miniutes=45, price=8.00)
+        recipe3 = sample_recipe(user=self.user, time_miniutes=50, price=9.00)
+        recipe1.tags.add(tag)
+        recipe2.time_miniutes = 20
+        recipe2.save()
+        recipe3.delete()
+        sample_recipe(user=get_user_model().objects.create(
+            email='other@ajsd.com',
+            password='test1234'
+        ))
+
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['recipe_count'], 2)
+        self.assertEqual(res.data['average_price'], '6.00')
+        self.assertEqual(res.data['average_time_miniutes'], 15)
+        histogram = res.data['time_miniutes_histogram']
+        self.assertEqual(
+            [bucket['count'] for bucket in histogram], [1, 1, 0, 0, 0]
+        )
+        self.assertEqual(res.data['top_tags'][0]['id'], tag.id)
+        self.assertEqual(res.data['top_tags'][0]['recipe_count'], 1)
+
+    def test_filter_recipes_by_price_and_time_range(self):
+        '''Test returning recipes within price and cooking time ranges'''
+        recipe1 = sample_recipe(user=self.user, price=4.00, time_miniutes=5)
+        recipe2 = sample_recipe(user=self.user, price=9.50, time_miniutes=40)
+        sample_recipe(user=self.user, price=20.00, time_miniutes=30)
+        sample_recipe(user=self.user, price=9.00, time_miniutes=90)
+
+        res = self.client.get(RECIPES_URLS, {
+            'price_min': '4', 'price_max': '10', 'time_max': 60,
+            'ordering': '-price'
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [recipe['id'] for recipe in res.data], [recipe2.id, recipe1.id]
+        )
+
+    def test_filter_recipes_invalid_range(self):
+        '''Test invalid range and ordering parameters are rejected'''
+        res = self.client.get(RECIPES_URLS, {'price_min': 'cheap'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.get(RECIPES_URLS, {'ordering': 'link'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_recipes_keyset_pagination(self):
+        '''Test following cursors walks recipes in requested order'''
+        prices = [5.00, 3.00, 5.00, 8.00, 3.00]
+        recipes = [sample_recipe(user=self.user, price=p) for p in prices]
+        expected = [
+            recipe.id for recipe in
+            sorted(recipes, key=lambda recipe: (recipe.price, recipe.id))
+        ]
+
+        seen = []
+        params = {'ordering': 'price', 'limit': 2}
+        res = self.client.get(RECIPES_URLS, params)
+        while True:
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            seen.extend(recipe['id'] for recipe in res.data['results'])
+            if not res.data['next']:
+                break
+            res = self.client.get(res.data['next'])
+
+        self.assertEqual(seen, expected)
+        self.assertEqual(res.data['count'], 5)
+        self.assertTrue(res.data['count_exact'])
+
+    @override_settings(EXACT_COUNT_THRESHOLD=2)
+    @patch('core.paginator.estimated_rows', return_value=1000)
+    def test_recipes_estimated_count(self, estimated_rows):
+        '''Test large filtered results report an estimated count'''
+        for price in (3.00, 4.00, 5.00):
+            sample_recipe(user=self.user, price=price)
+
+        res = self.client.get(RECIPES_URLS, {'price_min': 1, 'limit': 1})
+
+        self.assertEqual(res.data['count'], 1000)
+        self.assertFalse(res.data['count_exact'])
+
+        # Unfiltered lists take the summary count, which may drift
+        res = self.client.get(RECIPES_URLS, {'limit': 1})
+
+        self.assertEqual(res.data['count'], 3)
+        self.assertFalse(res.data['count_exact'])
+        self.assertEqual(estimated_rows.call_count, 1)
+
+        res = self.client.get(RECIPES_URLS, {'limit': 1, 'price_min': 5})
+
+        self.assertEqual(res.data['count'], 1)
+        self.assertTrue(res.data['count_exact'])
+
+    def test_shopping_list(self):
+        '''Test ingredients of many recipes are merged in one query'''
+        egg = sample_ingredient(user=self.user, name='Egg')
+        milk = sample_ingredient(user=self.user, name='Milk')
+        salt = sample_ingredient(user=self.user, name='Salt')
+        pancake = sample_recipe(user=self.user, title='Pancake')
+        pancake.ingredients.add(egg, milk)
+        omelette = sample_recipe(user=self.user, title='Omelette')
+        omelette.ingredients.add(egg, salt)
+        soup = sample_recipe(user=self.user, title='Soup')
+        soup.ingredients.add(salt)
+        other = sample_recipe(user=get_user_model().objects.create(
+            email='other@ajsd.com',
+            password='test1234'
+        ))
+
+        with self.assertNumQueries(1, using=self.shard):
+            res = self.client.get(SHOPPING_LIST_URL, {
+                'ids': f'{pancake.id},{omelette.id},{other.id}'
+            })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [
+            {'id': egg.id, 'name': 'Egg', 'recipe_count': 2},
+            {'id': milk.id, 'name': 'Milk', 'recipe_count': 1},
+            {'id': salt.id, 'name': 'Salt', 'recipe_count': 1},
+        ])
+
+    def test_batch_recipe_details(self):
+        '''Test details of many recipes come in request order'''
+        recipes = []
+        for i in range(3):
+            recipe = sample_recipe(user=self.user, title=f'Recipe {i}')
+            recipe.tags.add(sample_tag(user=self.user, name=f'Tag {i}'))
+            recipe.ingredients.add(sample_ingredient(user=self.user))
+            recipes.append(recipe)
+        other = sample_recipe(user=get_user_model().objects.create(
+            email='other@ajsd.com',
+            password='test1234'
+        ))
+        ids = [recipes[2].id, other.id, recipes[0].id, recipes[1].id]
+
+        params = {'ids': ','.join(str(pk) for pk in ids)}
+
+        with self.assertNumQueries(4, using=self.shard):
+            res = self.client.get(BATCH_URL, params)
+        with self.assertNumQueries(1, using=self.shard):
+            cached = self.client.get(BATCH_URL, params)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(cached.data, res.data)
+        recipes = [recipes[2], recipes[0], recipes[1]]
+        self.assertEqual(
+            res.data['results'],
+            RecipeDetailSerializer(recipes, many=True).data
+        )
+        self.assertEqual(res.data['missing'], [other.id])
+
+    def test_list_recipes_from_cache(self):
+        '''Test only changed recipes are serialized again'''
+        tag = sample_tag(user=self.user, name='Vegan')
+        salad = sample_recipe(user=self.user, title='Salad')
+        soup = sample_recipe(user=self.user, title='Soup')
+        salad.tags.add(tag)
+        self.client.get(RECIPES_URLS)
+
+        with self.assertNumQueries(1, using=self.shard):
+            self.client.get(RECIPES_URLS)
+
+        soup.tags.add(tag)
+        with CaptureQueriesContext(connections[self.shard]) as queries:
+            res = self.client.get(RECIPES_URLS)
+        self.assertIn(f'IN ({soup.id})', queries[1]['sql'])
+        self.assertEqual(
+            res.data,
+            RecipeSerializer(
+                Recipe.objects.filter(user=self.user).order_by('-id'),
+                many=True
+            ).data
+        )
+
+    def test_recipe_detail_cache_invalidation(self):
+        '''Test cached details follow tag renames and removals'''
+        tag = sample_tag(user=self.user, name='Vegan')
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(tag)
+        self.client.get(detail_url(recipe.id))
+
+        tag.name = 'Vegetarian'
+        tag.save()
+        res = self.client.get(detail_url(recipe.id))
+        self.assertEqual(res.data['tags'][0]['name'], 'Vegetarian')
+
+        tag.recipe_set.clear()
+        res = self.client.get(detail_url(recipe.id))
+        self.assertEqual(res.data['tags'], [])
+
+        other = sample_ingredient(user=self.user, name='Salt')
+        recipe.ingredients.add(other)
+        self.client.get(detail_url(recipe.id))
+        other.delete()
+        res = self.client.get(detail_url(recipe.id))
+        self.assertEqual(res.data['ingredients'], [])
+
+    def test_recipe_detail_deleted_while_rendering(self):
+        '''Test a recipe deleted after lookup is not found'''
+        recipe = sample_recipe(user=self.user)
+
+        with patch('recipe.fragments.Recipe.objects.filter') as fetch:
+            fetch.return_value.prefetch_related.return_value = []
+            res = self.client.get(detail_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(RECIPE_BATCH_MAX_IDS=2)
+    def test_batch_recipe_details_limit(self):
+        '''Test batch requests over the id limit or malformed fail'''
+        res = self.client.get(BATCH_URL, {'ids': '1,2,3'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.get(BATCH_URL, {'ids': '1,x'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_add_and_remove_relations(self):
+        '''Test adding a tag to many recipes and removing an ingredient'''
+        tag = sample_tag(user=self.user, name='Quick')
+        salt = sample_ingredient(user=self.user, name='Salt')
+        recipes = [sample_recipe(user=self.user) for i in range(3)]
+        for recipe in recipes:
+            recipe.ingredients.add(salt)
+        recipes[0].tags.add(tag)
+
+        res = self.client.post(RELATIONS_URL, {
+            'op': 'add',
+            'tags': [tag.id],
+            'recipes': [recipe.id for recipe in recipes]
+        }, format='json')
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+
+        res = self.client.post(RELATIONS_URL, {
+            'op': 'remove',
+            'ingredients': [salt.id]
+        }, format='json')
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+
+        for recipe in recipes:
+            self.assertEqual(list(recipe.tags.all()), [tag])
+            self.assertFalse(recipe.ingredients.exists())
+        tag.refresh_from_db()
+        salt.refresh_from_db()
+        self.assertEqual(tag.recipe_count, 3)
+        self.assertEqual(salt.recipe_count, 0)
+
+    def test_bulk_add_relations_requires_recipes(self):
+        '''Test adding relations without recipes fails'''
+        tag = sample_tag(user=self.user, name='Quick')
+
+        res = self.client.post(RELATIONS_URL, {
+            'op': 'add',
+            'tags': [tag.id]
+        }, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_delete_recipes(self):
+        '''Test recipes are deleted in batches with reported progress'''
+        tag = sample_tag(user=self.user)
+        recipes = [sample_recipe(user=self.user) for i in range(3)]
+        tag.recipe_set.add(*recipes)
+        kept = sample_recipe(user=self.user)
+
+        res = self.client.post(BULK_DELETE_URL, {
+            'recipes': [recipe.id for recipe in recipes]
+        }, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(res.data['total'], 3)
+        task = DeletionTask.objects.get(pk=res.data['id'])
+
+        run_batch(task, batch_size=2)
+        url = reverse('recipe:recipe-deletion', args=[task.id])
+        res = self.client.get(url)
+        self.assertEqual(res.data['status'], DeletionTask.RUNNING)
+        self.assertEqual(res.data['deleted'], 2)
+
+        while not run_batch(task, batch_size=2):
+            pass
+        res = self.client.get(url)
+        self.assertEqual(res.data['status'], DeletionTask.DONE)
+        self.assertEqual(list(Recipe.objects.filter(user=self.user)), [kept])
+        tag.refresh_from_db()
+        self.assertEqual(tag.recipe_count, 0)
+
+
+class RecipeFeatureApiTests(TransactionTestCase):
+    '''Test endpoints served from the cached recipe feature index
+
+    The index follows changes once they commit, so these tests commit.
+    '''
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create(
+            email='naevee@ajsd.com',
+            password='test1234'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_similar_recipes(self):
+        '''Test similar recipes are ranked by shared ingredients'''
+        egg = sample_ingredient(user=self.user, name='Egg')
+        milk = sample_ingredient(user=self.user, name='Milk')
+        flour = sample_ingredient(user=self.user, name='Flour')
+        sweet = sample_tag(user=self.user, name='Sweet')
+        pancake = sample_recipe(user=self.user, title='Pancake')
+        pancake.ingredients.add(egg, milk, flour)
+        crepe = sample_recipe(user=self.user, title='Crepe')
+        crepe.ingredients.add(egg, milk)
+        omelette = sample_recipe(user=self.user, title='Omelette')
+        omelette.ingredients.add(egg)
+        sample_recipe(user=self.user, title='Tea')
+
+        res = self.client.get(similar_url(pancake.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [item['recipe']['id'] for item in res.data],
+            [crepe.id, omelette.id]
+        )
+        self.assertAlmostEqual(res.data[0]['score'], 2 / 3)
+
+        # The cached matrix follows tag and ingredient changes
+        omelette.ingredients.add(milk, flour)
+        sweet.recipe_set.add(pancake, omelette)
+
+        res = self.client.get(similar_url(pancake.id), {'limit': 1})
+
+        self.assertEqual(len(res.data), 1)
+        self.assertEqual(res.data[0]['recipe']['id'], omelette.id)
+        self.assertEqual(res.data[0]['score'], 1.0)
+
+        # Deleting an ingredient drops its links without m2m_changed
+        flour.delete()
+
+        res = self.client.get(similar_url(pancake.id))
+
+        self.assertEqual(res.data[1]['recipe']['id'], crepe.id)
+        self.assertEqual(res.data[1]['score'], 2 / 3)
+
+    def test_similar_invalid_limit(self):
+        '''Test a malformed limit is rejected'''
+        recipe = sample_recipe(user=self.user)
+
+        res = self.client.get(similar_url(recipe.id), {'limit': 'ten'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_pantry_matches(self):
+        '''Test recipes are ranked by ingredients missing from pantry'''
+        egg = sample_ingredient(user=self.user, name='Egg')
+        milk = sample_ingredient(user=self.user, name='Milk')
+        flour = sample_ingredient(user=self.user, name='Flour')
+        sugar = sample_ingredient(user=self.user, name='Sugar')
+        omelette = sample_recipe(user=self.user, title='Omelette')
+        omelette.ingredients.add(egg)
+        pancake = sample_recipe(user=self.user, title='Pancake')
+        pancake.ingredients.add(egg, milk, flour)
+        cake = sample_recipe(user=self.user, title='Cake')
+        cake.ingredients.add(egg, flour, sugar, milk)
+        sample_recipe(user=self.user, title='Water')
+
+        res = self.client.get(
+            PANTRY_URL, {'have': f'{egg.id},{milk.id}', 'max_missing': 1}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [item['recipe']['id'] for item in res.data],
+            [omelette.id, pancake.id]
+        )
+        self.assertEqual(res.data[0]['missing_count'], 0)
+        self.assertEqual(res.data[1]['missing_ingredients'], [flour.id])
+
+        # Deleted ingredients are no longer missing from any recipe
+        flour.delete()
+
+        res = self.client.get(PANTRY_URL, {'have': f'{egg.id},{milk.id}'})
+
+        self.assertEqual(
+            [item['recipe']['id'] for item in res.data],
+            [omelette.id, pancake.id]
+        )
+
 
 class RecipeImageUploadTests(TestCase):
 
@@ -288,3 +741,48 @@ class RecipeImageUploadTests(TestCase):
         self.assertIn(serializer1.data, res.data)
         self.assertIn(serializer2.data, res.data)
         self.assertNotIn(serializer3.data, res.data)
+
+
+class RecipeImageFileTests(TransactionTestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='files@ajsd.com',
+            password='test1234'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = sample_recipe(user=self.user)
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings = override_settings(MEDIA_ROOT=media_root.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def upload(self):
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            Image.new('RGB', [10, 10]).save(ntf, format='JPEG')
+            ntf.seek(0)
+            res = self.client.post(
+                image_upload_url(self.recipe.id), {'image': ntf},
+                format='multipart'
+            )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.recipe.refresh_from_db()
+        return self.recipe.image.path
+
+    def test_replaced_image_file_removed(self):
+        """Test uploading a new image deletes the file of the old one"""
+        first = self.upload()
+        second = self.upload()
+
+        self.assertFalse(os.path.exists(first))
+        self.assertTrue(os.path.exists(second))
+
+    def test_deleted_recipe_image_file_removed(self):
+        """Test deleting a recipe deletes the file of its image"""
+        path = self.upload()
+
+        self.recipe.delete()
+
+        self.assertFalse(os.path.exists(path))
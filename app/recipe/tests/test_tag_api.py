@@ -1,12 +1,16 @@
 from django.contrib.auth import get_user_model
 from django.urls import reverse
-from django.test import TestCase
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
 from core.models import Tag, Recipe
+from core.sharding import db_for_user
+from core.versions import get_version
 
+from recipe import autocomplete
 from recipe.serializers import TagSerializer
 
 
@@ -44,7 +48,7 @@ class PrivateTagsApiTest(TestCase):
 
         res = self.client.get(TAGS_URL)
 
-        tags = Tag.objects.all().order_by('-name')
+        tags = Tag.objects.filter(user=self.user).order_by('-name')
         serializer = TagSerializer(tags, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(res.data, serializer.data)
@@ -124,3 +128,121 @@ class PrivateTagsApiTest(TestCase):
         res = self.client.get(TAGS_URL, {'assigned_only': 1})
 
         self.assertEqual(len(res.data), 1)
+
+    def test_retrieve_tags_ordered_by_usage(self):
+        '''Test tags can be listed with and sorted by recipe count'''
+        tag1 = Tag.objects.create(user=self.user, name='Lunch')
+        tag2 = Tag.objects.create(user=self.user, name='Dinner')
+        for title in ('Test', 'Test1'):
+            recipe = Recipe.objects.create(
+                title=title,
+                time_miniutes=2,
+                price=12.0,
+                user=self.user
+            )
+            recipe.tags.add(tag2)
+        recipe.tags.add(tag1)
+
+        res = self.client.get(
+            TAGS_URL, {'ordering': '-recipe_count', 'with_counts': 1}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(tag['id'], tag['recipe_count']) for tag in res.data],
+            [(tag2.id, 2), (tag1.id, 1)]
+        )
+
+    def test_autocomplete_invalid_limit(self):
+        '''Test a malformed autocomplete limit is rejected'''
+        res = self.client.get(TAGS_URL, {'prefix': 'br', 'limit': 'two'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(AUTOCOMPLETE_INDEX_MAX_SIZE=1)
+    def test_autocomplete_tags_database_fallback(self):
+        '''Test prefix lookup for large collections queries database'''
+        Tag.objects.create(user=self.user, name='Breakfast')
+        Tag.objects.create(user=self.user, name='Dinner')
+
+        res = self.client.get(TAGS_URL, {'prefix': 'bre'})
+
+        self.assertEqual(len(res.data), 1)
+        self.assertEqual(res.data[0]['name'], 'Breakfast')
+
+    def test_retrieve_tags_paginated(self):
+        '''Test tags are paginated with a count when limit is given'''
+        for name in ('a', 'b', 'c'):
+            Tag.objects.create(user=self.user, name=name)
+
+        res = self.client.get(TAGS_URL, {'limit': 2, 'offset': 2})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['count'], 3)
+        self.assertTrue(res.data['count_exact'])
+        self.assertEqual([tag['name'] for tag in res.data['results']], ['a'])
+
+
+class TagAutocompleteApiTests(TransactionTestCase):
+    """Test autocomplete, whose index is invalidated on commit"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@naveen.com',
+            'test123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_autocomplete_tags_by_prefix(self):
+        '''Test prefix lookup returns most used matching tags first'''
+        Tag.objects.create(user=self.user, name='Breakfast')
+        tag = Tag.objects.create(user=self.user, name='Brunch')
+        Tag.objects.create(user=self.user, name='Dinner')
+        recipe = Recipe.objects.create(
+            title='Test',
+            time_miniutes=2,
+            price=12.0,
+            user=self.user
+        )
+        recipe.tags.add(tag)
+
+        res = self.client.get(TAGS_URL, {'prefix': 'br'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [tag['name'] for tag in res.data], ['Brunch', 'Breakfast']
+        )
+
+        Tag.objects.create(user=self.user, name='Bread')
+        res = self.client.get(TAGS_URL, {'prefix': 'BR', 'limit': 2})
+
+        self.assertEqual(
+            [tag['name'] for tag in res.data], ['Brunch', 'Bread']
+        )
+
+    def test_rolled_back_tag_not_cached(self):
+        '''Test a tag of a rolled back transaction never reaches the index'''
+        Tag.objects.create(user=self.user, name='Breakfast')
+
+        shard = db_for_user(self.user.pk)
+        with self.assertRaises(RuntimeError), transaction.atomic(shard):
+            Tag.objects.create(user=self.user, name='Brunch')
+            autocomplete.lookup(Tag, self.user, 'br', 10)
+            raise RuntimeError
+
+        self.assertEqual(
+            [row['name'] for row in
+             autocomplete.lookup(Tag, self.user, 'br', 10)],
+            ['Breakfast']
+        )
+
+    def test_version_bumped_on_commit(self):
+        '''Test cached tags are invalidated once a change commits'''
+        version = get_version('tag', self.user.pk)
+
+        with transaction.atomic(db_for_user(self.user.pk)):
+            Tag.objects.create(user=self.user, name='Brunch')
+            self.assertEqual(get_version('tag', self.user.pk), version)
+
+        self.assertNotEqual(get_version('tag', self.user.pk), version)
@@ -12,5 +12,6 @@ router.register('recipes', views.RecipeViewSet)
 app_name = 'recipe'
 
 urlpatterns = [
-    path('', include(router.urls))
+    path('', include(router.urls)),
+    path('changes/', views.ChangeFeedView.as_view(), name='changes'),
 ]
@@ -1,32 +1,93 @@
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+
 from rest_framework import viewsets, mixins, status
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from core.models import Tag, Ingredient, Recipe
+from core.authentication import ExpiringTokenAuthentication
+from core.changes import ResyncRequired
+from core.deletion import request_recipe_deletion
+from core.models import (
+    ChangeLog,
+    ChangeSequence,
+    DeletionTask,
+    Ingredient,
+    Recipe,
+    RecipeSummary,
+    Tag
+)
+from core.sharding import ShardRoutingMixin, db_for_user
+from core.stats import RECIPE_TIME_BUCKETS
+from core.throttling import UserTokenBucketThrottle
 
-from recipe import serializers
+from recipe import autocomplete, fragments, serializers, similarity
+from recipe.pagination import EstimatedCountPagination, KeysetPagination
+from recipe.signals import delete_file_on_commit
 
 
-class BaseRecipeAttrViewSet(viewsets.GenericViewSet,
+class BaseRecipeAttrViewSet(ShardRoutingMixin,
+                            viewsets.GenericViewSet,
                             mixins.ListModelMixin,
                             mixins.CreateModelMixin):
     """Base view set for user owned recipe attributes"""
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (ExpiringTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    throttle_classes = (UserTokenBucketThrottle,)
+    pagination_class = EstimatedCountPagination
+    ordering_fields = ('name', 'recipe_count')
 
     def get_queryset(self):
         '''return objects for current authenticated user only'''
         assigned_only = bool(
             int(self.request.query_params.get('assigned_only', 0))
         )
-        queryset = self.queryset
+        queryset = self.queryset.filter(user=self.request.user)
         if assigned_only:
-            queryset = queryset.filter(recipe__isnull=False)
-        return queryset.filter(
-            user=self.request.user
-        ).order_by('-name').distinct()
+            queryset = queryset.filter(recipe_count__gt=0)
+        return queryset.order_by(*self.get_ordering())
+
+    def get_ordering(self):
+        '''Return ordering requested by client, default name descending'''
+        ordering = self.request.query_params.get('ordering', '-name')
+        if ordering.lstrip('-') not in self.ordering_fields:
+            ordering = '-name'
+        if ordering.lstrip('-') == 'name':
+            return (ordering,)
+        return (ordering, 'name')
+
+    def get_serializer_class(self):
+        '''Include recipe counts when requested'''
+        with_counts = bool(
+            int(self.request.query_params.get('with_counts', 0))
+        )
+        if with_counts:
+            return self.usage_serializer_class
+        return self.serializer_class
+
+    def list(self, request, *args, **kwargs):
+        '''Serve prefix autocomplete lookups from the in memory index'''
+        prefix = request.query_params.get('prefix')
+        if prefix is None:
+            return super().list(request, *args, **kwargs)
+
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            raise ValidationError({'limit': 'Invalid limit'})
+        limit = max(1, min(limit, settings.AUTOCOMPLETE_MAX_RESULTS))
+        return Response(autocomplete.lookup(
+            self.queryset.model, request.user, prefix, limit
+        ))
 
     def perform_create(self, serializer):
         """Create a new tag"""
@@ -37,25 +98,58 @@ class TagViewSet(BaseRecipeAttrViewSet):
     """Mange tags in db"""
     queryset = Tag.objects.all()
     serializer_class = serializers.TagSerializer
+    usage_serializer_class = serializers.TagUsageSerializer
 
 
 class IngredientViewSet(BaseRecipeAttrViewSet):
     """Manage ingredient in db"""
     queryset = Ingredient.objects.all()
     serializer_class = serializers.IngredientSerializer
+    usage_serializer_class = serializers.IngredientUsageSerializer
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ShardRoutingMixin, viewsets.ModelViewSet):
     '''Manage recipe in db'''
     serializer_class = serializers.RecipeSerializer
     queryset = Recipe.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (ExpiringTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    throttle_classes = (UserTokenBucketThrottle,)
+
+    pagination_class = KeysetPagination
+    ordering_fields = ('id', 'title', 'price', 'time_miniutes')
+    range_filters = (
+        ('price_min', 'price__gte', Decimal),
+        ('price_max', 'price__lte', Decimal),
+        ('time_min', 'time_miniutes__gte', int),
+        ('time_max', 'time_miniutes__lte', int),
+    )
 
     def _params_to_ints(self, qs):
         '''Convert a list of strings IDs to list of integers'''
         return [int(str_id) for str_id in qs.split(',')]
 
+    def get_maintained_count(self):
+        '''Return user's recipe count from summaries for unfiltered lists'''
+        filters = ['tags', 'ingredients'] + [
+            param for param, lookup, convert in self.range_filters
+        ]
+        if any(param in self.request.query_params for param in filters):
+            return None
+        return RecipeSummary.objects.filter(
+            user=self.request.user
+        ).aggregate(total=Sum('recipe_count'))['total'] or 0
+
+    def get_ordering(self):
+        '''Return requested ordering with id as tie breaker'''
+        ordering = self.request.query_params.get('ordering', '-id')
+        field = ordering.lstrip('-')
+        if field not in self.ordering_fields:
+            raise ValidationError({'ordering': f'Cannot order by {field}'})
+        if field == 'id':
+            return (ordering,)
+        return (ordering, ordering.replace(field, 'id'))
+
     def get_queryset(self):
         '''return objects for current authenticated user only'''
         tags = self.request.query_params.get('tags')
@@ -70,25 +164,259 @@ class RecipeViewSet(viewsets.ModelViewSet):
             ingredient_ids = self._params_to_ints(ingredients)
             queryset = queryset.filter(ingredients__id__in=ingredient_ids)
 
-        return queryset.filter(user=self.request.user)
+        for param, lookup, convert in self.range_filters:
+            value = self.request.query_params.get(param)
+            if value is None:
+                continue
+            try:
+                queryset = queryset.filter(**{lookup: convert(value)})
+            except (ValueError, ArithmeticError):
+                raise ValidationError({param: f'Invalid value {value}'})
+
+        return queryset.filter(
+            user=self.request.user
+        ).order_by(*self.get_ordering())
 
     def get_serializer_class(self):
         '''Return approprioate serializer class'''
-        if self.action == 'retrieve':
+        if self.action in ('retrieve', 'batch'):
             return serializers.RecipeDetailSerializer
         elif self.action == 'upload_image':
             return serializers.RecipeImageSerializer
+        elif self.action == 'relations':
+            return serializers.RecipeRelationsSerializer
+        elif self.action == 'bulk_delete':
+            return serializers.RecipeBulkDeleteSerializer
 
         return self.serializer_class
 
+    def list(self, request, *args, **kwargs):
+        '''Return recipes assembled from cached representations'''
+        fields = {field.lstrip('-') for field in self.get_ordering()}
+        queryset = self.filter_queryset(self.get_queryset()).only(
+            'id', 'updated_at', *fields
+        )
+        page = self.paginate_queryset(queryset)
+        data = fragments.render(
+            queryset if page is None else page,
+            self.get_serializer_class(),
+            self.get_serializer_context()
+        )
+        if page is None:
+            return Response(data)
+        return self.get_paginated_response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        '''Return recipe details from cache when up to date'''
+        data = fragments.render(
+            [self.get_object()],
+            self.get_serializer_class(),
+            self.get_serializer_context()
+        )
+        if not data:
+            # Deleted since get_object
+            raise Http404
+        return Response(data[0])
+
     def perform_create(self, serializer):
         '''Create a new recipe'''
         serializer.save(user=self.request.user)
 
+    @action(methods=['GET'], detail=False)
+    def stats(self, request):
+        '''Return aggregates of user's recipes from summary rows'''
+        summaries = {
+            summary.time_bucket: summary
+            for summary in RecipeSummary.objects.filter(user=request.user)
+        }
+        recipe_count = sum(s.recipe_count for s in summaries.values())
+        price_total = sum(s.price_total for s in summaries.values())
+        time_total = sum(s.time_total for s in summaries.values())
+
+        histogram = []
+        uppers = RECIPE_TIME_BUCKETS[1:] + (None,)
+        for lower, upper in zip(RECIPE_TIME_BUCKETS, uppers):
+            summary = summaries.get(lower)
+            histogram.append({
+                'min': lower,
+                'max': upper,
+                'count': summary.recipe_count if summary else 0
+            })
+
+        top_tags = Tag.objects.filter(
+            user=request.user, recipe_count__gt=0
+        ).order_by('-recipe_count', 'name')[:5]
+
+        serializer = serializers.RecipeStatsSerializer({
+            'recipe_count': recipe_count,
+            'average_price': (
+                price_total / recipe_count if recipe_count else None
+            ),
+            'average_time_miniutes': (
+                time_total / recipe_count if recipe_count else None
+            ),
+            'time_miniutes_histogram': histogram,
+            'top_tags': top_tags
+        })
+        return Response(serializer.data)
+
+    @action(methods=['GET'], detail=True)
+    def similar(self, request, pk=None):
+        '''Return user's recipes sharing most ingredients and tags'''
+        recipe = self.get_object()
+        metric = request.query_params.get('metric', 'jaccard')
+        if metric not in ('jaccard', 'cosine'):
+            raise ValidationError({'metric': f'Unknown metric {metric}'})
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            raise ValidationError({'limit': 'Invalid limit'})
+        limit = max(1, min(limit, 100))
+
+        scores = similarity.get_index(request.user).similar(
+            recipe.id, limit, metric
+        )
+        recipes = Recipe.objects.filter(
+            id__in=[recipe_id for recipe_id, score in scores]
+        ).prefetch_related('tags', 'ingredients').in_bulk()
+
+        return Response([
+            {
+                'score': score,
+                'recipe': serializers.RecipeSerializer(
+                    recipes[recipe_id]
+                ).data
+            }
+            for recipe_id, score in scores if recipe_id in recipes
+        ])
+
+    @action(methods=['GET'], detail=False)
+    def pantry(self, request):
+        '''Return recipes user can cook with the ingredients at hand'''
+        have = request.query_params.get('have', '')
+        try:
+            ingredient_ids = self._params_to_ints(have) if have else []
+            max_missing = int(request.query_params.get('max_missing', 0))
+            limit = int(request.query_params.get('limit', 50))
+        except ValueError:
+            raise ValidationError('Invalid pantry parameters')
+        limit = max(1, min(limit, 200))
+
+        matches = list(similarity.get_index(request.user).pantry_matches(
+            ingredient_ids, max_missing, limit
+        ))
+        recipes = Recipe.objects.filter(
+            id__in=[recipe_id for recipe_id, missing in matches]
+        ).prefetch_related('tags', 'ingredients').in_bulk()
+
+        return Response([
+            {
+                'missing_count': len(missing),
+                'missing_ingredients': missing,
+                'recipe': serializers.RecipeSerializer(
+                    recipes[recipe_id]
+                ).data
+            }
+            for recipe_id, missing in matches if recipe_id in recipes
+        ])
+
+    @action(methods=['GET'], detail=False)
+    def batch(self, request):
+        '''Return details of the given recipes in the requested order'''
+        try:
+            recipe_ids = list(dict.fromkeys(self._params_to_ints(
+                request.query_params.get('ids', '')
+            )))
+        except ValueError:
+            raise ValidationError({'ids': 'Comma separated recipe ids'})
+        if len(recipe_ids) > settings.RECIPE_BATCH_MAX_IDS:
+            raise ValidationError({
+                'ids': f'At most {settings.RECIPE_BATCH_MAX_IDS} recipe ids'
+            })
+
+        recipes = Recipe.objects.filter(
+            user=request.user, id__in=recipe_ids
+        ).only('id', 'updated_at').in_bulk()
+        data = fragments.render(
+            [recipes[pk] for pk in recipe_ids if pk in recipes],
+            self.get_serializer_class(),
+            self.get_serializer_context()
+        )
+
+        return Response({
+            'results': data,
+            'missing': [pk for pk in recipe_ids if pk not in recipes]
+        })
+
+    @action(methods=['GET'], detail=False, url_path='shopping-list')
+    def shopping_list(self, request):
+        '''Return merged ingredients of the given recipes'''
+        try:
+            recipe_ids = self._params_to_ints(
+                request.query_params.get('ids', '')
+            )
+        except ValueError:
+            raise ValidationError({'ids': 'Comma separated recipe ids'})
+
+        ingredients = Recipe.ingredients.through.objects.filter(
+            recipe__user=request.user, recipe_id__in=recipe_ids
+        ).values(
+            'ingredient_id', 'ingredient__name'
+        ).annotate(
+            recipe_count=Count('recipe_id')
+        ).order_by('ingredient__name', 'ingredient_id')
+
+        return Response([
+            {
+                'id': ingredient['ingredient_id'],
+                'name': ingredient['ingredient__name'],
+                'recipe_count': ingredient['recipe_count']
+            }
+            for ingredient in ingredients
+        ])
+
+    @action(methods=['POST'], detail=False)
+    def relations(self, request):
+        '''Add or remove tags and ingredients on many recipes at once'''
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic(using=db_for_user(request.user.pk)):
+            serializer.save()
+
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(methods=['POST'], detail=False, url_path='bulk-delete')
+    def bulk_delete(self, request):
+        '''Schedule deletion of many recipes by the background worker'''
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        task = request_recipe_deletion(
+            request.user,
+            [recipe.id for recipe in serializer.validated_data['recipes']]
+        )
+
+        return Response(
+            serializers.DeletionTaskSerializer(task).data,
+            status=status.HTTP_202_ACCEPTED
+        )
+
+    @action(
+        methods=['GET'],
+        detail=False,
+        url_path=r'deletions/(?P<task_id>\d+)'
+    )
+    def deletion(self, request, task_id=None):
+        '''Return progress of a background recipe deletion'''
+        task = get_object_or_404(
+            DeletionTask, pk=task_id, user=request.user
+        )
+        return Response(serializers.DeletionTaskSerializer(task).data)
+
     @action(methods=['POST'], detail=True, url_path='upload-image')
     def upload_image(self, request, pk=None):
         '''Upload an image to a recipe'''
         recipe = self.get_object()
+        previous = recipe.image.name
         serializer = self.get_serializer(
             recipe,
             data=request.data
@@ -96,6 +424,10 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
         if serializer.is_valid():
             serializer.save()
+            if previous and previous != recipe.image.name:
+                delete_file_on_commit(
+                    recipe._state.db, recipe.image.storage, previous
+                )
             return Response(
                 serializer.data,
                 status=status.HTTP_200_OK
@@ -105,3 +437,96 @@ class RecipeViewSet(viewsets.ModelViewSet):
             serializer.errors,
             status=status.HTTP_400_BAD_REQUEST
         )
+
+
+class ChangeFeedView(ShardRoutingMixin, APIView):
+    '''Return changes to user's recipes, tags and ingredients since cursor
+
+    Without a cursor only the current one is returned, clients read it
+    before downloading everything and follow the feed from there.
+    Created and updated objects come with their data, deleted ones as
+    tombstones, each object once with its latest state. Cursors older
+    than the kept changes get 410 and must start over.
+    '''
+    authentication_classes = (ExpiringTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    throttle_classes = (UserTokenBucketThrottle,)
+
+    def get_data(self, latest):
+        '''Return current data of changed objects by (model, id)'''
+        ids = {'recipe': [], 'tag': [], 'ingredient': []}
+        for (model, object_id), change in latest.items():
+            if change != ChangeLog.DELETED:
+                ids[model].append(object_id)
+
+        data = {}
+        recipes = Recipe.objects.filter(
+            user=self.request.user, id__in=ids['recipe']
+        ).only('id', 'updated_at')
+        for item in fragments.render(
+            recipes, serializers.RecipeSerializer, {'request': self.request}
+        ):
+            data['recipe', item['id']] = item
+        for model, serializer_class in (
+            (Tag, serializers.TagSerializer),
+            (Ingredient, serializers.IngredientSerializer),
+        ):
+            name = model._meta.model_name
+            objects = model.objects.filter(
+                user=self.request.user, id__in=ids[name]
+            )
+            for item in serializer_class(objects, many=True).data:
+                data[name, item['id']] = item
+        return data
+
+    def get(self, request):
+        logs = ChangeLog.objects.filter(user=request.user)
+        last_seq, pruned_seq = ChangeSequence.objects.filter(
+            user=request.user
+        ).values_list('last_seq', 'pruned_seq').first() or (0, 0)
+        since = request.query_params.get('since')
+        if since is None:
+            return Response({'cursor': last_seq, 'more': False,
+                             'changes': []})
+        try:
+            since = int(since)
+            limit = int(request.query_params.get(
+                'limit', settings.CHANGE_FEED_PAGE_SIZE
+            ))
+        except ValueError:
+            raise ValidationError('Invalid cursor or limit')
+        limit = max(1, min(limit, settings.CHANGE_FEED_PAGE_SIZE))
+        if not pruned_seq <= since <= last_seq:
+            raise ResyncRequired()
+
+        entries = list(logs.filter(
+            seq__gt=since, seq__lte=last_seq
+        ).order_by('seq').values_list(
+            'seq', 'model', 'object_id', 'action'
+        )[:limit + 1])
+        more = len(entries) > limit
+        entries = entries[:limit]
+
+        latest = OrderedDict()
+        for seq, model, object_id, change in entries:
+            latest.pop((model, object_id), None)
+            latest[model, object_id] = change
+        data = self.get_data(latest)
+
+        changes = []
+        for (model, object_id), change in latest.items():
+            if change != ChangeLog.DELETED and (model, object_id) not in data:
+                # Deleted after this page, its tombstone follows
+                continue
+            changes.append({
+                'model': model,
+                'id': object_id,
+                'action': change,
+                'data': data.get((model, object_id))
+            })
+
+        return Response({
+            'cursor': entries[-1][0] if entries else since,
+            'more': more,
+            'changes': changes
+        })
@@ -1,7 +1,12 @@
+import json
+
+from django.conf import settings
 from django.contrib.auth import get_user_model, authenticate
 from django.utils.translation import ugettext_lazy as _
 from rest_framework import serializers
 
+from core.models import ProvisionTask
+
 
 class UserSerializer(serializers.ModelSerializer):
     """Serializer for user object"""
@@ -51,3 +56,49 @@ class AuthTokenSerializer(serializers.Serializer):
 
         attrs['user'] = user
         return attrs
+
+
+class ProvisionUserSerializer(serializers.Serializer):
+    """Serializer for one user of a bulk provisioning request"""
+    email = serializers.EmailField(max_length=255)
+    name = serializers.CharField(
+        max_length=255, required=False, allow_blank=True
+    )
+    password = serializers.CharField(
+        min_length=5, write_only=True, trim_whitespace=False
+    )
+
+
+class BulkProvisionSerializer(serializers.Serializer):
+    """Serializer for creating many users in one request"""
+    users = ProvisionUserSerializer(many=True, allow_empty=False)
+    issue_tokens = serializers.BooleanField(default=False)
+
+    def validate_users(self, value):
+        """Limit the number of users created by one request"""
+        if len(value) > settings.USER_PROVISION_MAX:
+            raise serializers.ValidationError(
+                _('At most %d users can be created at once')
+                % settings.USER_PROVISION_MAX
+            )
+        return value
+
+
+class ProvisionTaskSerializer(serializers.ModelSerializer):
+    """Serializer for progress and results of bulk user creation"""
+    created = serializers.SerializerMethodField()
+    skipped = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ProvisionTask
+        fields = (
+            'id', 'status', 'total', 'created', 'skipped',
+            'created_at', 'finished_at'
+        )
+        read_only_fields = fields
+
+    def get_created(self, obj):
+        return json.loads(obj.created)
+
+    def get_skipped(self, obj):
+        return json.loads(obj.skipped)
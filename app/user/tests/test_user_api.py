@@ -1,14 +1,33 @@
+from io import StringIO
+from unittest.mock import patch
+
 from django.test import TestCase
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.urls import reverse
 
 from rest_framework.test import APIClient
 from rest_framework import status
 
+from core.models import (
+    DeletionTask,
+    ExpiringToken,
+    ProvisionTask,
+    Recipe,
+    Tag,
+    UserShard
+)
+from core.provisioning import hash_passwords, provision_users
+
 
 CREATE_USER_URL = reverse('user:create')
 TOKEN_URL = reverse('user:token')
 ME_URL = reverse('user:me')
+BULK_URL = reverse('user:bulk')
+
+
+def bulk_task_url(task_id):
+    return reverse('user:bulk-task', args=[task_id])
 
 
 def create_user(**params):
@@ -145,3 +164,132 @@ class PrivateUserApiTests(TestCase):
         self.assertEqual(self.user.name, payload['name'])
         self.assertTrue(self.user.check_password(payload['password']))
         self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_delete_user_profile(self):
+        """Test deleting user deactivates now and deletes in background"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe = Recipe.objects.create(
+            user=self.user, title='Salad', time_miniutes=5, price=5.00
+        )
+        recipe.tags.add(tag)
+
+        res = self.client.delete(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertTrue(Recipe.objects.filter(user=self.user).exists())
+
+        with self.settings(DELETION_BATCH_SIZE=1):
+            call_command('run_worker', pool='inline', once=True,
+                         stdout=StringIO())
+
+        self.assertFalse(
+            get_user_model().objects.filter(pk=self.user.pk).exists()
+        )
+        self.assertFalse(Recipe.objects.filter(user=self.user.pk).exists())
+        self.assertFalse(Tag.objects.filter(user=self.user.pk).exists())
+        task = DeletionTask.objects.get(pk=res.data['deletion'])
+        self.assertEqual(task.status, DeletionTask.DONE)
+        self.assertEqual(task.deleted, task.total)
+
+
+class BulkProvisionApiTests(TestCase):
+    """Test creating users in bulk"""
+
+    def setUp(self):
+        self.admin = get_user_model().objects.create_superuser(
+            'admin@naveen.com', 'test123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def test_bulk_create_users(self):
+        """Test users are created with hashed passwords, shards and tokens"""
+        create_user(email='taken@naveen.com', password='test123')
+        payload = {
+            'users': [
+                {'email': f'user{n}@naveen.com', 'password': f'secret{n}',
+                 'name': f'User {n}'}
+                for n in range(3)
+            ] + [{'email': 'taken@naveen.com', 'password': 'test123'}],
+            'issue_tokens': True,
+        }
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(res.data['status'], ProvisionTask.PENDING)
+        self.assertFalse(
+            get_user_model().objects.filter(email='user1@naveen.com').exists()
+        )
+        pending = ProvisionTask.objects.get().pending
+        self.assertNotIn('secret1', pending)
+        self.assertIn('pbkdf2_sha256$', pending)
+
+        with self.settings(USER_PROVISION_BATCH_SIZE=2):
+            call_command('run_worker', pool='inline', once=True,
+                         stdout=StringIO())
+
+        res = self.client.get(bulk_task_url(res.data['id']))
+        self.assertEqual(res.data['status'], ProvisionTask.DONE)
+        self.assertEqual(res.data['skipped'], ['taken@naveen.com'])
+        self.assertEqual(len(res.data['created']), 3)
+        self.assertEqual(ProvisionTask.objects.get().pending, '[]')
+        user = get_user_model().objects.get(email='user1@naveen.com')
+        self.assertEqual(user.name, 'User 1')
+        self.assertTrue(user.check_password('secret1'))
+        self.assertTrue(UserShard.objects.filter(user=user).exists())
+        entry = [u for u in res.data['created'] if u['id'] == user.pk][0]
+        self.assertEqual(
+            ExpiringToken.objects.get(user=user).key, entry['token']
+        )
+
+    def test_bulk_task_of_requester_only(self):
+        """Test admins only follow their own provisioning tasks"""
+        task = ProvisionTask.objects.create(total=1)
+
+        res = self.client.get(bulk_task_url(task.pk))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_email_taken_during_provisioning(self):
+        """Test emails taken after the check are skipped, not fatal"""
+        def hash_and_sign_up(passwords, workers=None):
+            create_user(email='late@naveen.com', password='test123')
+            return hash_passwords(passwords, workers)
+
+        rows = [
+            {'email': 'late@naveen.com', 'password': 'secret'},
+            {'email': 'early@naveen.com', 'password': 'secret'},
+        ]
+        with patch('core.provisioning.hash_passwords', hash_and_sign_up):
+            users, skipped, tokens = provision_users(rows)
+
+        self.assertEqual([user.email for user in users], ['early@naveen.com'])
+        self.assertEqual(skipped, ['late@naveen.com'])
+
+    def test_bulk_create_validates_rows(self):
+        """Test invalid rows fail the whole request"""
+        payload = {'users': [
+            {'email': 'user@naveen.com', 'password': 'secret'},
+            {'email': 'not-an-email', 'password': 'pw'},
+        ]}
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(
+            get_user_model().objects.filter(email='user@naveen.com').exists()
+        )
+
+    def test_bulk_create_admin_only(self):
+        """Test users who are not staff cannot create users in bulk"""
+        user = create_user(email='test@naveen.com', password='test123')
+        self.client.force_authenticate(user=user)
+
+        res = self.client.post(BULK_URL, {'users': [
+            {'email': 'user@naveen.com', 'password': 'secret'},
+        ]}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
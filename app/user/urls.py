@@ -6,6 +6,12 @@ app_name = "user"
 
 urlpatterns = [
     path('create/', views.CreateUserView.as_view(), name='create'),
+    path('bulk/', views.BulkCreateUserView.as_view(), name='bulk'),
+    path(
+        'bulk/<int:pk>/',
+        views.ProvisionTaskView.as_view(),
+        name='bulk-task'
+    ),
     path('token/', views.CreateTokenView.as_view(), name='token'),
     path('me/', views.ManageUserView.as_view(), name='me'),
 ]
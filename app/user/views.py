@@ -1,8 +1,21 @@
-from rest_framework import generics, authentication, permissions
+from rest_framework import generics, permissions, status
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
 
-from user.serializers import UserSerializer, AuthTokenSerializer
+from core.authentication import ExpiringTokenAuthentication
+from core.deletion import request_user_deletion
+from core.models import ProvisionTask
+from core.provisioning import request_provisioning
+from core.throttling import IPTokenBucketThrottle, UserTokenBucketThrottle
+from core.tokens import issue
+
+from user.serializers import (
+    AuthTokenSerializer,
+    BulkProvisionSerializer,
+    ProvisionTaskSerializer,
+    UserSerializer
+)
 
 
 class CreateUserView(generics.CreateAPIView):
@@ -14,14 +27,72 @@ class CreateTokenView(ObtainAuthToken):
     """Create a new auth token for user"""
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    parser_classes = api_settings.DEFAULT_PARSER_CLASSES
+    throttle_classes = (IPTokenBucketThrottle,)
+    throttle_scope = 'login'
+
+    def post(self, request, *args, **kwargs):
+        """Return the user's token, issuing a new one once expired"""
+        serializer = self.serializer_class(
+            data=request.data, context={'request': request}
+        )
+        serializer.is_valid(raise_exception=True)
+        token = issue(serializer.validated_data['user'])
+        return Response({'token': token.key, 'expires_at': token.expires_at})
 
 
-class ManageUserView(generics.RetrieveUpdateAPIView):
+class ManageUserView(generics.RetrieveUpdateDestroyAPIView):
     """Manage the authentication user"""
     serializer_class = UserSerializer
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (ExpiringTokenAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
+    throttle_classes = (UserTokenBucketThrottle,)
 
     def get_object(self):
         """Retrive and return authenticated user"""
         return self.request.user
+
+    def destroy(self, request, *args, **kwargs):
+        """Deactivate user and delete their data in the background"""
+        task = request_user_deletion(self.get_object())
+        return Response(
+            {'deletion': task.id},
+            status=status.HTTP_202_ACCEPTED
+        )
+
+
+class BulkCreateUserView(generics.GenericAPIView):
+    """Create many users at once, for admins onboarding organizations
+
+    Passwords are hashed across processes before anything is stored,
+    inserting the users is left to the worker. The response carries the
+    task to follow for the created users and their tokens.
+    """
+    serializer_class = BulkProvisionSerializer
+    authentication_classes = (ExpiringTokenAuthentication,)
+    permission_classes = (permissions.IsAdminUser,)
+    throttle_classes = (UserTokenBucketThrottle,)
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        task = request_provisioning(
+            request.user,
+            serializer.validated_data['users'],
+            issue_tokens=serializer.validated_data['issue_tokens']
+        )
+        return Response(
+            ProvisionTaskSerializer(task).data,
+            status=status.HTTP_202_ACCEPTED
+        )
+
+
+class ProvisionTaskView(generics.RetrieveAPIView):
+    """Return progress and results of a bulk user creation"""
+    serializer_class = ProvisionTaskSerializer
+    authentication_classes = (ExpiringTokenAuthentication,)
+    permission_classes = (permissions.IsAdminUser,)
+    throttle_classes = (UserTokenBucketThrottle,)
+
+    def get_queryset(self):
+        return ProvisionTask.objects.filter(requested_by=self.request.user)